@@ -0,0 +1,166 @@
+import os
+import shutil
+from instrument import span
+
+
+class ConversionUnavailable(RuntimeError):
+    """Raised by UnavailableBackend: the document has to be converted by another process."""
+
+
+class ConverterBackend:
+    """
+    Base class of the converters that turn a document Word can open (.doc) into a .docx file.
+
+    A backend is started once, converts any number of documents and is stopped at the end of the batch.
+    """
+
+    def start(self) -> None:
+        """Start the converter."""
+
+    def convert(self, file_path: str, output_path: str) -> None:
+        """Convert the document at file_path and save it as a .docx file at output_path."""
+        raise NotImplementedError
+
+    def stop(self) -> None:
+        """Stop the converter and release its resources."""
+
+
+class WordBackend(ConverterBackend):
+    """
+    Convert documents by driving Microsoft Word through COM (Windows only).
+
+    COM is initialized for the thread that starts the backend and released when it stops,
+    so start, convert and stop must all be called on the thread that owns the backend.
+    """
+
+    def __init__(self):
+        self.word = None
+
+    def start(self) -> None:
+        import pythoncom
+        import win32com.client as win32
+
+        pythoncom.CoInitialize()
+        try:
+            self.constants = win32.constants
+            self.word = win32.gencache.EnsureDispatch('Word.Application')
+            self.word.Visible = False
+            # wdAlertsNone, so a dialog box cannot block the conversion
+            self.word.DisplayAlerts = 0
+        except Exception:
+            # stop is only called once the backend has started
+            self.word = None
+            pythoncom.CoUninitialize()
+            raise
+
+    def convert(self, file_path: str, output_path: str) -> None:
+        doc = self.word.Documents.Open(file_path, ReadOnly=True, AddToRecentFiles=False)
+        try:
+            doc.SaveAs(output_path, FileFormat=self.constants.wdFormatXMLDocument)
+        finally:
+            doc.Close(False)
+
+    def stop(self) -> None:
+        import pythoncom
+
+        if self.word is not None:
+            try:
+                self.word.Quit()
+            finally:
+                self.word = None
+                pythoncom.CoUninitialize()
+
+
+class FakeBackend(ConverterBackend):
+    """
+    Pure-Python stand-in for Word, to run the conversion orchestration on any platform.
+
+    Converting copies the input file, so the input must already be a .docx file under another name.
+    The files named in fail_on crash the converter the first time they are converted, like Word sometimes does.
+    """
+
+    def __init__(self, fail_on: tuple = ()):
+        self.fail_on = set(fail_on)
+        self.running = False
+        self.starts = 0
+        self.conversions = 0
+
+    def start(self) -> None:
+        self.running = True
+        self.starts += 1
+
+    def convert(self, file_path: str, output_path: str) -> None:
+        if not self.running:
+            raise RuntimeError("The converter is not running")
+        name = os.path.basename(file_path)
+        if name in self.fail_on:
+            self.fail_on.discard(name)
+            self.running = False
+            raise RuntimeError(f"The converter crashed on {name}")
+        shutil.copyfile(file_path, output_path)
+        self.conversions += 1
+
+    def stop(self) -> None:
+        self.running = False
+
+
+class UnavailableBackend(ConverterBackend):
+    """
+    A converter that never converts, for the worker processes of a batch.
+
+    Only the calling process drives Word, so the documents a worker cannot read without it are handed back to that process.
+    """
+
+    def convert(self, file_path: str, output_path: str) -> None:
+        raise ConversionUnavailable(f"{os.path.basename(file_path)} has to be converted by Word")
+
+
+BACKENDS = {
+    "word": WordBackend,
+    "fake": FakeBackend,
+}
+
+
+class ConverterSession:
+    """
+    Keep one converter running for a whole batch instead of launching it for every file.
+
+    The backend is started on the first conversion, so a batch without .doc files never launches it.
+    When a conversion fails the backend is restarted and the file is tried again, up to `retries` times.
+    Use it as a context manager so the backend is stopped at the end of the batch.
+    """
+
+    def __init__(self, backend: ConverterBackend, retries: int = 1):
+        self.backend = backend
+        self.retries = retries
+        self.running = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    @span('convert_to_docx')
+    def convert(self, file_path: str, output_path: str) -> None:
+        """Convert a document with the running backend, restarting it if it fails."""
+        for attempt in range(self.retries + 1):
+            try:
+                if not self.running:
+                    self.backend.start()
+                    self.running = True
+                self.backend.convert(file_path, output_path)
+                return
+            except Exception:
+                self.close()
+                if attempt == self.retries:
+                    raise
+
+    def close(self) -> None:
+        """Stop the backend if it is running."""
+        if self.running:
+            self.running = False
+            try:
+                self.backend.stop()
+            except Exception:
+                pass
@@ -0,0 +1,207 @@
+import os
+import time
+import instrument
+from collections import deque
+from xml.etree.ElementTree import ParseError
+from backends import ConversionUnavailable, ConverterSession, UnavailableBackend, WordBackend
+from chunks import ChunkedRead, large_document, plan_chunks
+from dedup import DuplicateIndex
+from main import QuestionNumbering, format_bank, format_file, parse_bank
+from utils import get_profile
+
+
+def read_file(file_path: str, converter: ConverterSession = None) -> dict:
+    """
+    Read and parse a single document and remove the temporary files created for it.
+
+    Args:
+        file_path (str): The path to the document file.
+        converter (ConverterSession, optional): The session converting .doc files to .docx.
+
+    Returns:
+        dict: The question bank of the document, which does not depend on the selected options:
+        'questions' holds the [question, options, marks] of every question, marks being the mask of the answer formats of each option.
+
+    Raises:
+        ValueError: If the file is not a Word document.
+    """
+    temp_files = []
+    try:
+        lines, marks, _ = format_file(file_path, temp_files, converter)
+    finally:
+        for temp_file in temp_files:
+            if os.path.exists(temp_file):
+                os.remove(temp_file)
+    if lines is None:
+        raise ValueError(f"Not a Word document: {file_path}")
+    return {'questions': parse_bank(lines, marks)}
+
+def timed_read(file_path: str, converter: ConverterSession = None) -> tuple:
+    """Read a document with read_file and return its bank with the seconds it took, measured where it was read."""
+    start = time.perf_counter()
+    bank = read_file(file_path, converter)
+    return bank, time.perf_counter() - start
+
+def pool_read(file_path: str) -> tuple:
+    """
+    Read a document in a worker process, returning what the instrumentation recorded there with the bank and the time.
+
+    Raises ConversionUnavailable for the .doc files that only Word can read, which the calling process reads instead.
+    """
+    bank, seconds = timed_read(file_path, ConverterSession(UnavailableBackend(), retries=0))
+    return bank, seconds, instrument.drain() if instrument.enabled else None
+
+def iter_batch(file_paths: list, selected_options: list, workers: int = None, backend=None, cache=None, progress=None, cancel=None):
+    """
+    Convert several documents into quiz data, reading them in parallel in a process pool, and yield each file as soon as it is done.
+
+    The documents are read and parsed in worker processes, then their questions are formatted in input order in the calling process,
+    so with "Gộp nhiều file thành một" the questions are numbered exactly as in a sequential run: the question number is carried from one file to the next.
+    Only a few documents are read ahead of the one being formatted, and nothing is kept once a file has been yielded,
+    so memory holds a handful of documents however many are converted.
+    A large .docx document is read in chunks by every worker (see chunks.ChunkedRead), then its questions are put back in order,
+    so a single document of thousands of questions does not leave the other workers idle.
+    .doc files are read by the built-in reader like .docx files. The few it does not support (see doc_reader.UnsupportedDocument)
+    are converted in the calling process, since every process would drive the same Word instance,
+    by a single converter session that lasts for the whole batch.
+
+    Args:
+        file_paths (list): The paths to the document files.
+        selected_options (list): A list of selected options for formatting, or their ConversionProfile.
+        workers (int, optional): The number of worker processes, 1 reads every file in the calling process. Defaults to the number of CPUs.
+        backend (ConverterBackend, optional): The converter for .doc files. Defaults to Microsoft Word.
+        cache (BankCache, optional): The cache of parsed question banks. Cached documents are not read again.
+        progress (callable, optional): Called after each file, and every main.PROGRESS_QUESTIONS questions as a file is formatted,
+            with the number of files done, the number of files, the path of the file and the number of questions converted so far.
+        cancel (threading.Event, optional): When it is set, the batch stops before the next file.
+            The temporary files of the files already read have been removed, and the remaining files fail with the error "Cancelled".
+
+    Yields:
+        dict: One dict per file, in input order, with the keys 'file_path', 'data' (the QuizRecord of each question),
+        'warnings' (the questions without an answer, or with several, see format_records),
+        'duplicates' (with "Bỏ câu hỏi trùng lặp", the questions already found in the merged files or the same file, see DuplicateIndex.add),
+        'cached' (whether the bank came from the cache), 'timings' (the seconds spent reading and formatting the document)
+        and 'error' (None, or why the file could not be converted). A failed file does not stop the others.
+    """
+    profile = get_profile(selected_options)
+
+    # Check which documents are cached first, only the others have to be read
+    keys = {}
+    cached = set()
+    if cache is not None:
+        for file_path in file_paths:
+            try:
+                keys[file_path] = cache.key(file_path)
+            except OSError:
+                continue
+            if cache.contains(keys[file_path]):
+                cached.add(file_path)
+
+    parallel = deque(path for path in file_paths if path not in cached)
+    executor = None
+    if workers != 1 and (len(parallel) > 1 or any(large_document(path) for path in parallel)):
+        from concurrent.futures import ProcessPoolExecutor
+
+        executor = ProcessPoolExecutor(max_workers=workers)
+    # The documents read ahead, enough to keep every worker busy
+    read_ahead = 2 * (workers or os.cpu_count() or 1)
+
+    converter = ConverterSession(backend or WordBackend())
+
+    numbering = QuestionNumbering()
+    index = DuplicateIndex(profile) if profile.deduplicate else None
+    done = 0
+    questions = 0
+    futures = {}
+    try:
+        for file_path in file_paths:
+            result = {'file_path': file_path, 'data': [], 'warnings': [], 'duplicates': [], 'cached': False, 'timings': {'read': 0.0, 'format': 0.0}, 'error': None}
+            if cancel is not None and cancel.is_set():
+                result['error'] = "Cancelled"
+            else:
+                while executor and parallel and len(futures) < read_ahead:
+                    path = parallel.popleft()
+                    plan = plan_chunks(path)
+                    futures[path] = ChunkedRead(executor, path, plan) if plan else executor.submit(pool_read, path)
+                try:
+                    # Looked up even when it was not cached, so the miss is counted
+                    bank = cache.get(keys[file_path]) if file_path in keys else None
+                    result['cached'] = bank is not None
+                    if bank is not None:
+                        # Cached by another run since it was checked, its read is not needed
+                        futures.pop(file_path, None)
+                    if bank is None:
+                        if file_path in futures:
+                            future = futures.pop(file_path)
+                            try:
+                                if isinstance(future, ChunkedRead):
+                                    bank, result['timings']['read'] = future.result()
+                                else:
+                                    bank, result['timings']['read'], recorded = future.result()
+                                    if recorded:
+                                        instrument.merge(recorded)
+                            except ConversionUnavailable:
+                                # Only Word can read it, and only this process drives Word
+                                pass
+                            except ParseError:
+                                # A chunk did not split the document where expected, it is read in a single pass
+                                pass
+                        if bank is None:
+                            bank, result['timings']['read'] = timed_read(file_path, converter)
+                        if file_path in keys:
+                            cache.put(keys[file_path], bank)
+
+                    start = time.perf_counter()
+                    parsed = bank['questions']
+                    if not profile.merge:
+                        numbering = QuestionNumbering()
+                        index = DuplicateIndex(profile) if profile.deduplicate else None
+                    if index is not None:
+                        # Duplicates are removed before formatting, so the questions kept are numbered without gaps
+                        parsed = index.filter(parsed, file_path, result['duplicates'])
+                    format_progress = None
+                    if progress is not None:
+                        def format_progress(count: int) -> None:
+                            progress(done, len(file_paths), file_path, questions + count)
+                    result['data'].extend(format_bank(parsed, profile, numbering, result['warnings'], format_progress))
+                    result['timings']['format'] = time.perf_counter() - start
+                except Exception as error:
+                    result['error'] = str(error) or type(error).__name__
+                finally:
+                    futures.pop(file_path, None)
+
+            done += 1
+            questions += len(result['data'])
+            if progress is not None:
+                progress(done, len(file_paths), file_path, questions)
+            yield result
+    finally:
+        converter.close()
+        if executor:
+            executor.shutdown(cancel_futures=True)
+
+def iter_records(results, on_result=None):
+    """
+    Chain the records of the converted files of a batch, one question at a time, for merging them into a single sheet.
+
+    Args:
+        results: The results of iter_batch.
+        on_result (callable, optional): Called with the result of each file, failed ones included, before its records are yielded.
+
+    Yields:
+        QuizRecord: The questions of every converted file, in order.
+    """
+    for result in results:
+        if on_result is not None:
+            on_result(result)
+        if result['error'] is None:
+            yield from result['data']
+
+def convert_batch(file_paths: list, selected_options: list, workers: int = None, backend=None, cache=None, progress=None, cancel=None) -> list:
+    """
+    Convert several documents into quiz data, see iter_batch.
+
+    Returns:
+        list: The result of each file, in input order.
+    """
+    return list(iter_batch(file_paths, selected_options, workers, backend, cache, progress, cancel))
@@ -0,0 +1,207 @@
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import zipfile
+import argparse
+import tempfile
+from xml.sax.saxutils import escape
+from main import format_file, format_questions, load_document, parse_questions
+from utils import ConversionProfile, answer_marks, data_frame
+
+# The stages timed for every bank, in pipeline order
+STAGES = ['read', 'answers', 'parse', 'format', 'export']
+SIZES = [100, 1000, 10000, 50000]
+# Every answer format, so whichever one a question uses is found
+OPTIONS = ["Sửa lỗi định dạng", "Bôi đen", "In nghiêng", "Gạch chân", "Bôi màu"]
+
+# The run properties of each answer format
+ANSWER_PROPERTIES = {
+    'bold': '<w:b/>',
+    'italic': '<w:i/>',
+    'underline': '<w:u w:val="single"/>',
+    'highlight': '<w:highlight w:val="yellow"/>',
+}
+WORDS = ("trong những biện pháp chủ yếu xây dựng nền quốc phòng toàn dân an ninh nhân dân là gì "
+         "kinh tế chính trị văn hóa xã hội lực lượng vũ trang tiềm lực thế trận khoa học công nghệ").split()
+
+CONTENT_TYPES = ('<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+                 '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+                 '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+                 '<Default Extension="xml" ContentType="application/xml"/>'
+                 '<Override PartName="/word/document.xml" ContentType="application/vnd.openxmlformats-officedocument.wordprocessingml.document.main+xml"/>'
+                 '</Types>')
+RELATIONSHIPS = ('<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+                 '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+                 '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" Target="word/document.xml"/>'
+                 '</Relationships>')
+DOCUMENT_START = ('<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+                  '<w:document xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main"><w:body>')
+DOCUMENT_END = '<w:sectPr/></w:body></w:document>'
+
+
+# Helper functions to write the WordprocessingML of the generated bank
+def run(text: str, properties: str = '') -> str:
+    """Return a <w:r> holding the text, with the given run properties."""
+    properties = f'<w:rPr>{properties}</w:rPr>' if properties else ''
+    return f'<w:r>{properties}<w:t xml:space="preserve">{escape(text)}</w:t></w:r>'
+
+def paragraph(*runs: str) -> str:
+    """Return a <w:p> holding the runs."""
+    return f'<w:p>{"".join(runs)}</w:p>'
+
+def sentence(rng: random.Random, low: int, high: int) -> str:
+    """Return random words, between low and high of them."""
+    return ' '.join(rng.choice(WORDS) for _ in range(rng.randint(low, high)))
+
+def question_paragraphs(number: int, rng: random.Random) -> list:
+    """
+    Return the paragraphs of one generated question.
+
+    The stem sometimes spans a second paragraph or a soft return. The four options are one per paragraph,
+    two per paragraph or all on one line separated by tabs. The correct answer is marked with one of the answer formats.
+    """
+    stem = f"Câu {number}: {sentence(rng, 8, 25)}?"
+    paragraphs = []
+    layout = rng.random()
+    if layout < 0.15:
+        paragraphs.append(paragraph(run(stem), '<w:r><w:br/></w:r>', run(sentence(rng, 5, 15))))
+    else:
+        paragraphs.append(paragraph(run(stem)))
+        if layout < 0.3:
+            paragraphs.append(paragraph(run(sentence(rng, 5, 15))))
+
+    answer = rng.randrange(4)
+    answer_format = ANSWER_PROPERTIES[rng.choice(list(ANSWER_PROPERTIES))]
+    options = [run(f"{letter}. {sentence(rng, 1, 8)}", answer_format if index == answer else '') for index, letter in enumerate("ABCD")]
+
+    per_line = rng.choice([1, 1, 2, 4])
+    tab = '<w:r><w:tab/></w:r>'
+    for start in range(0, 4, per_line):
+        paragraphs.append(paragraph(*[part for option in options[start:start + per_line] for part in (option, tab)][:-1]))
+    return paragraphs
+
+def generate_bank(file_path: str, questions: int, seed: int = 0) -> None:
+    """Write a .docx question bank of the given number of questions, the same one for the same seed."""
+    rng = random.Random(seed)
+    with zipfile.ZipFile(file_path, 'w', zipfile.ZIP_DEFLATED) as archive:
+        archive.writestr('[Content_Types].xml', CONTENT_TYPES)
+        archive.writestr('_rels/.rels', RELATIONSHIPS)
+        with archive.open('word/document.xml', 'w') as document:
+            document.write(DOCUMENT_START.encode())
+            for number in range(1, questions + 1):
+                document.write(''.join(question_paragraphs(number, rng)).encode())
+            document.write(DOCUMENT_END.encode())
+
+def time_stages(file_path: str, output_directory: str) -> dict:
+    """Run the pipeline on a bank once and return the seconds spent in each stage."""
+    profile = ConversionProfile(OPTIONS)
+    timings = {}
+
+    start = time.perf_counter()
+    lines, marks, _ = format_file(file_path, [])
+    timings['read'] = time.perf_counter() - start
+
+    # The answer extraction alone, which format_file does while reading
+    paragraphs = [(text_lines, runs) for text_lines, runs in load_document(file_path) if text_lines]
+    start = time.perf_counter()
+    for text_lines, runs in paragraphs:
+        answer_marks(text_lines, runs)
+    timings['answers'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    questions = list(parse_questions(lines, marks))
+    timings['parse'] = time.perf_counter() - start
+
+    data = []
+    start = time.perf_counter()
+    format_questions(questions, data, profile, 1, [])
+    timings['format'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    data_frame(data, file_path, "Quizizz", profile, open_file=False, output_directory=output_directory)
+    timings['export'] = time.perf_counter() - start
+    return timings
+
+def benchmark(sizes: list, repeat: int, work_directory: str) -> dict:
+    """Time every stage on a generated bank of each size, keeping the fastest of `repeat` runs."""
+    # A first, untimed run loads the modules the pipeline imports on first use
+    warm_up = os.path.join(work_directory, "warm_up.docx")
+    generate_bank(warm_up, 10)
+    time_stages(warm_up, work_directory)
+
+    results = {}
+    for size in sizes:
+        file_path = os.path.join(work_directory, f"bank_{size}.docx")
+        generate_bank(file_path, size)
+        best = {}
+        for _ in range(repeat):
+            for stage, seconds in time_stages(file_path, work_directory).items():
+                best[stage] = min(seconds, best.get(stage, seconds))
+        results[str(size)] = best
+    return results
+
+def compare(results: dict, baseline: dict, threshold: float, slack: float) -> list:
+    """Return the (size, stage, seconds, baseline seconds) of the stages slower than their baseline by more than the threshold."""
+    regressions = []
+    for size, timings in results.items():
+        for stage, seconds in timings.items():
+            base = baseline.get(size, {}).get(stage)
+            if base is not None and seconds > base * (1 + threshold) and seconds - base > slack:
+                regressions.append((size, stage, seconds, base))
+    return regressions
+
+def main(argv: list = None) -> int:
+    """
+    Run the benchmark, print a table of the stages and return 1 when a stage regressed past the threshold,
+    or 2 when there is no baseline to compare a size with.
+    """
+    parser = argparse.ArgumentParser(description="Time each stage of the conversion on generated question banks.")
+    parser.add_argument('--sizes', type=int, nargs='+', default=SIZES, help="the numbers of questions of the banks (default: 100 1000 10000 50000)")
+    parser.add_argument('--repeat', type=int, default=3, help="the number of runs per bank, the fastest one is kept (default: 3)")
+    parser.add_argument('--baseline', default='bench_baseline.json', help="the file of the baseline timings (default: bench_baseline.json)")
+    parser.add_argument('--save', action='store_true', help="save the timings as the new baseline instead of comparing them")
+    parser.add_argument('--threshold', type=float, default=0.25, help="the allowed slowdown, as a fraction of the baseline (default: 0.25)")
+    parser.add_argument('--slack', type=float, default=0.005, help="slowdowns smaller than this many seconds are ignored (default: 0.005)")
+    arguments = parser.parse_args(argv)
+    if not arguments.save and not os.path.exists(arguments.baseline):
+        # Without a baseline nothing can regress, so the check would always pass
+        print(f"No baseline at {arguments.baseline}: run `python bench.py --save` on this machine first", file=sys.stderr)
+        return 2
+
+    work_directory = tempfile.mkdtemp(prefix='wteBench')
+    try:
+        results = benchmark(arguments.sizes, arguments.repeat, work_directory)
+    finally:
+        shutil.rmtree(work_directory, ignore_errors=True)
+
+    baseline = {}
+    if not arguments.save:
+        with open(arguments.baseline, 'r', encoding='utf-8') as file:
+            baseline = json.load(file)
+
+    print(f"{'questions':>9}  {'stage':<8}{'seconds':>10}{'µs/question':>13}{'baseline':>10}")
+    for size, timings in results.items():
+        for stage in STAGES:
+            base = baseline.get(size, {}).get(stage)
+            base = f"{base:10.4f}" if base is not None else f"{'-':>10}"
+            print(f"{size:>9}  {stage:<8}{timings[stage]:10.4f}{timings[stage] / int(size) * 1e6:13.1f}{base}")
+
+    if arguments.save:
+        with open(arguments.baseline, 'w', encoding='utf-8') as file:
+            json.dump(results, file, indent=2)
+        print(f"Baseline saved to {arguments.baseline}")
+        return 0
+
+    regressions = compare(results, baseline, arguments.threshold, arguments.slack)
+    for size, stage, seconds, base in regressions:
+        print(f"Regression: {stage} on {size} questions took {seconds:.4f} s, {seconds / base - 1:.0%} over the baseline of {base:.4f} s")
+    missing = [size for size in results if size not in baseline]
+    if missing:
+        print(f"No baseline for {', '.join(missing)} questions: run `python bench.py --save` with these sizes", file=sys.stderr)
+    return 1 if regressions else 2 if missing else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
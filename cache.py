@@ -0,0 +1,127 @@
+import os
+import json
+import hashlib
+from collections import OrderedDict
+
+# Bump whenever a change to reading or parsing documents changes what ends up in the cache
+PARSER_VERSION = 3
+
+
+def default_cache_directory() -> str:
+    """Return the per-user directory the parsed question banks are cached in."""
+    base = os.environ.get('LOCALAPPDATA') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(base, 'WordToExcel', 'cache')
+
+
+class BankCache:
+    """
+    On-disk cache of parsed question banks, keyed by the content of the document and the parser version.
+
+    The cached bank is what was read before any option was applied (see batch.read_file),
+    so one entry serves every combination of options and platforms.
+    When the cache grows past max_bytes, the least recently used entries are removed.
+    """
+
+    def __init__(self, directory: str = None, max_bytes: int = 200 * 1024 * 1024):
+        self.directory = directory or default_cache_directory()
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        os.makedirs(self.directory, exist_ok=True)
+
+    def key(self, file_path: str) -> str:
+        """Return the cache key of a document: the hash of its content and of the parser version."""
+        digest = hashlib.sha256(f"{PARSER_VERSION}\0".encode())
+        with open(file_path, 'rb') as file:
+            for chunk in iter(lambda: file.read(1024 * 1024), b''):
+                digest.update(chunk)
+        return digest.hexdigest()
+
+    def contains(self, key: str) -> bool:
+        """Return whether a key is cached, without reading its bank. Only get counts the hits and misses, so a lookup is counted once."""
+        return os.path.exists(os.path.join(self.directory, f"{key}.json"))
+
+    def get(self, key: str) -> dict:
+        """Return the cached bank of a key, or None if it is not cached, counting a hit or a miss."""
+        path = os.path.join(self.directory, f"{key}.json")
+        try:
+            with open(path, 'r', encoding='utf-8') as file:
+                bank = json.load(file)
+        except (OSError, ValueError):
+            self.misses += 1
+            return None
+        # The modification time records the last use, for the LRU eviction
+        os.utime(path)
+        self.hits += 1
+        return bank
+
+    def put(self, key: str, bank: dict) -> None:
+        """Store the bank of a key and evict the least recently used entries if the cache is too large."""
+        path = os.path.join(self.directory, f"{key}.json")
+        temp_path = f"{path}.{os.getpid()}.tmp"
+        with open(temp_path, 'w', encoding='utf-8') as file:
+            json.dump(bank, file, ensure_ascii=False)
+        os.replace(temp_path, path)
+        self.evict()
+
+    def evict(self) -> None:
+        """Remove the least recently used entries until the cache fits in max_bytes."""
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith('.json'):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+            self.evictions += 1
+
+    def summary(self) -> str:
+        """Return the hit/miss statistics of the run."""
+        return f"Cache: {self.hits} hits, {self.misses} misses, {self.evictions} evicted"
+
+
+class WarmBankCache(BankCache):
+    """
+    A BankCache that also keeps the most recently used banks in memory, for a process that converts many documents over time.
+
+    A bank found in memory is neither read from disk nor marked as used there, so entries only used from memory
+    may be evicted from the disk first; they are read from the document again once they leave memory too.
+    """
+
+    def __init__(self, directory: str = None, max_bytes: int = 200 * 1024 * 1024, max_entries: int = 64):
+        super().__init__(directory, max_bytes)
+        self.max_entries = max_entries
+        self.memory = OrderedDict()
+
+    def remember(self, key: str, bank: dict) -> None:
+        """Keep a bank in memory, forgetting the least recently used one past max_entries."""
+        self.memory[key] = bank
+        self.memory.move_to_end(key)
+        if len(self.memory) > self.max_entries:
+            self.memory.popitem(last=False)
+
+    def contains(self, key: str) -> bool:
+        return key in self.memory or super().contains(key)
+
+    def get(self, key: str) -> dict:
+        bank = self.memory.get(key)
+        if bank is not None:
+            self.memory.move_to_end(key)
+            self.hits += 1
+            return bank
+        bank = super().get(key)
+        if bank is not None:
+            self.remember(key, bank)
+        return bank
+
+    def put(self, key: str, bank: dict) -> None:
+        super().put(key, bank)
+        self.remember(key, bank)
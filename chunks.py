@@ -0,0 +1,248 @@
+import io
+import os
+import time
+import zipfile
+import instrument
+from main import extract_original_format, parse_bank
+from reader import iter_document, level_marker, read_archive_headings, read_archive_numbering
+from utils import is_question
+
+# The size of word/document.xml read by each worker; a document at least twice as large is read in chunks
+CHUNK_BYTES = 1 << 20
+WORD_NAMESPACE = b'xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main"'
+BODY_START = b'<w:body>'
+BODY_END = b'</w:body>'
+# Elements whose paragraphs are not at the top level of the body, so a chunk cannot start inside them
+CONTAINERS = (b'w:tbl', b'w:sdt', b'w:customXml', b'w:txbxContent')
+# A question starts at a line only if the line two back is not a question too, see parse_questions;
+# the two lines before the first question of a chunk are parsed with it so the rule is applied as in a single pass
+CONTEXT = 2
+
+
+class RecordingCounters(dict):
+    """List counters that record the (list, level) of every numbered paragraph, so they can be replayed once the counters before a chunk are known."""
+
+    def __init__(self, counters: dict = None):
+        super().__init__(counters or {})
+        self.events = []
+
+    def __setitem__(self, key, value):
+        # level_marker sets the counter of a level exactly once per numbered paragraph
+        self.events.append(key)
+        super().__setitem__(key, value)
+
+# Helper function
+def container_depth(data: bytes, start: int, end: int) -> int:
+    """Return how many more container elements (see CONTAINERS) are opened than closed in data[start:end]."""
+    depth = 0
+    for name in CONTAINERS:
+        depth += data.count(b'<' + name + b'>', start, end) + data.count(b'<' + name + b' ', start, end)
+        depth -= data.count(b'</' + name + b'>', start, end)
+    return depth
+
+def split_body(data: bytes, chunk_bytes: int = CHUNK_BYTES) -> list:
+    """
+    Split the XML of a document into chunks of about chunk_bytes that can each be parsed on their own.
+
+    Every chunk starts at a paragraph at the top level of the body, outside tables, content controls and text boxes,
+    and is wrapped in the root and body elements of the document, so iter_document reads it as a document.
+
+    Returns:
+    - list: The chunks, or None if the XML is not laid out as Word writes it (another namespace prefix, no body).
+    """
+    body = data.find(BODY_START)
+    end = data.rfind(BODY_END)
+    if body < 0 or end < body or WORD_NAMESPACE not in data[:body]:
+        return None
+    start = body + len(BODY_START)
+    prefix, suffix = data[:start], data[end:]
+
+    bounds = [start]
+    # The containers left open at `scanned`, counted incrementally
+    scanned, depth = start, 0
+    target = start + chunk_bytes
+    while target < end - chunk_bytes // 2:
+        position = data.find(b'<w:p', target, end)
+        while position >= 0:
+            if data[position + 4:position + 5] in (b'>', b' '):
+                depth += container_depth(data, scanned, position)
+                scanned = position
+                if depth == 0:
+                    break
+            position = data.find(b'<w:p', position + 4, end)
+        if position < 0:
+            break
+        bounds.append(position)
+        target = position + chunk_bytes
+    bounds.append(end)
+    return [prefix + data[first:last] + suffix for first, last in zip(bounds, bounds[1:])]
+
+def large_document(file_path: str, chunk_bytes: int = CHUNK_BYTES) -> bool:
+    """Tell whether a document is a .docx file large enough to be read in chunks."""
+    if os.path.splitext(file_path)[1] != ".docx":
+        return False
+    try:
+        with zipfile.ZipFile(file_path) as archive:
+            return archive.getinfo('word/document.xml').file_size >= 2 * chunk_bytes
+    except (OSError, KeyError, zipfile.BadZipFile):
+        # Left to the usual reader, which reports the error
+        return False
+
+def plan_chunks(file_path: str, chunk_bytes: int = CHUNK_BYTES) -> tuple:
+    """
+    Prepare a large .docx document to be read in chunks by several processes.
+
+    Returns:
+    - tuple: The list levels of the document (see read_numbering), its heading styles (see read_heading_styles)
+      and its chunks (see split_body), or None if the document is not a .docx file at least two chunks long.
+    """
+    if not large_document(file_path, chunk_bytes):
+        return None
+    try:
+        with zipfile.ZipFile(file_path) as archive:
+            numbering = read_archive_numbering(archive)
+            headings = read_archive_headings(archive)
+            chunks = split_body(archive.read('word/document.xml'), chunk_bytes)
+    except (OSError, KeyError, zipfile.BadZipFile):
+        # Left to the usual reader, which reports the error
+        return None
+    if not chunks or len(chunks) < 2:
+        return None
+    return numbering, headings, chunks
+
+# Helper function
+def line_range(lines: list, marks: dict, start: int, end: int = None) -> tuple:
+    """Return the lines from start to end with their marks, indexed from the first of them."""
+    end = len(lines) if end is None else end
+    return lines[start:end], {index - start: mark for index, mark in marks.items() if start <= index < end}
+
+def read_chunk(chunk: bytes, numbering: dict, headings: frozenset, counters: dict = None) -> dict:
+    """
+    Read a chunk of a document and parse the questions that lie entirely within it.
+
+    The lines before the first question that starts in the chunk (the head) may belong to a question of the previous chunk,
+    and the last question (the tail) may go on in the next chunk: both are returned as lines, to be parsed once the chunks are put together.
+
+    Parameters:
+    - chunk: A chunk of the document, see split_body.
+    - numbering: The list levels of the document.
+    - headings: The heading styles of the document.
+    - counters: The list counters at the start of the chunk, when they are known.
+
+    Returns:
+    - dict: The 'head' and 'tail' (lines and marks; no tail when no question starts in the chunk), whether the first line of the tail
+      is context to skip ('skip'), the 'questions' in between, the (list, level) of the numbered paragraphs ('events')
+      and the 'seconds' it took, measured where it was read.
+    """
+    start = time.perf_counter()
+    counters = RecordingCounters(counters)
+    lines, marks = extract_original_format(iter_document(io.BytesIO(chunk), numbering, counters, headings))
+
+    questions = [is_question(text.strip()) is not None for text in lines]
+    # Lines where parse_questions would start a question whatever came before the chunk
+    starts = [index for index in range(CONTEXT, len(lines)) if questions[index] and not questions[index - 2]]
+    result = {'events': counters.events, 'questions': [], 'tail': None, 'skip': False}
+    if not starts:
+        result['head'] = (lines, marks)
+    else:
+        first, last = starts[0], starts[-1]
+        result['head'] = line_range(lines, marks, 0, first)
+        # The context lines only give the parser its lookback; a question they start is not one of the chunk
+        body_lines, body_marks = line_range(lines, marks, first - CONTEXT, last)
+        result['questions'] = parse_bank(body_lines, body_marks, skip=questions[first - 1])
+        result['tail'] = line_range(lines, marks, last - CONTEXT)
+        result['skip'] = questions[last - 1]
+    result['seconds'] = time.perf_counter() - start
+    return result
+
+def pool_read_chunk(chunk: bytes, numbering: dict, headings: frozenset, counters: dict = None) -> tuple:
+    """Read a chunk in a worker process, returning what the instrumentation recorded there with the result of read_chunk."""
+    result = read_chunk(chunk, numbering, headings, counters)
+    return result, instrument.drain() if instrument.enabled else None
+
+# Helper function
+def join_lines(lines: list, marks: dict, other: tuple) -> None:
+    """Add the lines of the next chunk and their marks to lines and marks, with the blank line that separates two paragraphs."""
+    other_lines, other_marks = other
+    if not other_lines:
+        return
+    if lines:
+        lines.append('')
+    offset = len(lines)
+    marks.update((index + offset, mark) for index, mark in other_marks.items())
+    lines.extend(other_lines)
+
+def stitch(results: list) -> list:
+    """
+    Put the questions of the chunks of a document back together, in the order and with the content of a single pass.
+
+    Parameters:
+    - results: The result of read_chunk for every chunk, in order.
+
+    Returns:
+    - list: The [question, options, marks] of every question of the document, as read_file returns them.
+    """
+    questions = []
+    # The lines not parsed yet: the tail of a chunk and the heads of the chunks after it
+    lines, marks, skip = [], {}, False
+    for result in results:
+        join_lines(lines, marks, result['head'])
+        if result['tail'] is None:
+            continue
+        questions.extend(parse_bank(lines, marks, skip))
+        questions.extend(result['questions'])
+        lines, marks = [], {}
+        join_lines(lines, marks, result['tail'])
+        skip = result['skip']
+    questions.extend(parse_bank(lines, marks, skip))
+    return questions
+
+class ChunkedRead:
+    """
+    A large .docx document read in chunks by a process pool, see plan_chunks.
+
+    Each chunk is first read with empty list counters. Once every chunk is read, the counters at the start of each one
+    are found by replaying the numbered paragraphs of the chunks before it. The chunks whose list markers depend on them
+    (lists going on from an earlier chunk) are read again with the right counters, so the lines are the same as in a single pass.
+    """
+
+    def __init__(self, executor, file_path: str, plan: tuple):
+        self.executor = executor
+        self.file_path = file_path
+        self.numbering, self.headings, self.chunks = plan
+        self.futures = [executor.submit(pool_read_chunk, chunk, self.numbering, self.headings) for chunk in self.chunks]
+
+    def gather(self, futures: list) -> list:
+        """Wait for the chunks and merge what the instrumentation recorded in the workers."""
+        results = []
+        for future in futures:
+            result, recorded = future.result()
+            if recorded:
+                instrument.merge(recorded)
+            results.append(result)
+        return results
+
+    def result(self) -> tuple:
+        """
+        Return the question bank of the document and the seconds spent reading it, as read_file and timed_read would.
+
+        Raises:
+        - ParseError: If a chunk is not well-formed XML, in which case the document is read in a single pass instead.
+        """
+        start = time.perf_counter()
+        results = self.gather(self.futures)
+
+        counters = {}
+        again = {}
+        for index, result in enumerate(results):
+            lists = {key[0] for key in result['events']}
+            if any(key[0] in lists for key in counters):
+                again[index] = self.executor.submit(pool_read_chunk, self.chunks[index], self.numbering, self.headings, dict(counters))
+            for num_id, ilvl in result['events']:
+                level_marker(num_id, ilvl, self.numbering, counters)
+        for index, result in zip(again, self.gather(list(again.values()))):
+            results[index] = result
+
+        bank = {'questions': stitch(results)}
+        seconds = sum(result['seconds'] for result in results) + time.perf_counter() - start
+        return bank, seconds
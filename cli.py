@@ -0,0 +1,247 @@
+import os
+import sys
+import glob
+import json
+import time
+import argparse
+import instrument
+from multiprocessing import freeze_support
+from itertools import chain
+from batch import iter_batch, iter_records
+from cache import BankCache
+from dedup import save_report
+from export import PLATFORM_COLUMNS, WRITERS
+from utils import ANSWER_FORMATS, FORMAT_OPTIONS, LETTERED_OPTIONS, ConversionProfile, save_sheets
+from variants import new_seed, save_variants
+from watch import FolderWatcher
+
+# Command line flags of the formatting options
+OPTION_FLAGS = dict(zip(['remove_label', 'add_label', 'fix_formatting', 'strip_letters', 'shuffle', 'merge', 'dedup'], FORMAT_OPTIONS))
+# Values of --answer-format and the answer formats they select
+ANSWER_FLAGS = dict(zip(['bold', 'italic', 'underline', 'highlight'], ANSWER_FORMATS))
+ANSWER_FLAGS['letters'] = LETTERED_OPTIONS
+
+WORD_EXTENSIONS = ('.doc', '.docx')
+
+
+def expand_paths(paths: list) -> list:
+    """
+    Turn files, directories and glob patterns into the list of Word documents to convert.
+
+    Directories are searched recursively. The documents are listed once each, in the order they are first found,
+    and Word's lock files (~$name.docx) are skipped.
+    """
+    documents = []
+    seen = set()
+    for path in paths:
+        if os.path.isdir(path):
+            matches = sorted(glob.glob(os.path.join(glob.escape(path), '**', '*'), recursive=True))
+        elif os.path.exists(path):
+            matches = [path]
+        else:
+            matches = sorted(glob.glob(path, recursive=True))
+        for match in matches:
+            name = os.path.basename(match)
+            if not os.path.isfile(match) or name.startswith('~$') or os.path.splitext(name)[1].lower() not in WORD_EXTENSIONS:
+                continue
+            key = os.path.normcase(os.path.abspath(match))
+            if key not in seen:
+                seen.add(key)
+                documents.append(match)
+    return documents
+
+def parse_arguments(argv: list = None) -> argparse.Namespace:
+    """Parse the command line."""
+    parser = argparse.ArgumentParser(
+        prog='python -m cli',
+        description="Convert Word documents into quiz sheets for Quizizz, Kahoot or Blooket, without the GUI.",
+    )
+    parser.add_argument('paths', nargs='+', help="Word documents, directories (searched recursively) or glob patterns")
+    parser.add_argument('-p', '--platform', action='append', choices=list(PLATFORM_COLUMNS),
+                        help="the platform the sheets are for, can be given several times to save the sheets of every platform "
+                             "from a single conversion, each in a directory named after it (default: Quizizz)")
+    parser.add_argument('-o', '--output', default="Output", help="the directory the sheets are saved in (default: Output)")
+    parser.add_argument('--format', choices=[extension[1:] for extension in WRITERS], default='xlsx', help="the type of the sheets (default: xlsx)")
+    parser.add_argument('--report', help="write the JSON run report to this file instead of the standard output")
+
+    label = parser.add_mutually_exclusive_group()
+    label.add_argument('--remove-label', action='store_true', help=OPTION_FLAGS['remove_label'])
+    label.add_argument('--add-label', action='store_true', help=OPTION_FLAGS['add_label'])
+    parser.add_argument('--fix-formatting', action=argparse.BooleanOptionalAction, default=True, help=f"{OPTION_FLAGS['fix_formatting']} (default: on)")
+    parser.add_argument('--strip-letters', action='store_true', help=f"{OPTION_FLAGS['strip_letters']}, with --answer-format letters")
+    parser.add_argument('--shuffle', action='store_true', help=OPTION_FLAGS['shuffle'])
+    parser.add_argument('--merge', action='store_true', help=f"{OPTION_FLAGS['merge']}, saved as Merged_File")
+    parser.add_argument('--dedup', action='store_true', help=f"{OPTION_FLAGS['dedup']}: remove the exact duplicates and report them with the near duplicates and the conflicting answers in <sheet>.duplicates.csv (not with --watch)")
+    parser.add_argument('--variants', type=int, default=0, metavar='K',
+                        help="save K variants of each sheet, with the questions and the options of each question shuffled (not with --watch)")
+    parser.add_argument('--seed', type=int, help="with --variants, the seed the variants are drawn from, reported so they can be made again (default: random)")
+    parser.add_argument('-a', '--answer-format', action='append', choices=list(ANSWER_FLAGS),
+                        help="how the correct answers are marked, can be given several times (default: bold)")
+
+    parser.add_argument('-j', '--workers', type=int, help="the number of worker processes (default: the number of CPUs)")
+    parser.add_argument('--no-cache', action='store_true', help="do not use the cache of parsed documents")
+    parser.add_argument('--cache-dir', help="the directory of the cache of parsed documents")
+    parser.add_argument('--profile', action='store_true', help=f"save the time, calls and peak memory of each stage next to the sheets (same as {instrument.ENVIRONMENT_VARIABLE}=1)")
+    parser.add_argument('--cprofile', action='store_true', help="with --profile, also save a cProfile of the run")
+    parser.add_argument('--watch', action='store_true', help="keep watching the directory given as path and convert the documents again as they change")
+    parser.add_argument('--interval', type=float, default=2.0, help="with --watch, the seconds between two checks of the directory (default: 2)")
+    arguments = parser.parse_args(argv)
+    # The watcher saves one sheet per document and platform, it neither removes duplicates nor draws variants
+    if arguments.watch and arguments.dedup:
+        parser.error("argument --dedup: not allowed with argument --watch")
+    if arguments.watch and arguments.variants:
+        parser.error("argument --variants: not allowed with argument --watch")
+    return arguments
+
+def selected_options(arguments: argparse.Namespace) -> list:
+    """Return the option names, as the GUI passes them, selected by the command line flags."""
+    options = [name for flag, name in OPTION_FLAGS.items() if getattr(arguments, flag)]
+    options.extend(ANSWER_FLAGS[flag] for flag in arguments.answer_format or ['bold'])
+    return options
+
+def selected_platforms(arguments: argparse.Namespace) -> list:
+    """Return the platforms selected on the command line, each once, in the order given."""
+    return list(dict.fromkeys(arguments.platform or ["Quizizz"]))
+
+def first_output(outputs) -> str:
+    """Return the sheet of a platform, or the sheet of the first variant when variants were saved."""
+    return outputs[0] if isinstance(outputs, list) else outputs
+
+def run(arguments: argparse.Namespace) -> dict:
+    """
+    Convert the documents selected on the command line and save their sheets.
+
+    Returns:
+    - dict: The run report, with the selected platforms and options, one entry per document
+      (output file of the first platform, output files of every platform, or their lists with --variants,
+      question count, answer warnings, duplicates, error and the seconds spent in each stage),
+      the duplicate reports, the seed of the variants, the cache statistics, the total time and the files of the profile, when one is recorded.
+    """
+    start = time.perf_counter()
+    if arguments.profile or arguments.cprofile:
+        instrument.enable(with_cprofile=arguments.cprofile)
+    instrument.reset()
+    profiler = instrument.start_cprofile()
+
+    file_paths = expand_paths(arguments.paths)
+    profile = ConversionProfile(selected_options(arguments))
+    platforms = selected_platforms(arguments)
+    extension = f'.{arguments.format}'
+    cache = None if arguments.no_cache else BankCache(arguments.cache_dir)
+    seed = (new_seed() if arguments.seed is None else arguments.seed) if arguments.variants > 0 else None
+
+    def save(records, file_path: str) -> dict:
+        # The sheets of every platform, or of every variant; the first sheets stand for all of them in the report
+        if seed is None:
+            return save_sheets(records, file_path, platforms, profile, open_file=False, extension=extension, output_directory=arguments.output)
+        variants = save_variants(list(records), file_path, platforms, profile, arguments.variants, seed,
+                                 open_file=False, extension=extension, output_directory=arguments.output)
+        return {platform: [outputs[platform] for outputs in variants] for platform in platforms}
+
+    results = iter_batch(file_paths, profile, workers=arguments.workers, cache=cache)
+
+    files = []
+
+    def add_entry(result: dict) -> None:
+        files.append({
+            'file': result['file_path'],
+            'output': None,
+            'outputs': {},
+            'questions': len(result['data']),
+            'warnings': result['warnings'],
+            'duplicates': len(result['duplicates']),
+            'cached': result['cached'],
+            'error': result['error'],
+            'timings': dict(result['timings'], export=0.0),
+        })
+
+    report = {
+        'platforms': platforms,
+        'options': profile.selected_options,
+        'files': files,
+        'merged_output': None,
+        'merged_outputs': {},
+        'duplicate_reports': [],
+        'seed': seed,
+    }
+    if not profile.merge:
+        # Save each file as soon as it is converted
+        for result in results:
+            add_entry(result)
+            if result['error'] is None:
+                export_start = time.perf_counter()
+                outputs = files[-1]['outputs'] = save(result['data'], result['file_path'])
+                files[-1]['output'] = first_output(outputs[platforms[0]])
+                files[-1]['timings']['export'] = time.perf_counter() - export_start
+                if result['duplicates']:
+                    report['duplicate_reports'].append(save_report(result['duplicates'], files[-1]['output']))
+    else:
+        # The questions are written to the merged sheet as the files are converted
+        merge_start = time.perf_counter()
+        duplicates = []
+
+        def add_merged(result: dict) -> None:
+            add_entry(result)
+            duplicates.extend(result['duplicates'])
+
+        records = iter_records(results, add_merged)
+        first = next(records, None)
+        if first is not None:
+            outputs = report['merged_outputs'] = save(chain([first], records), "Merged_File")
+            report['merged_output'] = first_output(outputs[platforms[0]])
+            if duplicates:
+                report['duplicate_reports'].append(save_report(duplicates, report['merged_output']))
+        # Reading, formatting and writing overlap, so they are timed together
+        report['merged_seconds'] = time.perf_counter() - merge_start
+    if cache is not None:
+        report['cache'] = {'hits': cache.hits, 'misses': cache.misses, 'evictions': cache.evictions}
+    report['total'] = time.perf_counter() - start
+
+    if instrument.enabled:
+        # Named after the sheet, or after the run when no sheet was saved
+        outputs = [report['merged_output']] + [entry['output'] for entry in files]
+        output_path = next((path for path in outputs if path), os.path.join(arguments.output, "WordToExcel"))
+        os.makedirs(os.path.dirname(output_path) or '.', exist_ok=True)
+        report['profile'] = instrument.dump(output_path, profiler)
+    return report
+
+def watch(arguments: argparse.Namespace) -> int:
+    """Watch a directory until interrupted, printing the summary of each update as a line of JSON."""
+    if len(arguments.paths) != 1 or not os.path.isdir(arguments.paths[0]):
+        print("--watch takes a single directory", file=sys.stderr)
+        return 2
+    # The watcher keeps the banks of the unchanged documents in the cache, so it is used even with --no-cache
+    watcher = FolderWatcher(arguments.paths[0], selected_platforms(arguments), ConversionProfile(selected_options(arguments)),
+                            output_directory=arguments.output, extension=f'.{arguments.format}', cache=BankCache(arguments.cache_dir))
+
+    def report(summary: dict) -> None:
+        print(json.dumps(summary, ensure_ascii=False), flush=True)
+
+    try:
+        watcher.watch(arguments.interval, callback=report)
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+def main(argv: list = None) -> int:
+    """Run the command line and return the exit status: 0 if every document was converted, 1 otherwise."""
+    arguments = parse_arguments(argv)
+    if arguments.watch:
+        return watch(arguments)
+    report = run(arguments)
+
+    if arguments.report:
+        with open(arguments.report, 'w', encoding='utf-8') as file:
+            json.dump(report, file, ensure_ascii=False, indent=2)
+    else:
+        json.dump(report, sys.stdout, ensure_ascii=False, indent=2)
+        sys.stdout.write('\n')
+
+    if not report['files']:
+        return 1
+    return 0 if all(entry['error'] is None for entry in report['files']) else 1
+
+# Worker processes of the batch conversion import this module too
+if __name__ == "__main__":
+    freeze_support()
+    sys.exit(main())
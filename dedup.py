@@ -0,0 +1,200 @@
+import os
+import re
+import zlib
+import hashlib
+import unicodedata
+from array import array
+from export import write_csv
+from instrument import span
+from utils import get_correct_answer
+
+STEM_LABEL_PATTERN = re.compile(r'^\s*(?:câu\s*\d+\s*[\.:)]?|\d+\s*[\.:)])\s*')
+OPTION_LABEL_PATTERN = re.compile(r'\n\s*[a-d]\s*[\.:)]\s*')
+PUNCTUATION_PATTERN = re.compile(r'[^\w\s]+')
+
+# Questions at least this similar (Jaccard similarity of their word pairs) are reported as near duplicates
+SIMILARITY = 0.8
+# MinHash bins of a question, compared by bands of ROWS bins: two questions sharing a band are compared.
+# 5 bands of 3 bins find 97% of the pairs 0.8 similar, with 5 index entries per question
+BINS = 16
+ROWS = 3
+# The bits of a 32-bit shingle hash left once the bin is taken from its top bits
+VALUE_BITS = 32 - (BINS - 1).bit_length()
+VALUE_MASK = (1 << VALUE_BITS) - 1
+# Questions sharing a band with many others (e.g. generic stems) are only compared with the first ones found
+MAX_CANDIDATES = 32
+
+REPORT_COLUMNS = ("File", "Question", "Duplicate of (file)", "Duplicate of (question)", "Similarity", "Same answer", "Removed", "Conflict")
+
+
+# Helper function to compare questions whatever their numbering, case, spacing or Unicode normalization
+def normalize(current_question: str, current_options: list) -> tuple:
+    """
+    Return the question and its options as they are compared: in NFC, case-folded, without their labels ("Câu 3.", "A.")
+    and punctuation, each on a single line.
+
+    Word stores Vietnamese letters either precomposed or as a letter followed by combining marks; NFC makes both the same.
+    The marks themselves are kept, since they tell words apart ("ma", "mà", "mã").
+    The whole question is normalized at once, which is several times faster than line by line.
+    """
+    text = '\n'.join([current_question.replace('\n', ' '), *(option.replace('\n', ' ') for option in current_options)])
+    text = STEM_LABEL_PATTERN.sub('', unicodedata.normalize('NFC', text).casefold(), 1)
+    text = PUNCTUATION_PATTERN.sub(' ', OPTION_LABEL_PATTERN.sub('\n', text))
+    stem, *options = [' '.join(line.split()) for line in text.split('\n')]
+    return stem, options
+
+def shingles(stem: str, options: list) -> set:
+    """Return the hashes of the consecutive word pairs of the stem (its words when it has only one) and of each option."""
+    words = stem.split()
+    parts = [f"{first} {second}" for first, second in zip(words, words[1:])] or words
+    parts.extend(options)
+    return {zlib.crc32(part.encode()) for part in parts}
+
+def signature(hashes: set) -> list:
+    """
+    Return the MinHash signature of a set of shingle hashes, with one-permutation hashing.
+
+    The top bits of a hash pick one of BINS bins, which keeps its smallest value: a single pass instead of one per hash function.
+    An empty bin takes the value of the next non-empty one, offset by the distance, so short questions still fill every band.
+    """
+    # Sorted, the hashes of a bin are in increasing order of their value, so the last one written is the smallest
+    bins = {value >> VALUE_BITS: value & VALUE_MASK for value in sorted(hashes, reverse=True)}
+    values = [bins.get(index) for index in range(BINS)]
+    if len(bins) < BINS:
+        # Walk the bins backwards, carrying the last non-empty one, which wraps around to the first
+        first = min(bins)
+        carry, position = bins[first], first + BINS
+        for index in range(BINS - 1, -1, -1):
+            value = values[index]
+            if value is None:
+                values[index] = carry + ((position - index) << VALUE_BITS)
+            else:
+                carry, position = value, index
+    return values
+
+def similarity(hashes: set, other: array) -> float:
+    """The Jaccard similarity of two sets of shingle hashes."""
+    common = len(hashes.intersection(other))
+    return common / (len(hashes) + len(other) - common)
+
+class DuplicateIndex:
+    """
+    Find the questions seen before in a batch, in time linear in the number of questions.
+
+    Questions are compared by their normalized stem and options, so the numbering, the letters of the options,
+    case, spacing and the order of the options do not matter.
+    Exact duplicates are found by hash and removed, unless another option is marked as the answer: the question is then kept
+    and reported as a conflict, for someone to check which answer is right. Near duplicates (rephrased stems, a changed word
+    in an option) are found with a MinHash/LSH index and only reported, since a single word ("không") can make a different question.
+    """
+
+    def __init__(self, profile, threshold: float = SIMILARITY):
+        self.profile = profile
+        self.threshold = threshold
+        # Digest of the normalized question -> normalized answer -> index of its entry
+        self.exact = {}
+        # Hash of a band of a signature -> index of the entry, or list of the indexes, of the questions sharing it
+        self.buckets = {}
+        # (file, first line, normalized answer, shingle hashes) of every question kept
+        self.entries = []
+
+    @span('deduplicate')
+    def add(self, question: tuple, source: str, report: list = None) -> bool:
+        """
+        Index a parsed question and tell whether to keep it.
+
+        Parameters:
+        - question: The (question, options, marks) of the question, as yielded by parse_questions.
+        - source: The file the question comes from.
+        - report: A list to which the duplicates found are added, as dicts with the question and file, the 'original' question
+          and 'original_file' it duplicates, the 'similarity', whether they have the 'same_answer', whether it was 'removed'
+          and whether it is a 'conflict': the same question as one added before, with another answer.
+
+        Returns:
+        - bool: False when the question is an exact duplicate of one added before, with the same answer.
+        """
+        current_question, current_options, current_marks = question
+        stem, options = normalize(current_question, current_options)
+        correct_answer, _ = get_correct_answer(current_marks, self.profile)
+        answer = options[correct_answer - 1] if correct_answer else ""
+        title = current_question.split('\n')[0]
+
+        key = hashlib.blake2b('\x1f'.join([stem, *sorted(options)]).encode(), digest_size=16).digest()
+        answers = self.exact.setdefault(key, {})
+        original = answers.get(answer)
+        if original is not None:
+            self.record(report, title, source, original, 1.0, answer, True)
+            return False
+
+        hashes = shingles(stem, options)
+        bins = signature(hashes) if hashes else []
+        bands = [hash((start, *bins[start:start + ROWS])) for start in range(0, len(bins) - ROWS + 1, ROWS)]
+
+        if answers:
+            # The same question with another answer is kept, next to the first one found
+            self.record(report, title, source, next(iter(answers.values())), 1.0, answer, False, True)
+        else:
+            # Compare with the questions sharing a band, keeping the most similar one
+            compared = set()
+            best, best_similarity = None, self.threshold
+            for band in bands:
+                members = self.buckets.get(band, ())
+                for candidate in (members,) if isinstance(members, int) else members:
+                    if candidate in compared or len(compared) >= MAX_CANDIDATES:
+                        continue
+                    compared.add(candidate)
+                    value = similarity(hashes, self.entries[candidate][3])
+                    if value >= best_similarity:
+                        best, best_similarity = candidate, value
+            if best is not None:
+                self.record(report, title, source, best, best_similarity, answer, False)
+
+        index = len(self.entries)
+        self.entries.append((source, title, answer, array('q', hashes)))
+        answers[answer] = index
+        for band in bands:
+            members = self.buckets.get(band)
+            if members is None:
+                self.buckets[band] = index
+            elif isinstance(members, int):
+                self.buckets[band] = [members, index]
+            else:
+                members.append(index)
+        return True
+
+    def record(self, report: list, title: str, source: str, original: int, value: float, answer: str, removed: bool, conflict: bool = False) -> None:
+        """Add a duplicate to the report."""
+        if report is None:
+            return
+        original_file, original_title, original_answer, _ = self.entries[original]
+        report.append({
+            'file': source,
+            'question': title,
+            'original_file': original_file,
+            'original': original_title,
+            'similarity': round(value, 2),
+            'same_answer': answer == original_answer,
+            'removed': removed,
+            'conflict': conflict,
+        })
+
+    def filter(self, questions, source: str, report: list = None):
+        """Yield the parsed questions of a file that are not exact duplicates, see add. Questions without options are left to format_records."""
+        for question in questions:
+            if not question[1] or self.add(question, source, report):
+                yield question
+
+def save_report(duplicates: list, output_path: str) -> str:
+    """
+    Save the duplicates found for a sheet next to it, as <name>.duplicates.csv, and return the path of the report.
+
+    Parameters:
+    - duplicates: The duplicates, as added to the report by DuplicateIndex.add.
+    - output_path: The path of the sheet.
+    """
+    report_path = f"{os.path.splitext(output_path)[0]}.duplicates.csv"
+    rows = ((entry['file'], entry['question'], entry['original_file'], entry['original'], entry['similarity'],
+             "Yes" if entry['same_answer'] else "No", "Yes" if entry['removed'] else "No",
+             "Yes" if entry['conflict'] else "No") for entry in duplicates)
+    write_csv([REPORT_COLUMNS, *rows], report_path)
+    return report_path
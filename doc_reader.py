@@ -0,0 +1,501 @@
+import re
+import struct
+from bisect import bisect_right
+from functools import partial
+from reader import level_marker, script_text, stream_document, symbol_character, text_lines
+
+OLE_SIGNATURE = b'\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1'
+# Sector numbers above this one mark the end of a chain or a free sector
+MAX_SECTOR = 0xFFFFFFFA
+WORD_IDENTIFIER = 0xA5EC
+# The FIB version of Word 97, the first one with this layout
+WORD97_FIB = 0xC1
+FKP_SIZE = 512
+
+# Indexes of the (fc, lcb) pairs of the FIB
+PLCF_BTE_CHPX = 12
+PLCF_BTE_PAPX = 13
+STTBF_FFN = 15
+CLX = 33
+PLF_LST = 73
+PLF_LFO = 74
+
+# Single Property Modifiers (sprms) of the formatting read from the document
+SPRM_BOLD = 0x0835
+SPRM_ITALIC = 0x0836
+SPRM_UNDERLINE = 0x2A3E
+SPRM_HIGHLIGHT = 0x2A0C
+SPRM_SCRIPT = 0x2A48
+SPRM_DELETED = 0x0800
+SPRM_SPECIAL = 0x0855
+SPRM_SYMBOL = 0x6A09
+SPRM_LIST_LEVEL = 0x260A
+SPRM_LIST = 0x460B
+# Table sprms whose operand starts with a 2-byte size
+LONG_SPRMS = (0xD606, 0xD608)
+# Operand size of each sprm type (spra), 0 when the operand starts with its size
+OPERAND_SIZES = (1, 1, 2, 4, 2, 2, 0, 3)
+# Bold and italic are toggles: 0 off, 1 on, 0x80 as in the style and 0x81 the opposite of the style, taken as on
+TOGGLE_ON = (1, 0x81)
+SCRIPTS = {1: 'superscript', 2: 'subscript'}
+
+# Number formats (nfc) of the list levels, by the names numbering.xml gives them
+NUMBER_FORMATS = {0: 'decimal', 1: 'upperRoman', 2: 'lowerRoman', 3: 'upperLetter', 4: 'lowerLetter', 23: 'bullet'}
+
+# Characters of the text stream: paragraph, cell and section ends, then the control characters that are kept
+PARAGRAPH_ENDS = '\r\x07\x0c'
+CONTROL_CHARACTERS = {'\t': '\t', '\x0b': '\n', '\x1e': '‑'}
+CONTROL_PATTERN = re.compile(r'([\x00-\x1f])')
+FIELD_BEGIN, FIELD_SEPARATOR, FIELD_END = '\x13', '\x14', '\x15'
+# The formats of text without direct formatting, see character_formats
+PLAIN = (False, False, False, False, None, False, None)
+# Special characters stand for an object; '(' stands for a symbol (Wingdings, Symbol...) given by SPRM_SYMBOL
+SYMBOL_PLACEHOLDER = '('
+# The special character of an inline picture or embedded object (an equation), printed as pandoc prints a picture
+PICTURE_CHARACTER = '\x01'
+# Where the name of a font starts in its FFN, after the flags, weight, character set, PANOSE and signature
+FONT_NAME_OFFSET = 39
+
+
+class UnsupportedDocument(ValueError):
+    """A .doc file the reader cannot read (encrypted, saved by Word 95 or earlier, or not a Word binary file), which Word has to convert."""
+
+
+class CompoundFile:
+    """
+    The streams of an OLE compound file, the container of Word 97-2003 documents.
+
+    The file is a small file system: its sectors are chained by a file allocation table (FAT),
+    and the streams smaller than the cutoff are stored in 64-byte sectors of a mini stream, chained by a mini FAT.
+    """
+
+    def __init__(self, data: bytes):
+        if data[:8] != OLE_SIGNATURE:
+            raise UnsupportedDocument("Not a Word 97-2003 document")
+        self.data = data
+        self.sector_shift, mini_shift = struct.unpack_from('<HH', data, 30)
+        self.mini_size = 1 << mini_shift
+        (fat_sectors, directory_start, _, self.cutoff,
+         mini_fat_start, _, difat_start, difat_sectors) = struct.unpack_from('<8I', data, 44)
+
+        # The sectors of the FAT are listed by the header, then by a chain of DIFAT sectors
+        difat = list(struct.unpack_from('<109I', data, 76))
+        per_sector = (1 << self.sector_shift) // 4
+        sector = difat_start
+        for _ in range(difat_sectors):
+            if sector > MAX_SECTOR:
+                break
+            entries = struct.unpack_from(f'<{per_sector}I', data, self.offset(sector))
+            difat.extend(entries[:-1])
+            sector = entries[-1]
+        self.fat = []
+        for sector in difat[:fat_sectors]:
+            self.fat.extend(struct.unpack_from(f'<{per_sector}I', data, self.offset(sector)))
+
+        directory = self.read_chain(directory_start, self.fat, 1 << self.sector_shift, self.sector)
+        self.entries = {}
+        for position in range(0, len(directory) - 127, 128):
+            name_size, kind = struct.unpack_from('<HB', directory, position + 64)
+            start, size = struct.unpack_from('<II', directory, position + 116)
+            name = directory[position:position + max(name_size - 2, 0)].decode('utf-16-le', 'replace')
+            if kind == 5:
+                self.mini_stream = (start, size)
+            elif kind == 2:
+                self.entries.setdefault(name, (start, size))
+        mini_fat = self.read_chain(mini_fat_start, self.fat, 1 << self.sector_shift, self.sector)
+        self.mini_fat = struct.unpack(f'<{len(mini_fat) // 4}I', mini_fat)
+        self.mini_data = None
+
+    def offset(self, sector: int) -> int:
+        """The position of a sector in the file, after the header sector."""
+        return (sector + 1) << self.sector_shift
+
+    def sector(self, sector: int) -> bytes:
+        return self.data[self.offset(sector):self.offset(sector + 1)]
+
+    def mini_sector(self, sector: int) -> bytes:
+        return self.mini_data[sector * self.mini_size:(sector + 1) * self.mini_size]
+
+    @staticmethod
+    def read_chain(start: int, table, sector_size: int, read, size: int = None) -> bytes:
+        """Join the sectors of a chain, following the allocation table from the start sector."""
+        parts = []
+        sector = start
+        # A chain cannot be longer than the table, which stops the loops of a damaged file
+        for _ in range(len(table)):
+            if sector > MAX_SECTOR or sector >= len(table) or (size is not None and len(parts) * sector_size >= size):
+                break
+            parts.append(read(sector))
+            sector = table[sector]
+        data = b''.join(parts)
+        return data if size is None else data[:size]
+
+    def stream(self, name: str) -> bytes:
+        """Return the contents of a stream, or raise KeyError if the file has none of that name."""
+        start, size = self.entries[name]
+        if size >= self.cutoff:
+            return self.read_chain(start, self.fat, 1 << self.sector_shift, self.sector, size)
+        if self.mini_data is None:
+            mini_start, mini_size = self.mini_stream
+            self.mini_data = self.read_chain(mini_start, self.fat, 1 << self.sector_shift, self.sector, mini_size)
+        return self.read_chain(start, self.mini_fat, self.mini_size, self.mini_sector, size)
+
+
+# Helper functions to read the structures of the WordDocument and table streams
+def read_fib(word: bytes) -> tuple:
+    """
+    Read the File Information Block at the start of the WordDocument stream.
+
+    Returns:
+    - tuple: The name of the table stream, the number of characters of the main text and a function returning the (fc, lcb) pair of an index.
+    """
+    identifier, version = struct.unpack_from('<HH', word, 0)
+    if identifier != WORD_IDENTIFIER:
+        raise UnsupportedDocument("Not a Word 97-2003 document")
+    if version < WORD97_FIB:
+        raise UnsupportedDocument("Saved by Word 95 or earlier")
+    flags = struct.unpack_from('<H', word, 10)[0]
+    if flags & 0x0100:
+        raise UnsupportedDocument("The document is encrypted")
+    table_name = '1Table' if flags & 0x0200 else '0Table'
+
+    position = 32
+    shorts = struct.unpack_from('<H', word, position)[0]
+    position += 2 + shorts * 2
+    longs = struct.unpack_from('<H', word, position)[0]
+    text_length = struct.unpack_from('<I', word, position + 2 + 12)[0]
+    position += 2 + longs * 4
+    pairs = struct.unpack_from('<H', word, position)[0]
+    position += 2
+
+    def fc_lcb(index: int) -> tuple:
+        return struct.unpack_from('<II', word, position + index * 8) if index < pairs else (0, 0)
+    return table_name, text_length, fc_lcb
+
+def read_pieces(clx: bytes) -> list:
+    """
+    Read the piece table, which maps the characters of the text to where they are stored.
+
+    Returns:
+    - list: The (first character, last character + 1, file position, compressed) of each piece, in text order.
+      Compressed pieces store one byte per character in cp1252, the others two in UTF-16.
+    """
+    position = 0
+    # Skip the formatting of the pieces (Prc), which the text does not need
+    while position < len(clx) and clx[position] == 1:
+        position += 3 + struct.unpack_from('<h', clx, position + 1)[0]
+    if position >= len(clx) or clx[position] != 2:
+        raise ValueError("The piece table of the document is damaged")
+    size = struct.unpack_from('<I', clx, position + 1)[0]
+    count = (size - 4) // 12
+    characters = struct.unpack_from(f'<{count + 1}I', clx, position + 5)
+    pieces = []
+    for index in range(count):
+        fc = struct.unpack_from('<I', clx, position + 5 + (count + 1) * 4 + index * 8 + 2)[0]
+        compressed = bool(fc & 0x40000000)
+        fc &= 0x3FFFFFFF
+        pieces.append((characters[index], characters[index + 1], fc // 2 if compressed else fc, compressed))
+    return pieces
+
+def iter_sprms(grpprl: bytes):
+    """Yield the (sprm, operand) of a list of property modifiers."""
+    position = 0
+    while position + 2 <= len(grpprl):
+        sprm = struct.unpack_from('<H', grpprl, position)[0]
+        position += 2
+        size = OPERAND_SIZES[sprm >> 13]
+        if sprm in LONG_SPRMS:
+            size = struct.unpack_from('<H', grpprl, position)[0] + 1
+        elif size == 0:
+            size = grpprl[position] + 1 if position < len(grpprl) else 0
+        yield sprm, grpprl[position:position + size]
+        position += size
+
+def character_formats(grpprl: bytes, fonts: list = ()) -> tuple:
+    """
+    Return the (bold, italic, underline, highlight, vertical alignment, deleted, symbol) of a run from its direct formatting.
+
+    symbol is None for ordinary text. The characters of symbol runs stand for the symbol given by SPRM_SYMBOL,
+    in the font of that index in fonts (see read_fonts), and those of other special runs for pictures or footnote references: symbol is then ''.
+    """
+    bold = italic = underline = highlight = deleted = special = False
+    align = symbol = None
+    for sprm, operand in iter_sprms(grpprl):
+        if not operand:
+            continue
+        if sprm == SPRM_BOLD:
+            bold = operand[0] in TOGGLE_ON
+        elif sprm == SPRM_ITALIC:
+            italic = operand[0] in TOGGLE_ON
+        elif sprm == SPRM_UNDERLINE:
+            underline = operand[0] != 0
+        elif sprm == SPRM_HIGHLIGHT:
+            highlight = operand[0] != 0
+        elif sprm == SPRM_SCRIPT:
+            align = SCRIPTS.get(operand[0])
+        elif sprm == SPRM_DELETED:
+            deleted = operand[0] != 0
+        elif sprm == SPRM_SPECIAL:
+            special = operand[0] != 0
+        elif sprm == SPRM_SYMBOL and len(operand) >= 4:
+            font, code = struct.unpack_from('<HH', operand)
+            # Like w:sym, whose characters are in the private use area of the symbol font
+            symbol = symbol_character(fonts[font] if font < len(fonts) else None, code)
+    if special and symbol is None:
+        symbol = ''
+    return bold, italic, underline, highlight, align, deleted, symbol
+
+def list_level(grpprl: bytes) -> tuple:
+    """Return the (list, level) of a paragraph from its direct formatting, the list being 0 when it is not numbered."""
+    ilfo, ilvl = 0, 0
+    for sprm, operand in iter_sprms(grpprl):
+        if sprm == SPRM_LIST and len(operand) >= 2:
+            ilfo = struct.unpack_from('<h', operand)[0]
+        elif sprm == SPRM_LIST_LEVEL and operand:
+            ilvl = operand[0]
+    # Lists past 2047 mark paragraphs whose numbering was removed
+    return (ilfo if 0 < ilfo < 0x07FF else 0), ilvl
+
+def read_formatted_pages(word: bytes, table: bytes, fc: int, lcb: int, read_page) -> tuple:
+    """
+    Read the formatted disk pages (FKP) listed by a bin table (PlcfBteChpx or PlcfBtePapx).
+
+    Returns:
+    - tuple: The sorted file positions where the runs start, and the (end, properties) of each run,
+      the properties being what read_page returns for the grpprl of the run.
+    """
+    starts, runs = [], []
+    if not lcb:
+        return starts, runs
+    count = (lcb - 4) // 8
+    pages = struct.unpack_from(f'<{count}I', table, fc + (count + 1) * 4)
+    for page_number in pages:
+        page = word[(page_number & 0x3FFFFF) * FKP_SIZE:((page_number & 0x3FFFFF) + 1) * FKP_SIZE]
+        if len(page) < FKP_SIZE:
+            continue
+        run_count = page[FKP_SIZE - 1]
+        positions = struct.unpack_from(f'<{run_count + 1}I', page)
+        for index in range(run_count):
+            starts.append(positions[index])
+            runs.append((positions[index + 1], read_page(page, run_count, index)))
+    order = sorted(range(len(starts)), key=starts.__getitem__)
+    return [starts[index] for index in order], [runs[index] for index in order]
+
+def chpx_formats(page: bytes, run_count: int, index: int, fonts: list = ()) -> tuple:
+    """The character formats of a run of a CHPX page."""
+    offset = page[(run_count + 1) * 4 + index] * 2
+    if not offset:
+        return PLAIN
+    return character_formats(page[offset + 1:offset + 1 + page[offset]], fonts)
+
+def papx_list(page: bytes, run_count: int, index: int) -> tuple:
+    """The (list, level) of a paragraph of a PAPX page."""
+    offset = page[(run_count + 1) * 4 + index * 13] * 2
+    if not offset:
+        return 0, 0
+    size = page[offset]
+    if size:
+        grpprl = page[offset + 1:offset + 2 * size]
+    else:
+        grpprl = page[offset + 2:offset + 2 + 2 * page[offset + 1]]
+    # The paragraph style comes first
+    return list_level(grpprl[2:])
+
+def read_fonts(table: bytes, fc_lcb) -> list:
+    """Read the names of the fonts of the document (SttbfFfn), in the order the character formatting refers to them."""
+    fc, lcb = fc_lcb(STTBF_FFN)
+    if lcb < 4:
+        return []
+    count = struct.unpack_from('<H', table, fc)[0]
+    fonts = []
+    position = fc + 4
+    for _ in range(count):
+        if position >= fc + lcb:
+            break
+        size = table[position]
+        name = table[position + 1 + FONT_NAME_OFFSET:position + 1 + size].decode('utf-16-le', 'replace')
+        fonts.append(name.split('\x00')[0])
+        position += 1 + size
+    return fonts
+
+def read_lists(table: bytes, fc_lcb) -> dict:
+    """
+    Read the list definitions (PlfLst) and the lists using them (PlfLfo).
+
+    Returns:
+    - dict: Maps (list, level), as strings, to a (start, number format, level text) tuple, as reader.read_numbering does.
+    """
+    numbering = {}
+    lst_fc, lst_lcb = fc_lcb(PLF_LST)
+    lfo_fc, lfo_lcb = fc_lcb(PLF_LFO)
+    if not lst_lcb or not lfo_lcb:
+        return numbering
+
+    def read_level(position: int) -> tuple:
+        start, nfc = struct.unpack_from('<iB', table, position)
+        papx_size, chpx_size = table[position + 25], table[position + 24]
+        position += 28 + papx_size + chpx_size
+        length = struct.unpack_from('<H', table, position)[0]
+        text = table[position + 2:position + 2 + length * 2].decode('utf-16-le', 'replace')
+        # The placeholders of the level numbers are the characters 0 to 8, %1 to %9 in numbering.xml
+        text = ''.join(f'%{ord(char) + 1}' if ord(char) < 9 else char for char in text)
+        return (start, NUMBER_FORMATS.get(nfc, 'decimal'), text), position + 2 + length * 2
+
+    count = struct.unpack_from('<H', table, lst_fc)[0]
+    definitions = {}
+    position = lst_fc + 2 + count * 28
+    for index in range(count):
+        lsid = struct.unpack_from('<i', table, lst_fc + 2 + index * 28)[0]
+        simple = table[lst_fc + 2 + index * 28 + 26] & 1
+        levels = []
+        for _ in range(1 if simple else 9):
+            level, position = read_level(position)
+            levels.append(level)
+        definitions[lsid] = levels
+
+    count = struct.unpack_from('<I', table, lfo_fc)[0]
+    position = lfo_fc + 4 + count * 16
+    for index in range(count):
+        lsid = struct.unpack_from('<i', table, lfo_fc + 4 + index * 16)[0]
+        overrides = table[lfo_fc + 4 + index * 16 + 12]
+        levels = list(definitions.get(lsid, ()))
+        # LFOData: a character position, then the overridden levels
+        position += 4
+        for _ in range(overrides):
+            start, flags = struct.unpack_from('<iI', table, position)
+            position += 8
+            ilvl = flags & 0x0F
+            if flags & 0x20:
+                level, position = read_level(position)
+                if ilvl < len(levels):
+                    levels[ilvl] = level
+            elif flags & 0x10 and ilvl < len(levels):
+                levels[ilvl] = (start,) + levels[ilvl][1:]
+        for ilvl, level in enumerate(levels):
+            numbering[(str(index + 1), str(ilvl))] = level
+    return numbering
+
+def iter_text(word: bytes, pieces: list, text_length: int, starts: list, runs: list):
+    """
+    Yield the main text of the document as (text, formats, file position, bytes per character) segments,
+    split wherever the formatting changes.
+    """
+    for first, last, fc, compressed in pieces:
+        last = min(last, text_length)
+        if first >= last:
+            continue
+        width = 1 if compressed else 2
+        position, end = fc, fc + (last - first) * width
+        # The last run starting at or before the position
+        index = bisect_right(starts, position) - 1
+        while position < end:
+            if index >= 0 and position < runs[index][0]:
+                segment_end, formats = min(runs[index][0], end), runs[index][1]
+            else:
+                # Text outside every run has no direct formatting
+                segment_end, formats = min(starts[index + 1] if index + 1 < len(starts) else end, end), PLAIN
+            # Runs of UTF-16 text start on even positions, but a damaged file could split a character
+            segment_end = max(position + width, segment_end - (segment_end - position) % width)
+            data = word[position:segment_end]
+            text = data.decode('cp1252', 'replace') if compressed else data.decode('utf-16-le', 'replace')
+            yield text, formats, position, width
+            position = segment_end
+            while index + 1 < len(starts) and starts[index + 1] <= position:
+                index += 1
+
+def stream_doc(file_path: str):
+    """
+    Read a Word 97-2003 (.doc) file without Word, as stream_document reads a .docx file.
+
+    The text is put together from the piece table, the formatting marking the answers is read from the direct
+    character formatting of the runs (CHPX), and numbered paragraphs get their list marker from the list tables.
+    Fields show their result, deleted revisions are left out, and cells end a paragraph like paragraph marks do.
+    Inline pictures and embedded objects print as '[]', and symbols of the Symbol font as their Unicode characters.
+    A .docx file saved with a .doc extension is read as a .docx file.
+
+    Parameters:
+    - file_path: The path to the .doc file.
+
+    Yields:
+    - tuple: The lines of the paragraph (see reader.paragraph_lines) and the (text, bold, italic, underline, highlight)
+      flags of its runs, for every paragraph in reading order.
+
+    Raises:
+    - UnsupportedDocument: If the file is encrypted, was saved by Word 95 or earlier, or is not a Word document (e.g. RTF).
+    """
+    with open(file_path, 'rb') as file:
+        data = file.read()
+    if data[:2] == b'PK':
+        yield from stream_document(file_path)
+        return
+
+    compound = CompoundFile(data)
+    try:
+        word = compound.stream('WordDocument')
+    except KeyError:
+        raise UnsupportedDocument("Not a Word document") from None
+    table_name, text_length, fc_lcb = read_fib(word)
+    try:
+        table = compound.stream(table_name)
+    except KeyError:
+        raise ValueError("The document has no table stream") from None
+    del data, compound
+
+    clx_fc, clx_lcb = fc_lcb(CLX)
+    pieces = read_pieces(table[clx_fc:clx_fc + clx_lcb])
+    fonts = read_fonts(table, fc_lcb)
+    character_starts, character_runs = read_formatted_pages(word, table, *fc_lcb(PLCF_BTE_CHPX), partial(chpx_formats, fonts=fonts))
+    paragraph_starts, paragraph_runs = read_formatted_pages(word, table, *fc_lcb(PLCF_BTE_PAPX), papx_list)
+    numbering = read_lists(table, fc_lcb)
+    counters = {}
+
+    # The text of the current paragraph, as printed and as its (text, bold, italic, underline, highlight) runs
+    parts, runs = [], []
+    # Each open field, True once its result is reached: only results are visible
+    fields = []
+
+    def add(text: str, formats: tuple, printed: str) -> None:
+        parts.append(printed)
+        if runs and runs[-1][1:] == formats[:4]:
+            runs[-1] = (runs[-1][0] + text,) + formats[:4]
+        else:
+            runs.append((text,) + formats[:4])
+
+    def paragraph(position: int) -> tuple:
+        index = bisect_right(paragraph_starts, position) - 1
+        ilfo, ilvl = paragraph_runs[index][1] if index >= 0 and position < paragraph_runs[index][0] else (0, 0)
+        marker = level_marker(str(ilfo), str(ilvl), numbering, counters) if ilfo else ''
+        return text_lines(''.join(parts), marker), list(runs)
+
+    for text, formats, position, width in iter_text(word, pieces, text_length, character_starts, character_runs):
+        offset = 0
+        for part in CONTROL_PATTERN.split(text):
+            if not part:
+                continue
+            # The characters of the segment, counted before symbols replace their placeholders
+            length = len(part)
+            if len(part) == 1 and part < ' ':
+                if part == FIELD_BEGIN:
+                    fields.append(False)
+                elif part == FIELD_SEPARATOR:
+                    if fields:
+                        fields[-1] = True
+                elif part == FIELD_END:
+                    if fields:
+                        fields.pop()
+                elif part in PARAGRAPH_ENDS:
+                    yield paragraph(position + offset * width)
+                    parts.clear()
+                    runs.clear()
+                elif part in CONTROL_CHARACTERS and all(fields) and not formats[5]:
+                    add(CONTROL_CHARACTERS[part], formats, ' ' if part == '\t' else CONTROL_CHARACTERS[part])
+                elif part == PICTURE_CHARACTER and formats[6] == '' and all(fields) and not formats[5]:
+                    add('', formats, '[]')
+            elif all(fields) and not formats[5]:
+                if formats[6] is not None:
+                    part = formats[6] * part.count(SYMBOL_PLACEHOLDER)
+                if part:
+                    add(part, formats, script_text(part, formats[4]) if formats[4] else part)
+            offset += length
+    if parts:
+        yield text_lines(''.join(parts)), list(runs)
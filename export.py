@@ -0,0 +1,227 @@
+import re
+import csv
+
+ANSWER_LETTER_PATTERN = re.compile(r'^[a-dA-D][\.:]')
+# Helper functions to describe where a column takes its values from
+def field(name: str) -> tuple:
+    """A column holding an attribute of the QuizRecord."""
+    return ('field', name)
+
+def option(index: int) -> tuple:
+    """A column holding one of the options, empty when the question has fewer options."""
+    return ('option', index)
+
+def constant(value) -> tuple:
+    """A column holding the same value on every row."""
+    return ('constant', value)
+
+# The columns of the sheet each platform imports; adding a platform only takes a new entry
+PLATFORM_COLUMNS = {
+    "Quizizz": (
+        ("Question Text", field('question')),
+        ("Question Type", constant("Multiple Choice")),
+        ("Option 1", option(0)),
+        ("Option 2", option(1)),
+        ("Option 3", option(2)),
+        ("Option 4", option(3)),
+        ("Correct Answer", field('correct_answer')),
+        ("Time in seconds", constant(30)),
+    ),
+    "Kahoot": (
+        ("Question", field('question')),
+        ("Answer 1", option(0)),
+        ("Answer 2", option(1)),
+        ("Answer 3", option(2)),
+        ("Answer 4", option(3)),
+        ("Time limit", constant(30)),
+        ("Correct Answer", field('correct_answer')),
+    ),
+    "Blooket": (
+        ("Question Text", field('question')),
+        ("Answer 1", option(0)),
+        ("Answer 2", option(1)),
+        ("Answer 3", option(2)),
+        ("Answer 4", option(3)),
+        ("Time limit", constant(30)),
+        ("Correct Answer", field('correct_answer')),
+    ),
+}
+
+
+# Helper function to shape a record into the row of a platform
+def row_values(record, options: list, sources: list) -> list:
+    """Return the values of the columns of a platform, given by their sources, for a record and its (possibly stripped) options."""
+    values = []
+    for kind, value in sources:
+        if kind == 'field':
+            values.append(getattr(record, value))
+        elif kind == 'option':
+            values.append(options[value] if len(options) > value else "")
+        else:
+            values.append(value)
+    return values
+
+# Helper function
+def record_options(record, strip_answer_letters: bool) -> list:
+    """Return the options of a record, without their leading 'A.', 'B:', ... when strip_answer_letters is set."""
+    if strip_answer_letters:
+        return [ANSWER_LETTER_PATTERN.sub('', text, count=1) for text in record.options]
+    return record.options
+
+def export_rows(records, platform: str, strip_answer_letters: bool = False):
+    """
+    Shape quiz records into the rows of a platform, one row at a time.
+
+    Parameters:
+    - records: An iterable over the QuizRecord of each question.
+    - platform: The platform the sheet is for, a key of PLATFORM_COLUMNS.
+    - strip_answer_letters: Whether to remove the leading 'A.', 'B:', ... of the options.
+
+    Yields:
+    - tuple: The column names first, then the values of each row in the same order.
+    """
+    columns = PLATFORM_COLUMNS[platform]
+    yield tuple(name for name, _ in columns)
+
+    sources = [source for _, source in columns]
+    for record in records:
+        yield row_values(record, record_options(record, strip_answer_letters), sources)
+
+class XlsxSheet:
+    """An Excel file written one row at a time with a write-only workbook, which keeps only the current row in memory."""
+
+    def __init__(self, output_path: str):
+        # openpyxl takes longer to import than the rest of the application, so it is only loaded when a sheet is saved
+        from openpyxl import Workbook
+        from openpyxl.cell import WriteOnlyCell
+        from openpyxl.styles import Alignment, Border, Font, Side
+
+        self.output_path = output_path
+        self.workbook = Workbook(write_only=True)
+        self.sheet = self.workbook.create_sheet('Sheet1')
+        self.cell = WriteOnlyCell
+        # The header style pandas' to_excel used, so the sheets look the same as before
+        self.header_font = Font(bold=True)
+        self.header_border = Border(left=Side(style='thin'), right=Side(style='thin'), top=Side(style='thin'), bottom=Side(style='thin'))
+        self.header_alignment = Alignment(horizontal='center', vertical='top')
+        self.count = -1
+
+    def append(self, values) -> None:
+        """Add a row, the first one being the header."""
+        if self.count < 0:
+            header = []
+            for value in values:
+                cell = self.cell(self.sheet, value=value)
+                cell.font, cell.border, cell.alignment = self.header_font, self.header_border, self.header_alignment
+                header.append(cell)
+            values = header
+        self.sheet.append(values)
+        self.count += 1
+
+    def close(self, save: bool = True) -> int:
+        """Save the workbook, unless save is False, and return the number of rows written without the header."""
+        if save:
+            self.workbook.save(self.output_path)
+        return max(self.count, 0)
+
+class CsvSheet:
+    """A CSV file written one row at a time, encoded in UTF-8 with a BOM so Excel reads the Vietnamese text correctly."""
+
+    def __init__(self, output_path: str):
+        self.output_path = output_path
+        self.file = open(output_path, 'w', encoding='utf-8-sig', newline='')
+        self.writer = csv.writer(self.file)
+        self.count = -1
+
+    def append(self, values) -> None:
+        """Add a row, the first one being the header."""
+        self.writer.writerow(values)
+        self.count += 1
+
+    def close(self, save: bool = True) -> int:
+        """Close the file and return the number of rows written without the header. The rows are already written, whatever save is."""
+        self.file.close()
+        return max(self.count, 0)
+
+# Helper function
+def write_rows(rows, sheet) -> int:
+    """Write rows to a sheet and close it, without saving it if the rows could not all be written."""
+    try:
+        for values in rows:
+            sheet.append(values)
+    except BaseException:
+        sheet.close(save=False)
+        raise
+    return sheet.close()
+
+def write_xlsx(rows, output_path: str) -> int:
+    """
+    Write rows to an Excel file with a write-only workbook, which keeps only the current row in memory.
+
+    Parameters:
+    - rows: An iterable over the header and then the values of each row, as yielded by export_rows.
+    - output_path: The path to the .xlsx file.
+
+    Returns:
+    - int: The number of rows written, without the header.
+    """
+    return write_rows(rows, XlsxSheet(output_path))
+
+def write_csv(rows, output_path: str) -> int:
+    """
+    Write rows to a CSV file, encoded in UTF-8 with a BOM so Excel reads the Vietnamese text correctly.
+
+    Parameters:
+    - rows: An iterable over the header and then the values of each row, as yielded by export_rows.
+    - output_path: The path to the .csv file.
+
+    Returns:
+    - int: The number of rows written, without the header.
+    """
+    return write_rows(rows, CsvSheet(output_path))
+
+def write_platforms(records, output_paths: dict, extension: str = ".xlsx", strip_answer_letters: bool = False) -> int:
+    """
+    Write quiz records to the sheets of several platforms in a single pass over the records.
+
+    Each record is shaped into the row of every platform as soon as it comes, so the records can be a generator
+    (e.g. the merged questions of a batch, converted while they are written) and are still read only once.
+
+    Parameters:
+    - records: An iterable over the QuizRecord of each question.
+    - output_paths: The path of the sheet of each platform, by platform.
+    - extension: The type of the sheets, a key of SHEETS.
+    - strip_answer_letters: Whether to remove the leading 'A.', 'B:', ... of the options.
+
+    Returns:
+    - int: The number of rows written to each sheet, without the header.
+    """
+    sheets = []
+    targets = []
+    try:
+        for platform, output_path in output_paths.items():
+            columns = PLATFORM_COLUMNS[platform]
+            sheet = SHEETS[extension](output_path)
+            sheets.append(sheet)
+            sheet.append(tuple(name for name, _ in columns))
+            targets.append((sheet, [source for _, source in columns]))
+        for record in records:
+            # The options are stripped once for every platform
+            options = record_options(record, strip_answer_letters)
+            for sheet, sources in targets:
+                sheet.append(row_values(record, options, sources))
+    except BaseException:
+        for sheet in sheets:
+            sheet.close(save=False)
+        raise
+    return min([sheet.close() for sheet in sheets], default=0)
+
+WRITERS = {
+    '.xlsx': write_xlsx,
+    '.csv': write_csv,
+}
+# The sheet written by each writer, for writing several sheets at once
+SHEETS = {
+    '.xlsx': XlsxSheet,
+    '.csv': CsvSheet,
+}
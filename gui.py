@@ -1,10 +1,20 @@
 import os
-import docx
+import queue
+import threading
 import tkinter as tk
+import instrument
 from subprocess import Popen
 from contextlib import suppress
-from utils import open_folder, get_explorer_windows, data_frame
-from main import question_create, format_file
+from utils import open_folder, get_explorer_windows, save_sheets, save_warnings, ConversionProfile, FORMAT_OPTIONS
+from multiprocessing import freeze_support
+from itertools import chain
+from batch import iter_batch, iter_records
+from cache import BankCache
+from dedup import save_report
+
+# Milliseconds between two checks of the worker thread's progress
+POLL_INTERVAL = 100
+cancel_event = threading.Event()
 
 
 def answer_format() -> None:
@@ -43,21 +53,22 @@ def answer_format() -> None:
     select_button = tk.Button(window_platform, text="Select", command=on_select_button_click)
     select_button.grid(row=3, column=1, pady=10)
 
-curr, next = False, False
+add_checked, remove_checked = False, False
 def update_checkboxes()-> None:
     """Function to make sure that only one checkbox can be selected at the same time."""
-    global curr, next
+    global add_checked, remove_checked
     
-    if curr and checkboxes["Xóa chữ 'Câu'"].get():
+    if add_checked and checkboxes["Xóa chữ 'Câu'"].get():
         checkboxes["Thêm chữ 'Câu'"].set(False)
-    if not curr and next and checkboxes["Thêm chữ 'Câu'"].get():
+    if not add_checked and remove_checked and checkboxes["Thêm chữ 'Câu'"].get():
         checkboxes["Xóa chữ 'Câu'"].set(False)
-    curr = checkboxes["Thêm chữ 'Câu'"].get()
-    next = checkboxes["Xóa chữ 'Câu'"].get()
+    add_checked = checkboxes["Thêm chữ 'Câu'"].get()
+    remove_checked = checkboxes["Xóa chữ 'Câu'"].get()
 
 
 def run(ans_checkboxes) -> None:
-    """Execute the main processing logic for converting Word documents into quiz data."""
+    """Start converting the selected Word documents into quiz data, on a worker thread so the window stays responsive."""
+    global cancel_event
     # Step 1: Get selected file paths
     file_paths = open_folder()
 
@@ -65,115 +76,213 @@ def run(ans_checkboxes) -> None:
         status_label.config(text="Vui lòng chọn ít nhất một file Word", fg="red")
         return
 
-    # Step 2: Get platform and selected options
-    status_label.config(text="Đang xử lý...")
-    platform = platform_selection.get()
+    # Step 2: Get the platforms and selected options
+    platforms = [platform for platform, var in platform_selection.items() if var.get()]
+    if not platforms:
+        status_label.config(text="Vui lòng chọn ít nhất một nền tảng", fg="red")
+        return
+    status_label.config(text="Đang xử lý...", fg="black")
+    details_label.config(text="")
     selected_options = [option for option, var in checkboxes.items() if var.get()]
     selected_options.extend([ans for ans, var in ans_checkboxes.items() if var.get()])
-    # Step 3: Initialize data collection
-    all_data = []
-    del_list = []
-    question_numbers = 1
-
-    # Step 4: Process each selected file
-    
-    for file_path in file_paths:
-        data = []
-        current_question = ""
-        current_options = []
-
-        # Convert .doc to .docx if needed and get the new .docx file path
-        path, highlights, del_list = format_file(file_path, del_list, selected_options)
-        if path is None:
-            status_label.config(text="Lỗi định dạng file, vui lòng chọn file Word!", fg="red")
+    profile = ConversionProfile(selected_options)
+
+    # Step 3: Convert on a worker thread, which reports back through the queue
+    messages = queue.Queue()
+    cancel_event = threading.Event()
+    threading.Thread(target=convert, args=(file_paths, platforms, profile, messages, cancel_event), daemon=True).start()
+    file_button.config(state="disabled")
+    cancel_button.config(state="normal")
+    window.after(POLL_INTERVAL, poll, messages)
+
+def convert(file_paths: list, platforms: list, profile: ConversionProfile, messages: queue.Queue, cancel: threading.Event) -> None:
+    """
+    Convert the files and save their sheets, those of every selected platform being saved from a single conversion. Runs on a worker thread, so it never touches the widgets:
+    everything it has to show is put on the messages queue, as ('progress', text) and finally ('done', outputs, failed, warnings, removed, details) tuples,
+    removed being the number of duplicate questions left out and details the lines about the cache and the profile of the run.
+    The questions to check and the duplicates found are saved next to the sheets, see utils.save_warnings and dedup.save_report.
+    """
+    try:
+        # Profile the run when WTE_PROFILE is set
+        instrument.reset()
+        profiler = instrument.start_cprofile()
+
+        # Convert the files, several at a time, reusing the banks parsed by earlier runs
+        def progress(done: int, total: int, file_path: str, questions: int) -> None:
+            messages.put(('progress', f"Đang xử lý... {done}/{total} file, {questions} câu ({os.path.basename(file_path)})"))
+
+        cache = BankCache()
+        results = iter_batch(file_paths, profile, cache=cache, progress=progress, cancel=cancel)
+
+        outputs = []
+        failed = []
+        warnings = []
+        duplicates = []
+
+        def check(result: dict) -> None:
+            # The questions to check are reported with the name of their file
+            result['warnings'] = [dict(warning, file=os.path.basename(result['file_path'])) for warning in result['warnings']]
+            if cancel.is_set():
+                return
+            warnings.extend(result['warnings'])
+            duplicates.extend(result['duplicates'])
+            if result['error'] is not None:
+                failed.append(os.path.basename(result['file_path']))
+
+        if not profile.merge:
+            # Save each file as soon as it is converted
+            for result in results:
+                check(result)
+                if result['error'] is None and not cancel.is_set():
+                    messages.put(('progress', f"Đang lưu {os.path.basename(result['file_path'])}..."))
+                    outputs.extend(save_sheets(result['data'], result['file_path'], platforms, profile, open_file=False).values())
+                    if result['warnings']:
+                        save_warnings(result['warnings'], outputs[-1])
+                    if result['duplicates']:
+                        save_report(result['duplicates'], outputs[-1])
+        else:
+            # Merge multiple files: the questions are written to the sheet as the files are converted
+            records = iter_records(results, check)
+            first = next(records, None)
+            if first is not None:
+                output_paths = list(save_sheets(chain([first], records), "Merged_File.xlsx", platforms, profile, open_file=False).values())
+                if cancel.is_set():
+                    # The merged sheets only hold the files converted before the cancellation
+                    for output_path in output_paths:
+                        os.remove(output_path)
+                else:
+                    outputs.extend(output_paths)
+                    if warnings:
+                        save_warnings(warnings, output_paths[-1])
+                    if duplicates:
+                        save_report(duplicates, output_paths[-1])
+        details = [cache.summary()]
+        if instrument.enabled and outputs:
+            details.append(f"Profile: {', '.join(instrument.dump(outputs[-1], profiler))}")
+        removed = sum(1 for duplicate in duplicates if duplicate['removed'])
+        messages.put(('done', outputs, failed, len(warnings), removed, details))
+    except Exception as error:
+        messages.put(('error', str(error) or type(error).__name__))
+
+def poll(messages: queue.Queue) -> None:
+    """Show what the worker thread has reported, and check again later until it is done."""
+    while True:
+        try:
+            message = messages.get_nowait()
+        except queue.Empty:
+            window.after(POLL_INTERVAL, poll, messages)
+            return
+        if message[0] == 'progress':
+            status_label.config(text=message[1], fg="black")
+        else:
             break
-        
-        doc = docx.Document(path)
-        question_numbers = question_create(doc, current_question, current_options, highlights, data, platform, selected_options, question_numbers)
 
-        if "Gộp nhiều file thành một" not in selected_options:
-            question_numbers = 1
-            data_frame(data, file_path, selected_options, open_file=True)
-        else:
-            all_data.extend(data)
+    file_button.config(state="normal")
+    cancel_button.config(state="disabled")
+    if message[0] == 'error':
+        status_label.config(text=f"Lỗi: {message[1]}", fg="red")
+        return
 
-    # Step 5: Merge multiple files if selected option is enabled
-    if "Gộp nhiều file thành một" in selected_options:
-        data_frame(all_data, "Merged_File.xlsx", selected_options, open_file=True)
+    _, outputs, failed, warnings, removed, details = message
+    details_label.config(text="\n".join(details))
+    # The files are opened here rather than on the worker thread, since the shell expects to be called from the GUI thread
+    for output_path in outputs:
+        os.startfile(output_path)
 
-    # Step 6: Delete temporary files
-    for temp_file in del_list:
-        os.remove(temp_file)
+    # Open output directory
     output_path = os.path.abspath("Output")
-    
-    # Step 7: Open output directory
-    if not get_explorer_windows(output_path):
+    if outputs and not get_explorer_windows(output_path):
         Popen(['explorer', "Output"], stdout=-1, stderr=-1)
-    status_label.config(text="Chuyển đổi thành công!", fg="green")
-
-# Create the main window
-window = tk.Tk()
-window.title("Word To Excel Converter v2.3")
-window.geometry("480x300")
-
-# Main frame for organizing widgets
-main_frame = tk.Frame(window)
-main_frame.pack(pady=20, padx=10)
-
-# Load the logo image
-try:
-    logo = tk.PhotoImage(file='logo.png')
-except tk.TclError:
-    logo = tk.PhotoImage(file='Images\logo.png')
-window.iconphoto(True, logo)
-
-# Header label
-header_label = tk.Label(main_frame, text="Convert Word to Excel", font=("Helvetica", 16))
-header_label.grid(row=0, column=0, columnspan=3, pady=10)
-
-# File selection button
-file_button = tk.Button(main_frame, text="Select Word Document", command=answer_format)
-file_button.grid(row=1, column=0, columnspan=3, pady=10)
-
-# Create a frame for the version label
-version_label = tk.Label(main_frame, text="Author: caphefalumi", fg="blue", font=("Open sans", 8))
-version_label.grid(row=5, column=2, sticky="e", padx=5, pady=10)
-
-# Status label
-status_label = tk.Label(main_frame, text="", fg="green")
-status_label.grid(row=5, column=0, columnspan=3, pady=10, padx=10)  # Center the label using "sticky"
-
-# Platform radio buttons
-platform_options = ["Quizizz", "Kahoot", "Blooket"]
-platform_selection = tk.StringVar(window)
-platform_selection.set(platform_options[0])
-
-# Create radio buttons
-platform_quizizz = tk.Radiobutton(main_frame, text="Quizizz", variable=platform_selection, value="Quizizz")
-platform_kahoot = tk.Radiobutton(main_frame, text="Kahoot", variable=platform_selection, value="Kahoot")
-platform_blooket = tk.Radiobutton(main_frame, text="Blooket", variable=platform_selection, value="Blooket")
-
-# Place the radio buttons side by side
-platform_quizizz.grid(row=2, column=0, pady=10, padx=10, sticky="w")
-platform_kahoot.grid(row=2, column=1, pady=10, padx=10, sticky="w")
-platform_blooket.grid(row=2, column=2, pady=10, padx=10, sticky="w")
-
-# Choice checkboxes
-checkbox_options = ["Xóa chữ 'Câu'", "Thêm chữ 'Câu'", "Sửa lỗi định dạng", "Xóa chữ 'A,B,C,D'", "Xáo trộn câu hỏi", "Gộp nhiều file thành một"]
-checkboxes = {}
-
-
-for i, option_text in enumerate(checkbox_options):
-    var = tk.BooleanVar()
-    checkboxes[option_text] = var
-    checkbox = tk.Checkbutton(main_frame, text=option_text, variable=var, anchor="w",command=update_checkboxes)
-    checkbox.grid(row=3 + (i // 3), column=i % 3, pady=10, padx=10, sticky="w")
-
-# Set "Sửa lỗi định dạng" checkbox to be always checked
-checkboxes["Sửa lỗi định dạng"].set(True)
-
-# Start the GUI application
+
+    if cancel_event.is_set():
+        status_label.config(text=f"Đã hủy, {len(outputs)} file đã được lưu", fg="red")
+    elif failed:
+        status_label.config(text=f"Lỗi định dạng file: {', '.join(failed)}", fg="red")
+    else:
+        notes = []
+        if warnings:
+            notes.append(f"{warnings} câu cần kiểm tra đáp án")
+        if removed:
+            notes.append(f"đã bỏ {removed} câu trùng lặp")
+        status_label.config(text=f"Chuyển đổi thành công! ({', '.join(notes)})" if notes else "Chuyển đổi thành công!", fg="green")
+
+def cancel() -> None:
+    """Ask the worker thread to stop before the next file."""
+    cancel_event.set()
+    cancel_button.config(state="disabled")
+    status_label.config(text="Đang hủy...", fg="black")
+
+# Worker processes of the batch conversion import this module too, so the window is only built when it is run directly
 if __name__ == "__main__":
+    freeze_support()
+
+    # Create the main window
+    window = tk.Tk()
+    window.title("Word To Excel Converter v2.3")
+    window.geometry("480x420")
+
+    # Main frame for organizing widgets
+    main_frame = tk.Frame(window)
+    main_frame.pack(pady=20, padx=10)
+
+    # Load the logo image
+    try:
+        logo = tk.PhotoImage(file='logo.png')
+    except tk.TclError:
+        logo = tk.PhotoImage(file='Images\logo.png')
+    window.iconphoto(True, logo)
+
+    # Header label
+    header_label = tk.Label(main_frame, text="Convert Word to Excel", font=("Helvetica", 16))
+    header_label.grid(row=0, column=0, columnspan=3, pady=10)
+
+    # File selection button
+    file_button = tk.Button(main_frame, text="Select Word Document", command=answer_format)
+    file_button.grid(row=1, column=0, columnspan=3, pady=10)
+
+    # Create a frame for the version label
+    version_label = tk.Label(main_frame, text="Author: caphefalumi", fg="blue", font=("Open sans", 8))
+    version_label.grid(row=6, column=2, sticky="e", padx=5, pady=10)
+
+    # Status label
+    status_label = tk.Label(main_frame, text="", fg="green")
+    status_label.grid(row=6, column=0, columnspan=3, pady=10, padx=10)  # Center the label using "sticky"
+
+    # Cancel button, only enabled while a conversion is running
+    cancel_button = tk.Button(main_frame, text="Hủy", command=cancel, state="disabled")
+    cancel_button.grid(row=7, column=0, columnspan=3)
+
+    # Details of the last run: the cache, and where its profile was saved when WTE_PROFILE is set
+    details_label = tk.Label(main_frame, text="", fg="gray", font=("Open sans", 8), wraplength=460)
+    details_label.grid(row=8, column=0, columnspan=3, pady=5)
+
+    # Platform checkboxes: the sheets of every checked platform are saved from a single conversion
+    platform_options = ["Quizizz", "Kahoot", "Blooket"]
+    platform_selection = {}
+
+    # Place the checkboxes side by side
+    for i, platform in enumerate(platform_options):
+        var = tk.BooleanVar()
+        platform_selection[platform] = var
+        checkbox = tk.Checkbutton(main_frame, text=platform, variable=var, anchor="w")
+        checkbox.grid(row=2, column=i, pady=10, padx=10, sticky="w")
+    platform_selection[platform_options[0]].set(True)
+
+    # Choice checkboxes
+    checkbox_options = FORMAT_OPTIONS
+    checkboxes = {}
+
+
+    for i, option_text in enumerate(checkbox_options):
+        var = tk.BooleanVar()
+        checkboxes[option_text] = var
+        checkbox = tk.Checkbutton(main_frame, text=option_text, variable=var, anchor="w",command=update_checkboxes)
+        checkbox.grid(row=3 + (i // 3), column=i % 3, pady=10, padx=10, sticky="w")
+
+    # Set "Sửa lỗi định dạng" checkbox to be always checked
+    checkboxes["Sửa lỗi định dạng"].set(True)
+
+    # Start the GUI application
     try:
         with suppress(KeyboardInterrupt): window.mainloop()
     except:
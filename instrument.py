@@ -0,0 +1,189 @@
+import os
+import json
+import time
+import threading
+import functools
+
+# The stages of a conversion, as recorded:
+# - format_file: reading a document. Its XML (or the .doc file) is parsed lazily while the lines are extracted,
+#   so that parsing has no stage of its own and is counted in extract_original_format, within format_file
+# - convert_to_docx: converting a .doc file with Word, only for the files the built-in reader does not support
+# - parse_questions: grouping the lines of a document into questions (main.parse_bank)
+# - format_records: formatting the questions of a document (main.format_bank), with process_formats and create_quiz per question
+# - deduplicate, variant: with "Bỏ câu hỏi trùng lặp" and --variants
+# - data_frame: saving the sheets
+
+# "1" records the stages, "cprofile" also records a cProfile of the run
+ENVIRONMENT_VARIABLE = 'WTE_PROFILE'
+
+mode = os.environ.get(ENVIRONMENT_VARIABLE, '').strip().lower()
+enabled = mode not in ('', '0', 'false', 'off')
+cprofile = mode == 'cprofile'
+
+# Stage name -> [calls, seconds, peak bytes]
+stages = {}
+# Folded stack ("outer;inner") -> seconds spent in the innermost stage itself
+stacks = {}
+lock = threading.Lock()
+local = threading.local()
+# The thread whose spans record peak memory. tracemalloc has a single peak for the whole process, and a span resets it,
+# so the spans of one thread only: the first to start a span, until it ends. The spans of the other threads record their time and calls
+memory_thread = None
+
+
+def enable(with_cprofile: bool = False) -> None:
+    """Turn the instrumentation on, like the WTE_PROFILE environment variable does; processes started afterwards inherit it."""
+    global enabled, cprofile
+    enabled = True
+    cprofile = cprofile or with_cprofile
+    os.environ[ENVIRONMENT_VARIABLE] = 'cprofile' if cprofile else '1'
+
+class Frame:
+    """A running span: where it started, and the time and memory its children used (memory None when its thread does not trace it)."""
+    __slots__ = ('name', 'start', 'memory', 'peak', 'children')
+
+    def __init__(self, name: str, memory: int):
+        self.name = name
+        self.start = time.perf_counter()
+        self.memory = memory
+        self.peak = memory
+        self.children = 0.0
+
+def span(name: str):
+    """
+    Decorator recording the wall time, calls and peak memory of a function as the stage `name`.
+
+    When the instrumentation is off the wrapper only checks a flag before calling the function.
+    Memory is traced with tracemalloc, which is only started once the instrumentation is on, and only on one thread (see memory_thread).
+    """
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not enabled:
+                return function(*args, **kwargs)
+            enter(name)
+            try:
+                return function(*args, **kwargs)
+            finally:
+                leave()
+        return wrapper
+    return decorator
+
+# Helper function
+def traces_memory() -> bool:
+    """Tell whether the spans of the current thread record peak memory, making it the memory thread if there is none alive."""
+    global memory_thread
+    thread = threading.current_thread()
+    if memory_thread is not thread:
+        with lock:
+            if memory_thread is None or not memory_thread.is_alive():
+                memory_thread = thread
+    return memory_thread is thread
+
+def enter(name: str) -> None:
+    """Start a span on the current thread."""
+    import tracemalloc
+
+    frames = getattr(local, 'frames', None)
+    if frames is None:
+        frames = local.frames = []
+    if not traces_memory():
+        frames.append(Frame(name, None))
+        return
+    if not tracemalloc.is_tracing():
+        tracemalloc.start()
+    current, peak = tracemalloc.get_traced_memory()
+    if frames and frames[-1].memory is not None:
+        frames[-1].peak = max(frames[-1].peak, peak)
+    tracemalloc.reset_peak()
+    frames.append(Frame(name, current))
+
+def leave() -> None:
+    """End the innermost span of the current thread and record it."""
+    import tracemalloc
+
+    frames = local.frames
+    frame = frames[-1]
+    traced = frame.memory is not None
+    if traced:
+        _, peak = tracemalloc.get_traced_memory()
+        frame.peak = max(frame.peak, peak)
+    elapsed = time.perf_counter() - frame.start
+    stack = ';'.join(f.name for f in frames)
+    frames.pop()
+    if frames:
+        frames[-1].children += elapsed
+        if traced and frames[-1].memory is not None:
+            frames[-1].peak = max(frames[-1].peak, frame.peak)
+    if traced:
+        tracemalloc.reset_peak()
+
+    with lock:
+        stage = stages.setdefault(frame.name, [0, 0.0, 0])
+        stage[0] += 1
+        stage[1] += elapsed
+        if traced:
+            stage[2] = max(stage[2], frame.peak - frame.memory)
+        stacks[stack] = stacks.get(stack, 0.0) + elapsed - frame.children
+
+def reset() -> None:
+    """Forget what has been recorded, at the start of a run."""
+    with lock:
+        stages.clear()
+        stacks.clear()
+
+def drain() -> dict:
+    """Return what has been recorded in this process and forget it, for a worker process to hand it to the parent."""
+    with lock:
+        recorded = {'stages': dict(stages), 'stacks': dict(stacks)}
+        stages.clear()
+        stacks.clear()
+    return recorded
+
+def merge(recorded: dict) -> None:
+    """Add what a worker process recorded (see drain) to this process."""
+    with lock:
+        for name, (calls, seconds, peak) in recorded['stages'].items():
+            stage = stages.setdefault(name, [0, 0.0, 0])
+            stage[0] += calls
+            stage[1] += seconds
+            stage[2] = max(stage[2], peak)
+        for stack, seconds in recorded['stacks'].items():
+            stacks[stack] = stacks.get(stack, 0.0) + seconds
+
+def start_cprofile():
+    """Start a cProfile of the current thread if it was asked for, and return it (None otherwise)."""
+    if not (enabled and cprofile):
+        return None
+    import cProfile
+
+    profiler = cProfile.Profile()
+    profiler.enable()
+    return profiler
+
+def dump(output_path: str, profiler=None) -> list:
+    """
+    Save the recorded profile next to an output file and return the paths written.
+
+    <name>.profile.json holds the calls, seconds and peak memory of each stage, and the folded stacks;
+    <name>.folded holds the folded stacks in microseconds, the input of flamegraph.pl and speedscope;
+    <name>.prof holds the cProfile of the run, when one was recorded.
+    """
+    base = os.path.splitext(output_path)[0]
+    with lock:
+        profile = {
+            'stages': {name: {'calls': calls, 'seconds': seconds, 'peak_bytes': peak} for name, (calls, seconds, peak) in stages.items()},
+            'stacks': dict(stacks),
+        }
+    with open(f"{base}.profile.json", 'w', encoding='utf-8') as file:
+        json.dump(profile, file, ensure_ascii=False, indent=2)
+    with open(f"{base}.folded", 'w', encoding='utf-8') as file:
+        for stack, seconds in sorted(profile['stacks'].items()):
+            file.write(f"{stack} {round(seconds * 1e6)}\n")
+    paths = [f"{base}.profile.json", f"{base}.folded"]
+
+    if profiler is not None:
+        profiler.disable()
+        profiler.dump_stats(f"{base}.prof")
+        paths.append(f"{base}.prof")
+    return paths
@@ -1,134 +1,281 @@
 import os
-import re
-import docx
-import win32com.client as win32
-from pypandoc import convert_file
-from utils import CFL, create_quiz, extract_format_text, split_options, is_option, is_question, process_formats
+import shutil
+import tempfile
+from collections import deque
+from backends import ConverterSession, WordBackend
+from doc_reader import UnsupportedDocument, stream_doc
+from instrument import span
+from reader import iter_paragraphs, iter_runs, paragraph_lines, read_heading_styles, read_numbering, run_formats, stream_document
+from utils import ConversionProfile, answer_marks, create_quiz, get_correct_answer, get_profile, split_options, is_option, is_question, process_formats
 
-def format_file(file_path: str, del_list: list, selected_options: list) -> list:
+# How often format_bank reports its progress, in questions
+PROGRESS_QUESTIONS = 200
+
+def load_document(file_path: str, streaming: bool = True):
     """
-    Format a document file to DOCX, extract formatted text, and return relevant information.
-    
+    Open a .docx file once and yield its paragraphs in reading order, including those in tables and content controls.
+
+    Args:
+        file_path (str): The path to the .docx file.
+        streaming (bool, optional): Read word/document.xml incrementally instead of loading it with python-docx. Defaults to True.
+
+    Yields:
+        tuple: The lines of the paragraph as pandoc's plain text output would contain them (empty if the paragraph has no text),
+        and the (text, bold, italic, underline, highlight) flags of its runs.
+    """
+    if streaming:
+        yield from stream_document(file_path)
+        return
+
+    # python-docx is slow to import and only needed here
+    import docx
+    from docx.opc.constants import RELATIONSHIP_TYPE as RT
+
+    document = docx.Document(file_path)
+    try:
+        numbering = read_numbering(document.part.part_related_by(RT.NUMBERING).element)
+    except KeyError:
+        # The document has no lists
+        numbering = {}
+    headings = read_heading_styles(document.styles.element)
+    counters = {}
+    for p in iter_paragraphs(document.element.body):
+        # The runs are read as the streaming reader reads them, those in links and content controls included, so both mark the same answers
+        yield paragraph_lines(p, numbering, counters, headings), [run_formats(r) for r in iter_runs(p)]
+
+@span('extract_original_format')
+def extract_original_format(paragraphs) -> tuple:
+    """
+    Extract the text lines and the answer marks of paragraphs from the same parse.
+
+    Parameters:
+    - paragraphs: An iterable over the (lines, runs) of each paragraph, as yielded by load_document.
+
+    Returns:
+    - tuple: The lines, with a blank line between paragraphs, and the answer marks of the lines, see format_file.
+    """
+    lines = []
+    marks = {}
+    for text_lines, runs in paragraphs:
+        if not text_lines:
+            continue
+        # Paragraphs are separated by a blank line, like in pandoc's plain text output
+        if lines:
+            lines.append('')
+        paragraph_marks = answer_marks(text_lines, runs)
+        if paragraph_marks:
+            for index in range(len(lines), len(lines) + len(text_lines)):
+                marks[index] = paragraph_marks
+        lines.extend(text_lines)
+    return lines, marks
+
+@span('format_file')
+def format_file(file_path: str, del_list: list, converter=None) -> list:
+    """
+    Read a document file in a single pass and extract its text lines and the formatting marking the answers.
+    Nothing returned depends on the selected options.
+
     Args:
         file_path (str): The path to the document file.
-        del_list (list): A list to store the paths of temporary files.
-        selected_options (list): A list of selected options for formatting.
-        
+        del_list (list): A list to store the paths of temporary files. The .doc conversion removes its own, so nothing is added to it.
+        converter (ConverterSession, optional): The session converting to .docx the .doc files the built-in reader does not support
+            (see doc_reader.UnsupportedDocument). Defaults to a Word session started and stopped for this file only.
+
     Returns:
-        list: Containing the path to the converted DOCX file, a list of highlighted text, and a list of paths of temporary files.
-    """
-
-    def convert_to_docx(file_path_convert: str, name: str, del_list: list) -> list:
-        global temp_path_docx
-        temp_name = f'wteTemp{name}'
-        
-        # Load the DOCX document using pypandoc
-        convert_file(file_path_convert, 'plain', extra_args=['--wrap=none'], outputfile=f'{temp_name}.txt')
-        document = docx.Document()
-        
-        # Read the text from the file and replace soft returns with paragraph marks
-        with open(f'{temp_name}.txt', 'r', encoding='utf-8') as file:
-            text = file.readlines()
-        
-        for line in text:
-            document.add_paragraph(line)
-        
-        document.save(f'{temp_name}.docx')
-        os.remove(f'{temp_name}.txt')
-        temp_path_docx = os.path.abspath(f'{temp_name}.docx')
-        del_list.append(temp_path_docx)
-        return del_list
-
-    # Function to extract formatted text
-    def extract_original_format(file_path: str, selected_options: list) -> list:
-        highlights = []
-        document = docx.Document(file_path)
-        # Append the highlighted text
-        for paragraph in document.paragraphs:
-            highlighted_text = extract_format_text(paragraph, selected_options)
-            if highlighted_text is not None:
-                match = re.match(r'^[a-dA-D]', highlighted_text)
-                if "A,B,C,D" in selected_options and match:
-                    highlights.append(highlighted_text)
-                # Regex to extract the correct answer with no white space
-                else:
-                    highlights.append(CFL(re.sub(f'{match}. ', '', highlighted_text)))
-        return highlights
+        list: Containing the lines of text of the document, the answer marks, and a list of paths of temporary files.
+        The answer marks map the index of each line of a paragraph with marked options to the marks of that paragraph (see answer_marks).
+    """
 
     # Split the file path into name and extension
     name, ext = os.path.splitext(os.path.basename(file_path))
     abs_file_path = os.path.abspath(file_path)
     
     if ext == ".doc":
-        # Convert .doc to .docx
-        temp_name = f"wteDocTemp{name}"
-        temp_path = os.path.abspath(f"{temp_name}.docx")
-        
-        word = win32.gencache.EnsureDispatch('Word.Application')
-        doc = word.Documents.Open(abs_file_path)
-        doc.Activate()
-        
-        word.ActiveDocument.SaveAs(temp_name, FileFormat=win32.constants.wdFormatXMLDocument)
-        doc.Close(False)
-        word.Quit()
-        
-        #Delete the temporary .docx file
-        del_list = convert_to_docx(temp_path, name, del_list)
-        del_list.append(temp_path)
-        highlights = extract_original_format(temp_path, selected_options)
-        
-        return temp_path_docx, highlights, del_list
+        # Word 97-2003 documents are read directly, Word is only needed for the ones the reader does not support
+        try:
+            lines, marks = extract_original_format(stream_doc(abs_file_path))
+            return lines, marks, del_list
+        except UnsupportedDocument:
+            pass
+
+        # Convert .doc to .docx, in a directory of its own so runs converting files of the same name do not overwrite each other
+        temp_directory = tempfile.mkdtemp(prefix='wte')
+        try:
+            temp_path = os.path.join(temp_directory, f"{name}.docx")
+            if converter is None:
+                with ConverterSession(WordBackend()) as session:
+                    session.convert(abs_file_path, temp_path)
+            else:
+                converter.convert(abs_file_path, temp_path)
+
+            lines, marks = extract_original_format(load_document(temp_path))
+        finally:
+            shutil.rmtree(temp_directory, ignore_errors=True)
+        return lines, marks, del_list
 
     elif ext == ".docx":
-        del_list = convert_to_docx(abs_file_path, name, del_list)
-        highlights = extract_original_format(file_path, selected_options)
-        return temp_path_docx, highlights, del_list   
+        lines, marks = extract_original_format(load_document(abs_file_path))
+        return lines, marks, del_list
     
     return None, None, None 
 
+def parse_questions(lines, marks: dict = None):
+    """
+    Group the lines of a document into questions and their options, before any formatting.
+    The lines are consumed as a stream in a single pass, each line is classified only once,
+    and the answer marks of each option are picked up as the option is added to its question.
+
+    Parameters:
+    - lines: An iterable over the lines of text of the document, as returned by format_file.
+    - marks: The answer marks of the lines, as returned by format_file.
+
+    Yields:
+    - tuple: The question text, its list of options and the mask of the answer formats marking each option, for every question in the document.
+      Questions without options are yielded with empty lists, they are skipped when formatting.
+    """
+    marks = marks or {}
+    current_question = ""
+    current_options = []
+    current_marks = []
+
+    # Classification (is question, is option) of the last two lines; the parser never looks further back
+    lookback = deque([(False, False), (False, False)], maxlen=2)
+    for index, text in enumerate(lines):
+        text = text.strip()
+        question, option = is_question(text) is not None, is_option(text) is not None
+        two_back_question, two_back_option = lookback[0]
+        lookback.append((question, option))
+
+        #The second condition is to handle multiple line questions, the line two back is the previous paragraph because paragraphs are separated by a blank line
+        if question and not two_back_question:
+            if current_question:
+                yield current_question, current_options, current_marks
+            # New lists for the new question, the previous ones have been handed out
+            current_options = []
+            current_marks = []
+            current_question = text
+        elif current_question:
+            if option:
+                paragraph_marks = marks.get(index, {})
+                for option_text in split_options(text):
+                    current_options.append(option_text)
+                    current_marks.append(paragraph_marks.get(option_text[:1].upper(), 0))
+            elif text and not two_back_option:
+                current_question += '\n'+text
+
+    # The last question
+    if current_question:
+        yield current_question, current_options, current_marks
+
+@span('parse_questions')
+def parse_bank(lines, marks: dict = None, skip: bool = False) -> list:
+    """
+    Parse the lines of a document into the questions of its bank, see parse_questions.
+
+    Parameters:
+    - lines: The lines of text of the document, as returned by format_file.
+    - marks: The answer marks of the lines, as returned by format_file.
+    - skip: Leave out the first question, when the lines start with context lines that only give the parser its lookback.
+
+    Returns:
+    - list: The [question, options, marks] of every question.
+    """
+    parsed = parse_questions(lines, marks)
+    if skip:
+        next(parsed, None)
+    return [[question, options, option_marks] for question, options, option_marks in parsed]
+
+class QuestionNumbering:
+    """The number of the next question, carried from one document to the next when the files are merged."""
+    __slots__ = ('number',)
+
+    def __init__(self, number: int = 1):
+        self.number = number
+
+def format_records(questions, profile: ConversionProfile, numbering: QuestionNumbering, report: list = None):
+    """
+    Format parsed questions one at a time, so they can be written as they are parsed.
+
+    Parameters:
+    - questions: An iterable over (question, options, marks) tuples, as yielded by parse_questions. Questions without options are skipped.
+    - profile: The selected options being processed.
+    - numbering: The number of the current question, advanced as the questions are formatted.
+      Once the questions are exhausted, it holds the number the next document starts from.
+    - report: A list to which the questions without an answer, or with several, are added as {'question', 'answers'} dicts.
+
+    Yields:
+    - QuizRecord: The formatted question with its options and correct answer.
+    """
+
+    def format_record(question: tuple, question_number: int):
+        current_question, current_options, current_marks = question
+        correct_answer, answers = get_correct_answer(current_marks, profile)
+        current_question, current_options = process_formats(current_question, current_options, profile, question_number)
+        if answers != 1 and report is not None:
+            report.append({'question': current_question.split('\n')[0], 'answers': answers})
+        return create_quiz(current_question, current_options, correct_answer)
+
+    # Hold each question back by one, the last question of the document takes the number after the increment
+    previous = None
+    for question in questions:
+        if previous is not None and len(previous[1]) > 0:
+            yield format_record(previous, numbering.number)
+            numbering.number += 1
+        previous = question
+
+    # Process the last question
+    numbering.number += 1
+    if previous is not None and len(previous[1]) > 0:
+        yield format_record(previous, numbering.number)
+
+@span('format_records')
+def format_bank(questions, profile: ConversionProfile, numbering: QuestionNumbering, report: list = None, progress=None) -> list:
+    """
+    Format the questions of a document at once, see format_records, and return their QuizRecord.
+    progress, if given, is called with the number of questions formatted so far every PROGRESS_QUESTIONS questions.
+    """
+    if progress is None:
+        return list(format_records(questions, profile, numbering, report))
+    records = []
+    for record in format_records(questions, profile, numbering, report):
+        records.append(record)
+        if len(records) % PROGRESS_QUESTIONS == 0:
+            progress(len(records))
+    return records
+
+def format_questions(questions, data: list, profile: ConversionProfile, question_numbers: int, report: list = None) -> int:
+    """
+    Format parsed questions and add them to the quiz data.
+
+    Parameters:
+    - questions: An iterable over (question, options, marks) tuples, as yielded by parse_questions. Questions without options are skipped.
+    - data: The list of quiz records being created.
+    - profile: The selected options being processed.
+    - question_numbers: The current question number.
+    - report: A list to which the questions without an answer, or with several, are added as {'question', 'answers'} dicts.
+
+    Returns:
+    - int: The updated question number.
+    """
+    numbering = QuestionNumbering(question_numbers)
+    data.extend(format_bank(questions, profile, numbering, report))
+    return numbering.number
+
 # Function to process questions and options
-def question_create(doc, current_question: str, current_options: list, highlights: list, data: list, platform: str, selected_options: list, question_numbers: int) -> int:
+def question_create(lines, marks: dict, data: list, selected_options: list, question_numbers: int, report: list = None) -> int:
     """
     Process a document to create quiz questions and options based on specific formatting.
     The document structure and formatting rules must align with the processing logic for accurate results.
     
     Parameters:
-    - doc: The document object to process.
-    - current_question: The current question being processed.
-    - current_options: The list of current options being processed.
-    - highlights: The list of highlights being processed.
-    - data: The list of data being processed.
-    - platform: The platform for which the quiz is being created.
-    - selected_options: The list of selected options being processed.
+    - lines: An iterable over the lines of text of the document, as returned by format_file.
+    - marks: The answer marks of the lines, as returned by format_file.
+    - data: The list of quiz records being created.
+    - selected_options: The list of selected options being processed, or their ConversionProfile.
     - question_numbers: The current question number.
+    - report: A list to which the questions without an answer, or with several, are added.
     
     Returns:
     - int: The updated question number.
     """
-
-    def last_question(current_question: str, current_options: list, highlights: list, data: list, platform: str, selected_options: list, question_numbers: int) -> None:
-        if current_question and len(current_options) > 0:
-            current_question, current_options = process_formats(current_question, current_options, selected_options, question_numbers)
-            create_quiz(data, current_question, current_options, highlights, platform, selected_options)
-    
-    for index, paragraph in enumerate(doc.paragraphs):
-        text = paragraph.text.strip()
-        #The second condition is to handle multiple line questions, index-2 is because of how the current question is updated
-        if is_question(text) and not is_question(doc.paragraphs[index - 2].text.strip()):
-            if current_question and len(current_options) > 0:
-                current_question, current_options = process_formats(current_question, current_options, selected_options, question_numbers)
-                question_numbers += 1
-                create_quiz(data, current_question, current_options, highlights, platform, selected_options)
-            current_options.clear()  # Clear the options list for the new questions
-            current_question = text
-        elif current_question:
-            if is_option(text):
-                for option in split_options(text):
-                    current_options.append(option)
-            elif text.strip() and not is_option(doc.paragraphs[index-2].text.strip()): 
-                current_question += '\n'+text
-    # Process the last question
-    question_numbers += 1
-    last_question(current_question, current_options, highlights, data, platform, selected_options, question_numbers)
-    return question_numbers
-
+    return format_questions(parse_bank(lines, marks), data, get_profile(selected_options), question_numbers, report)
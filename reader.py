@@ -0,0 +1,388 @@
+import re
+import zipfile
+from xml.etree.ElementTree import fromstring, iterparse
+
+W = '{http://schemas.openxmlformats.org/wordprocessingml/2006/main}'
+WP = '{http://schemas.openxmlformats.org/drawingml/2006/wordprocessingDrawing}'
+A = '{http://schemas.openxmlformats.org/drawingml/2006/main}'
+V = '{urn:schemas-microsoft-com:vml}'
+MC = '{http://schemas.openxmlformats.org/markup-compatibility/2006}'
+
+# Containers whose children are read as if they were part of the paragraph
+INLINE_CONTAINERS = {f'{W}hyperlink', f'{W}smartTag', f'{W}ins', f'{W}moveTo', f'{W}fldSimple', f'{W}customXml', f'{W}dir', f'{W}bdo'}
+
+SCRIPT_CHARS = '0123456789+-=()'
+VERT_ALIGN = {
+    'subscript': (str.maketrans(SCRIPT_CHARS, '₀₁₂₃₄₅₆₇₈₉₊₋₌₍₎'), '_'),
+    'superscript': (str.maketrans(SCRIPT_CHARS, '⁰¹²³⁴⁵⁶⁷⁸⁹⁺⁻⁼⁽⁾'), '^'),
+}
+WHITESPACE = re.compile(r'[ \t\r]+')
+FALSE_VALUES = {'0', 'false', 'off', 'none'}
+# Paragraph styles whose paragraphs pandoc reads as headings, which have no list marker
+HEADING_STYLE = re.compile(r'heading [1-9]$', re.IGNORECASE)
+# The Unicode characters of the Symbol font, by their code in the font
+SYMBOL_FONT = 'Symbol'
+SYMBOL_CHARACTERS = dict(zip(range(0x20, 0x7F), ' !∀#∃%&∋()∗+,−./0123456789:;<=>?≅ΑΒΧΔΕΦΓΗΙϑΚΛΜΝΟΠΘΡΣΤΥςΩΞΨΖ[∴]⊥_‾αβχδεφγηιϕκλμνοπθρστυϖωξψζ{|}∼'))
+SYMBOL_CHARACTERS.update(zip(range(0xA0, 0xF0), '€ϒ′≤⁄∞ƒ♣♦♥♠↔←↑→↓°±″≥×∝∂•÷≠≡≈…⏐⎯↵ℵℑℜ℘⊗⊕∅∩∪⊃⊇⊄⊂⊆∈∉∠∇®©™∏√⋅¬∧∨⇔⇐⇑⇒⇓◊〈®©™∑⎛⎜⎝⎡⎢⎣⎧⎨⎩⎪'))
+SYMBOL_CHARACTERS.update(zip(range(0xF1, 0xFF), '〉∫⌠⎮⌡⎞⎟⎠⎤⎥⎦⎫⎬⎭'))
+# Characters python-docx puts in run.text for these elements
+RUN_CHARACTERS = {f'{W}tab': '\t', f'{W}br': '\n', f'{W}cr': '\n'}
+
+
+# Helper function to turn a list counter into the marker pandoc would print
+def format_marker(counter: int, num_fmt: str, lvl_text: str) -> str:
+    """Render a list number the way pandoc's plain writer does (e.g. 'A.', '1)', '(c)')."""
+    if num_fmt == 'bullet':
+        return '-'
+    if num_fmt in ('upperLetter', 'lowerLetter'):
+        letters = ''
+        while counter > 0:
+            counter, rest = divmod(counter - 1, 26)
+            letters = chr(ord('A') + rest) + letters
+        number = letters if num_fmt == 'upperLetter' else letters.lower()
+    elif num_fmt in ('upperRoman', 'lowerRoman'):
+        number = ''
+        for value, numeral in ((1000, 'M'), (900, 'CM'), (500, 'D'), (400, 'CD'), (100, 'C'), (90, 'XC'),
+                               (50, 'L'), (40, 'XL'), (10, 'X'), (9, 'IX'), (5, 'V'), (4, 'IV'), (1, 'I')):
+            while counter >= value:
+                number += numeral
+                counter -= value
+        number = number if num_fmt == 'upperRoman' else number.lower()
+    else:
+        number = str(counter)
+
+    if lvl_text.startswith('(') and lvl_text.endswith(')'):
+        return f'({number})'
+    if lvl_text.endswith(')'):
+        return f'{number})'
+    return f'{number}.'
+
+def read_numbering(root) -> dict:
+    """
+    Read the list definitions of a numbering part.
+
+    Parameters:
+    - root: The <w:numbering> element, or None if the document has no lists.
+
+    Returns:
+    - dict: Maps (numId, ilvl) to a (start, numFmt, lvlText) tuple.
+    """
+    numbering = {}
+    if root is None:
+        return numbering
+
+    def read_level(lvl, defaults: tuple) -> tuple:
+        start, num_fmt, lvl_text = defaults
+        for child in lvl:
+            if child.tag == f'{W}start':
+                start = int(child.get(f'{W}val', start))
+            elif child.tag == f'{W}numFmt':
+                num_fmt = child.get(f'{W}val', num_fmt)
+            elif child.tag == f'{W}lvlText':
+                lvl_text = child.get(f'{W}val', lvl_text)
+        return start, num_fmt, lvl_text
+
+    abstract_levels = {}
+    for abstract in root.iter(f'{W}abstractNum'):
+        abstract_levels[abstract.get(f'{W}abstractNumId')] = {
+            lvl.get(f'{W}ilvl'): read_level(lvl, (1, 'decimal', '%1.')) for lvl in abstract.iter(f'{W}lvl')
+        }
+
+    for num in root.iter(f'{W}num'):
+        num_id = num.get(f'{W}numId')
+        abstract_id = num.find(f'{W}abstractNumId')
+        levels = dict(abstract_levels.get(abstract_id.get(f'{W}val') if abstract_id is not None else None, {}))
+        for override in num.iter(f'{W}lvlOverride'):
+            ilvl = override.get(f'{W}ilvl')
+            level = levels.get(ilvl, (1, 'decimal', '%1.'))
+            for child in override:
+                if child.tag == f'{W}startOverride':
+                    level = (int(child.get(f'{W}val', level[0])), level[1], level[2])
+                elif child.tag == f'{W}lvl':
+                    level = read_level(child, level)
+            levels[ilvl] = level
+        for ilvl, level in levels.items():
+            numbering[(num_id, ilvl)] = level
+    return numbering
+
+def read_heading_styles(root) -> frozenset:
+    """
+    Read the paragraph styles that make a paragraph a heading.
+
+    Parameters:
+    - root: The <w:styles> element, or None if the document has no styles.
+
+    Returns:
+    - frozenset: The ids of the styles named 'heading 1' to 'heading 9', and of the styles based on them.
+    """
+    if root is None:
+        return frozenset()
+    styles = {}
+    for style in root.iter(f'{W}style'):
+        if style.get(f'{W}type', 'paragraph') != 'paragraph':
+            continue
+        name = style.find(f'{W}name')
+        based_on = style.find(f'{W}basedOn')
+        styles[style.get(f'{W}styleId')] = (name.get(f'{W}val', '') if name is not None else '',
+                                             based_on.get(f'{W}val') if based_on is not None else None)
+
+    def is_heading(style_id: str) -> bool:
+        # A chain of styles cannot be longer than the styles, which stops the loops of a damaged file
+        for _ in range(len(styles)):
+            if style_id not in styles:
+                return False
+            name, style_id = styles[style_id]
+            if HEADING_STYLE.match(name):
+                return True
+        return False
+    return frozenset(style_id for style_id in styles if is_heading(style_id))
+
+def list_marker(p, numbering: dict, counters: dict, headings: frozenset = frozenset()) -> str:
+    """Return the list marker of a paragraph and advance its counter, or '' if it is not numbered or is a heading."""
+    ppr = p.find(f'{W}pPr')
+    num_pr = ppr.find(f'{W}numPr') if ppr is not None else None
+    if num_pr is None:
+        return ''
+    # pandoc prints numbered headings without their number, and they do not count as list items
+    style = ppr.find(f'{W}pStyle')
+    if style is not None and style.get(f'{W}val') in headings:
+        return ''
+    num_id = num_pr.find(f'{W}numId')
+    ilvl = num_pr.find(f'{W}ilvl')
+    num_id = num_id.get(f'{W}val') if num_id is not None else None
+    ilvl = ilvl.get(f'{W}val', '0') if ilvl is not None else '0'
+    return level_marker(num_id, ilvl, numbering, counters)
+
+def level_marker(num_id: str, ilvl: str, numbering: dict, counters: dict) -> str:
+    """Return the marker of the next item of a list level and advance its counter, or '' if the level is not defined."""
+    level = numbering.get((num_id, ilvl))
+    if level is None:
+        return ''
+
+    start, num_fmt, lvl_text = level
+    counter = counters.get((num_id, ilvl), start - 1) + 1
+    counters[(num_id, ilvl)] = counter
+    # A new item on an outer level restarts the numbering of the levels below it, in every list as pandoc does
+    for key in [key for key in counters if int(key[1]) > int(ilvl)]:
+        del counters[key]
+    return format_marker(counter, num_fmt, lvl_text)
+
+def run_text(r) -> str:
+    """Return the visible text of a <w:r>, with tabs as spaces, soft returns as newlines and pictures as pandoc prints them."""
+    rpr = r.find(f'{W}rPr')
+    fonts = rpr.find(f'{W}rFonts') if rpr is not None else None
+    symbol_font = fonts is not None and SYMBOL_FONT in (fonts.get(f'{W}ascii'), fonts.get(f'{W}hAnsi'))
+    vert_align = rpr.find(f'{W}vertAlign') if rpr is not None else None
+    align = vert_align.get(f'{W}val') if vert_align is not None else None
+    # The text since the last picture, and what is printed before it: pictures are never sub/superscripted
+    parts, printed = [], []
+    for child in r:
+        tag = child.tag
+        if tag == f'{W}t':
+            text = child.text or ''
+            parts.append(''.join(symbol_character(SYMBOL_FONT, ord(c)) for c in text) if symbol_font else text)
+        elif tag in (f'{W}tab', f'{W}ptab'):
+            parts.append(' ')
+        elif tag == f'{W}br':
+            if child.get(f'{W}type', 'textWrapping') == 'textWrapping':
+                parts.append('\n')
+        elif tag == f'{W}cr':
+            parts.append('\n')
+        elif tag == f'{W}noBreakHyphen':
+            parts.append('‑')
+        elif tag == f'{W}sym':
+            parts.append(symbol_character(child.get(f'{W}font'), int(child.get(f'{W}char', '20'), 16)))
+        elif tag in (f'{W}drawing', f'{W}pict', f'{W}object', f'{MC}AlternateContent'):
+            if tag == f'{MC}AlternateContent':
+                # The first choice is the one Word shows, the fallback is an older rendering of it
+                choice = child.find(f'{MC}Choice')
+                pictures = [element for element in choice if element.tag in (f'{W}drawing', f'{W}pict')] if choice is not None else []
+            else:
+                pictures = [child]
+            printed.append(script_text(''.join(parts), align))
+            printed.extend(picture_text(picture) for picture in pictures)
+            parts.clear()
+    printed.append(script_text(''.join(parts), align))
+    return ''.join(printed)
+
+def symbol_character(font: str, code: int) -> str:
+    """
+    Return the Unicode character of a character of a symbol font.
+
+    Symbol font characters are given by their code in the font (0x20-0xFF), or in the private use area (0xF020-0xF0FF)
+    as w:sym gives them. Those of the Symbol font are Greek letters and math signs, the others are left as they are given.
+    """
+    if font == SYMBOL_FONT and (code < 0x100 or 0xF000 <= code < 0xF100):
+        return SYMBOL_CHARACTERS.get(code & 0xFF, chr(code))
+    return chr(code)
+
+def picture_text(element) -> str:
+    """Return what pandoc prints for a <w:drawing>, <w:pict> or <w:object> (an equation): '[description]' for a picture, '' for a shape or a text box."""
+    if element.tag == f'{W}drawing':
+        if next(element.iter(f'{A}blip'), None) is None:
+            return ''
+        properties = next(element.iter(f'{WP}docPr'), None)
+        description = properties.get('descr', '') if properties is not None else ''
+        return f"[{' '.join(description.split())}]"
+    return '[]' if next(element.iter(f'{V}imagedata'), None) is not None else ''
+
+def script_text(text: str, align: str) -> str:
+    """
+    Return the text of a 'subscript' or 'superscript' run as pandoc's plain writer prints it: in Unicode sub/superscripts when it can, as _() or ^() otherwise.
+
+    The spaces around the text are left outside the script, as pandoc moves them out of the formatting.
+    """
+    core = text.strip()
+    if align in VERT_ALIGN and core:
+        table, prefix = VERT_ALIGN[align]
+        start = text.index(core)
+        script = core.translate(table) if all(c in SCRIPT_CHARS for c in core) else f'{prefix}({core})'
+        text = text[:start] + script + text[start + len(core):]
+    return text
+
+def iter_runs(parent):
+    """Yield the <w:r> elements of a paragraph in reading order, descending into links, insertions and content controls."""
+    for child in parent:
+        tag = child.tag
+        if tag == f'{W}r':
+            yield child
+        elif tag in INLINE_CONTAINERS:
+            yield from iter_runs(child)
+        elif tag == f'{W}sdt':
+            content = child.find(f'{W}sdtContent')
+            if content is not None:
+                yield from iter_runs(content)
+
+def iter_paragraphs(parent):
+    """Yield the <w:p> elements of a body in reading order, including those inside tables and content controls."""
+    for child in parent:
+        tag = child.tag
+        if tag == f'{W}p':
+            yield child
+        elif tag in (f'{W}tbl', f'{W}tr', f'{W}tc', f'{W}sdtContent', f'{W}customXml'):
+            yield from iter_paragraphs(child)
+        elif tag == f'{W}sdt':
+            content = child.find(f'{W}sdtContent')
+            if content is not None:
+                yield from iter_paragraphs(content)
+
+def paragraph_lines(p, numbering: dict, counters: dict, headings: frozenset = frozenset()) -> list:
+    """
+    Return the lines of a paragraph as pandoc's plain writer would print them.
+
+    Soft returns split the paragraph into several lines, runs of whitespace are collapsed,
+    and numbered paragraphs get their list marker ('A.  ', '1.  ', ...) in front of the first line.
+    An empty list means the paragraph has no text and pandoc would drop it.
+
+    Parameters:
+    - p: The <w:p> element.
+    - numbering: The list definitions returned by read_numbering.
+    - counters: The running list counters of the document, updated in place.
+    - headings: The heading styles of the document, see read_heading_styles.
+    """
+    marker = list_marker(p, numbering, counters, headings)
+    return text_lines(''.join(run_text(r) for r in iter_runs(p)), marker)
+
+def text_lines(text: str, marker: str = '') -> list:
+    """Split the text of a paragraph into its lines and put its list marker in front of the first one, see paragraph_lines."""
+    lines = [WHITESPACE.sub(' ', line).strip() for line in text.split('\n')]
+
+    # Leading and trailing soft returns are trimmed, like pandoc does
+    while lines and not lines[0]:
+        lines.pop(0)
+    while lines and not lines[-1]:
+        lines.pop()
+    if lines and marker:
+        # Ordered markers are padded to four characters, bullets are followed by a single space
+        lines[0] = marker + (' ' if marker == '-' else ' ' * max(4 - len(marker), 1)) + lines[0]
+    return lines
+
+def run_formats(r) -> tuple:
+    """Return the (text, bold, italic, underline, highlight) flags of a <w:r> from its direct formatting."""
+    bold = italic = underline = highlight = False
+    rpr = r.find(f'{W}rPr')
+    if rpr is not None:
+        for child in rpr:
+            tag = child.tag
+            if tag == f'{W}b':
+                bold = child.get(f'{W}val', 'true') not in FALSE_VALUES
+            elif tag == f'{W}i':
+                italic = child.get(f'{W}val', 'true') not in FALSE_VALUES
+            elif tag == f'{W}u':
+                underline = child.get(f'{W}val', 'none') not in FALSE_VALUES
+            elif tag == f'{W}highlight':
+                highlight = child.get(f'{W}val', 'none') not in FALSE_VALUES
+    text = ''.join(child.text or '' if child.tag == f'{W}t' else RUN_CHARACTERS.get(child.tag, '') for child in r)
+    return text, bold, italic, underline, highlight
+
+def stream_document(file_path: str):
+    """
+    Read a .docx file straight from its zip archive, without building the whole document tree.
+
+    word/document.xml is parsed incrementally and every paragraph is discarded as soon as it has been read,
+    so memory stays bounded by a single paragraph however large the document is.
+
+    Parameters:
+    - file_path: The path to the .docx file.
+
+    Yields:
+    - tuple: The lines of the paragraph (see paragraph_lines) and the (text, bold, italic, underline, highlight)
+      flags of its runs, for every paragraph in reading order.
+    """
+    with zipfile.ZipFile(file_path) as archive:
+        numbering = read_archive_numbering(archive)
+        headings = read_archive_headings(archive)
+        with archive.open('word/document.xml') as document:
+            yield from iter_document(document, numbering, {}, headings)
+
+def read_archive_numbering(archive: zipfile.ZipFile) -> dict:
+    """Return the list levels of an open .docx archive (see read_numbering), empty if the document has no lists."""
+    try:
+        return read_numbering(fromstring(archive.read('word/numbering.xml')))
+    except KeyError:
+        # The document has no lists
+        return {}
+
+def read_archive_headings(archive: zipfile.ZipFile) -> frozenset:
+    """Return the heading styles of an open .docx archive (see read_heading_styles), empty if the document has no styles."""
+    try:
+        return read_heading_styles(fromstring(archive.read('word/styles.xml')))
+    except KeyError:
+        # The document has no styles
+        return frozenset()
+
+def iter_document(document, numbering: dict, counters: dict, headings: frozenset = frozenset()):
+    """
+    Parse the XML of a document body incrementally, see stream_document.
+
+    Parameters:
+    - document: A binary file object over word/document.xml, or over a part of its body wrapped in the same root and body elements.
+    - numbering: The list levels of the document, see read_numbering.
+    - counters: The running list counters, updated in place.
+    - headings: The heading styles of the document, see read_heading_styles.
+
+    Yields:
+    - tuple: The lines and the run flags of every paragraph in reading order, see stream_document.
+    """
+    # Open elements, so finished blocks can be detached from their parent
+    stack = []
+    depth = 0
+    for event, element in iterparse(document, events=('start', 'end')):
+        if event == 'start':
+            stack.append(element)
+            if element.tag == f'{W}p':
+                depth += 1
+            continue
+
+        stack.pop()
+        if element.tag == f'{W}p':
+            depth -= 1
+            # Paragraphs nested in another paragraph (text boxes) are not part of the text flow
+            if depth:
+                continue
+            yield paragraph_lines(element, numbering, counters, headings), [run_formats(r) for r in iter_runs(element)]
+        elif depth or element.tag not in (f'{W}tbl', f'{W}sdt', f'{W}customXml'):
+            continue
+        element.clear()
+        if stack:
+            stack[-1].remove(element)
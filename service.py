@@ -0,0 +1,365 @@
+import io
+import os
+import sys
+import json
+import time
+import base64
+import shutil
+import argparse
+import tempfile
+import threading
+import socketserver
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from multiprocessing import freeze_support
+from backends import BACKENDS, ConversionUnavailable, ConverterSession, UnavailableBackend
+from batch import read_file
+from cache import WarmBankCache
+from dedup import DuplicateIndex
+from export import PLATFORM_COLUMNS, WRITERS
+from main import QuestionNumbering, format_bank
+from utils import ConversionProfile, save_sheets
+
+# The options of a job that gives none: fix the formatting, answers in bold (the defaults of the command line)
+DEFAULT_OPTIONS = ["Sửa lỗi định dạng", "Bôi đen"]
+DEFAULT_PORT = 8765
+# The stages whose latencies are reported by the stats request, and the number of latest jobs they are computed on
+STAGES = ('queue', 'read', 'format', 'export', 'total')
+HISTORY = 1000
+PERCENTILES = (50, 90, 99)
+
+# The bank cache and the converter of the process running the jobs, see start_worker
+worker_cache = None
+worker_converter = None
+
+
+def start_worker(cache_directory: str = None, backend: str = None) -> None:
+    """
+    Prepare a process to run jobs: its bank cache, its converter, and the modules the first job would otherwise import.
+
+    Worker processes get no backend, so the documents only Word can read are handed back to the service (see ConversionService).
+    """
+    global worker_cache, worker_converter
+    worker_cache = WarmBankCache(cache_directory)
+    worker_converter = ConverterSession(BACKENDS[backend]() if backend else UnavailableBackend(), retries=1 if backend else 0)
+    # openpyxl is only imported when a sheet is saved, which would slow down the first job of every worker
+    import openpyxl  # noqa: F401
+
+def stop_worker() -> None:
+    """Stop the converter of the thread running the jobs, which must be the thread that started it (see WordBackend)."""
+    if worker_converter is not None:
+        worker_converter.close()
+
+def convert_job(job: dict, converter: ConverterSession = None) -> dict:
+    """
+    Convert a document and save its sheets.
+
+    Parameters:
+    - job: The 'path' of the document, or its 'data' in base64 with its file 'name';
+      the selected 'options' (as named in the GUI, default DEFAULT_OPTIONS), the 'platforms' (default ["Quizizz"]),
+      the 'format' of the sheets ("xlsx" or "csv") and the 'output' directory to save them in.
+      Without an output directory, the sheets are returned in base64 instead of being kept.
+    - converter: The converter for the .doc files the built-in reader does not support. Defaults to the one of the worker.
+
+    Returns:
+    - dict: The 'questions' count, the answer 'warnings', the 'duplicates' found, whether the bank was 'cached',
+      the sheets by platform ('outputs', or 'sheets' when they are returned), the seconds of each stage ('timings')
+      and when the job 'started', as a time.time() timestamp.
+
+    Raises:
+    - ValueError: If the job is not valid or the file is not a Word document.
+    - ConversionUnavailable: If only Word can read the document and the converter does not drive it.
+    """
+    started = time.time()
+    timings = {}
+    platforms = job.get('platforms') or [job.get('platform') or "Quizizz"]
+    extension = f".{job.get('format', 'xlsx')}"
+    if extension not in WRITERS:
+        raise ValueError(f"Unknown format: {job.get('format')}")
+    for platform in platforms:
+        if platform not in PLATFORM_COLUMNS:
+            raise ValueError(f"Unknown platform: {platform}")
+    profile = ConversionProfile(job.get('options') or DEFAULT_OPTIONS)
+
+    temp_directory = tempfile.mkdtemp(prefix='wteService')
+    try:
+        if job.get('path'):
+            file_path = job['path']
+        elif job.get('data') is not None and job.get('name'):
+            file_path = os.path.join(temp_directory, os.path.basename(job['name']))
+            with open(file_path, 'wb') as file:
+                file.write(base64.b64decode(job['data']))
+        else:
+            raise ValueError("A job needs the 'path' of a document, or its 'data' and 'name'")
+
+        start = time.perf_counter()
+        key = worker_cache.key(file_path)
+        bank = worker_cache.get(key)
+        cached = bank is not None
+        if bank is None:
+            bank = read_file(file_path, converter or worker_converter)
+            worker_cache.put(key, bank)
+        timings['read'] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        parsed = bank['questions']
+        warnings, duplicates = [], []
+        if profile.deduplicate:
+            parsed = DuplicateIndex(profile).filter(parsed, file_path, duplicates)
+        records = format_bank(parsed, profile, QuestionNumbering(), warnings)
+        timings['format'] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        output_directory = job.get('output') or os.path.join(temp_directory, 'sheets')
+        outputs = save_sheets(records, file_path, platforms, profile, open_file=False,
+                              extension=extension, output_directory=output_directory)
+        response = {'questions': len(records), 'warnings': warnings, 'duplicates': duplicates, 'cached': cached}
+        if job.get('output'):
+            response['outputs'] = outputs
+        else:
+            sheets = {}
+            for platform, output_path in outputs.items():
+                with open(output_path, 'rb') as file:
+                    sheets[platform] = base64.b64encode(file.read()).decode('ascii')
+            response['sheets'] = sheets
+        timings['export'] = time.perf_counter() - start
+    finally:
+        shutil.rmtree(temp_directory, ignore_errors=True)
+    response['timings'] = timings
+    response['started'] = started
+    return response
+
+# Helper function
+def failure(error: Exception) -> dict:
+    """Return the response of a job stopped by an error."""
+    return {'ok': False, 'error': str(error) or type(error).__name__}
+
+# Helper function
+def percentile(values: list, percent: int) -> float:
+    """Return the nearest-rank percentile of sorted values."""
+    return values[max(0, -(-len(values) * percent // 100) - 1)]
+
+class ConversionService:
+    """
+    Run conversion jobs on a bounded pool of warm workers.
+
+    The workers keep their modules imported and the banks they read in memory (see cache.WarmBankCache),
+    so a job only pays for reading a new document and saving its sheets.
+    At most `workers` jobs run at once and `queue_size` more wait; submitting a job past that blocks until one finishes,
+    which stops reading requests and so pushes back on the client.
+    The documents only Word can read are converted by a single thread of the service, since every process would drive the same Word instance.
+    """
+
+    def __init__(self, workers: int = None, queue_size: int = None, cache_directory: str = None, backend: str = "word"):
+        self.workers = workers or os.cpu_count() or 1
+        self.queue_size = self.workers * 2 if queue_size is None else queue_size
+        if self.workers > 1:
+            self.executor = ProcessPoolExecutor(self.workers, initializer=start_worker, initargs=(cache_directory,))
+            # Start the workers now rather than on the first jobs, which would wait for them
+            for future in [self.executor.submit(time.sleep, 0.05) for _ in range(self.workers)]:
+                future.result()
+        else:
+            self.executor = ThreadPoolExecutor(1, initializer=start_worker, initargs=(cache_directory, backend))
+        # Jobs handed back by the worker processes, whose converter drives Word for the whole service.
+        # A single worker runs in this process and drives Word itself, so nothing is handed back
+        self.word = self.executor
+        if self.workers > 1:
+            self.word = ThreadPoolExecutor(1, initializer=start_worker, initargs=(cache_directory, backend))
+        self.slots = threading.BoundedSemaphore(self.workers + self.queue_size)
+        self.lock = threading.Lock()
+        self.pending = 0
+        self.completed = 0
+        self.failed = 0
+        self.latencies = {stage: deque(maxlen=HISTORY) for stage in STAGES}
+
+    def handle(self, request: dict, reply) -> None:
+        """
+        Handle a request: a 'convert' job (the default, see convert_job) or 'stats'.
+
+        reply is called with the response, from another thread for a job. The response has the 'id' of the request,
+        'ok' and the result of the job, or the 'error' that stopped it.
+        """
+        operation = request.get('op', 'convert')
+        if operation == 'stats':
+            reply(dict(self.stats(), id=request.get('id'), ok=True))
+        elif operation == 'convert':
+            self.submit(request, reply)
+        else:
+            reply({'id': request.get('id'), 'ok': False, 'error': f"Unknown operation: {operation}"})
+
+    def submit(self, job: dict, reply) -> None:
+        """Queue a job, waiting for a free slot if the queue is full; a job the executor refuses fails and gives its slot back."""
+        self.slots.acquire()
+        with self.lock:
+            self.pending += 1
+        submitted = time.time()
+        try:
+            future = self.executor.submit(convert_job, job)
+        except Exception as error:
+            # The executor is shut down or broken, so the job never runs and finish is not called for it
+            self.record(job, failure(error), reply)
+            return
+        future.add_done_callback(lambda future: self.finish(job, future, reply, submitted))
+
+    def finish(self, job: dict, future, reply, submitted: float) -> None:
+        """Record a finished job and reply, or hand it to the Word thread if only Word can read its document."""
+        try:
+            response = future.result()
+        except ConversionUnavailable:
+            try:
+                retry = self.word.submit(convert_job, job)
+            except Exception as error:
+                response = failure(error)
+            else:
+                retry.add_done_callback(lambda retry: self.finish(job, retry, reply, submitted))
+                return
+        except Exception as error:
+            response = failure(error)
+        else:
+            response['ok'] = True
+            finished = time.time()
+            with self.lock:
+                self.latencies['queue'].append(response.pop('started') - submitted)
+                for stage in ('read', 'format', 'export'):
+                    self.latencies[stage].append(response['timings'][stage])
+                self.latencies['total'].append(finished - submitted)
+        self.record(job, response, reply)
+
+    def record(self, job: dict, response: dict, reply) -> None:
+        """Count a job that is over, free its slot and reply."""
+        with self.lock:
+            self.pending -= 1
+            if response['ok']:
+                self.completed += 1
+            else:
+                self.failed += 1
+        self.slots.release()
+        response['id'] = job.get('id')
+        reply(response)
+
+    def stats(self) -> dict:
+        """
+        Return the health of the service: the 'queue_depth' (jobs waiting or running), the 'workers', the jobs 'completed' and 'failed',
+        and the 50th, 90th and 99th percentile of the seconds each stage took over the latest jobs ('latency').
+        """
+        with self.lock:
+            latency = {}
+            for stage, values in self.latencies.items():
+                values = sorted(values)
+                latency[stage] = {f'p{percent}': percentile(values, percent) for percent in PERCENTILES} if values else {}
+            return {
+                'status': 'ok',
+                'queue_depth': self.pending,
+                'workers': self.workers,
+                'queue_size': self.queue_size,
+                'completed': self.completed,
+                'failed': self.failed,
+                'latency': latency,
+            }
+
+    def close(self) -> None:
+        """Wait for the jobs submitted and stop the workers."""
+        if self.word is not self.executor:
+            # Jobs handed back by the worker processes are submitted to the Word thread until they are done
+            self.executor.shutdown(wait=True)
+        # The converter is stopped on the thread that drives it, once the jobs queued before are done
+        self.word.submit(stop_worker).result()
+        self.word.shutdown(wait=True)
+
+class Connection:
+    """A stream of requests and responses as lines of JSON, whose responses may come from several threads and in any order."""
+
+    def __init__(self, service: ConversionService, output):
+        self.service = service
+        self.output = output
+        self.lock = threading.Lock()
+        self.done = threading.Condition(self.lock)
+        self.waiting = 0
+
+    def reply(self, response: dict) -> None:
+        """Write a response as a line of JSON."""
+        line = json.dumps(response, ensure_ascii=False) + '\n'
+        with self.lock:
+            try:
+                # The standard output takes text, a socket takes bytes
+                self.output.write(line if isinstance(self.output, io.TextIOBase) else line.encode('utf-8'))
+                self.output.flush()
+            except (OSError, ValueError):
+                # The client went away, the job is done anyway
+                pass
+
+    def serve(self, lines) -> None:
+        """Handle every request line, then wait for their responses to be written."""
+        for line in lines:
+            if isinstance(line, bytes):
+                line = line.decode('utf-8')
+            if not line.strip():
+                continue
+            try:
+                request = json.loads(line)
+                if not isinstance(request, dict):
+                    raise ValueError("a request is a JSON object")
+            except ValueError as error:
+                self.reply({'id': None, 'ok': False, 'error': f"Invalid request: {error}"})
+                continue
+            with self.lock:
+                self.waiting += 1
+            self.service.handle(request, self.replied)
+        with self.lock:
+            while self.waiting:
+                self.done.wait()
+
+    def replied(self, response: dict) -> None:
+        """Write the response of a request and count it as answered."""
+        self.reply(response)
+        with self.lock:
+            self.waiting -= 1
+            self.done.notify_all()
+
+def serve_stdio(service: ConversionService) -> None:
+    """Serve the requests read from the standard input, one per line, until it is closed."""
+    Connection(service, sys.stdout).serve(sys.stdin)
+
+def serve_socket(service: ConversionService, port: int = DEFAULT_PORT) -> None:
+    """Serve the requests of the clients connecting to localhost:port, each connection as a stream of lines, until interrupted."""
+
+    class Handler(socketserver.StreamRequestHandler):
+        def handle(self) -> None:
+            Connection(service, self.wfile).serve(self.rfile)
+
+    class Server(socketserver.ThreadingTCPServer):
+        allow_reuse_address = True
+        daemon_threads = True
+
+    with Server(('127.0.0.1', port), Handler) as server:
+        server.serve_forever()
+
+def main(argv: list = None) -> int:
+    """Run the service until the standard input is closed or, with --port, until interrupted."""
+    parser = argparse.ArgumentParser(
+        prog='python -m service',
+        description="Convert Word documents on request, as lines of JSON on the standard input/output or on a localhost port, "
+                    "keeping the workers and the parsed banks warm between requests.",
+    )
+    parser.add_argument('--port', type=int, help=f"listen on localhost:PORT instead of the standard input (e.g. {DEFAULT_PORT})")
+    parser.add_argument('-j', '--workers', type=int, help="the number of worker processes (default: the number of CPUs)")
+    parser.add_argument('--queue', type=int, help="the number of jobs waiting for a worker before new requests wait (default: twice the workers)")
+    parser.add_argument('--cache-dir', help="the directory of the cache of parsed documents")
+    arguments = parser.parse_args(argv)
+
+    service = ConversionService(arguments.workers, arguments.queue, arguments.cache_dir)
+    try:
+        if arguments.port is None:
+            serve_stdio(service)
+        else:
+            serve_socket(service, arguments.port)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        service.close()
+    return 0
+
+# Worker processes import this module too
+if __name__ == "__main__":
+    freeze_support()
+    sys.exit(main())
@@ -0,0 +1,67 @@
+import sys
+import json
+import argparse
+import subprocess
+
+# Modules that must only be loaded once they are needed: they are what made the window slow to appear
+LAZY_MODULES = ['docx', 'openpyxl', 'numpy', 'pandas', 'pypandoc', 'win32com', 'pythoncom', 'concurrent.futures']
+
+# Run in a fresh interpreter, so nothing is imported yet
+MEASURE = """
+import sys, time, json
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+print(json.dumps({{'seconds': elapsed, 'loaded': [name for name in {lazy!r} if name in sys.modules]}}))
+"""
+
+
+def measure(module: str = 'gui', runs: int = 5) -> dict:
+    """
+    Import a module in fresh interpreters and return the fastest import time and the lazy modules it loaded.
+
+    The first run also compiles the bytecode cache, so the fastest run is what a user sees on every start.
+    """
+    best = None
+    for _ in range(runs):
+        output = subprocess.run([sys.executable, '-c', MEASURE.format(module=module, lazy=LAZY_MODULES)],
+                                capture_output=True, text=True, check=True).stdout
+        result = json.loads(output)
+        if best is None or result['seconds'] < best['seconds']:
+            best = result
+    return best
+
+def slowest_imports(module: str = 'gui', count: int = 10) -> list:
+    """Return the (cumulative microseconds, name) of the slowest imports of a module, from python -X importtime."""
+    output = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'], capture_output=True, text=True, check=True).stderr
+    imports = []
+    # Lines look like "import time:  self | cumulative | name", after a header line
+    for line in output.splitlines()[1:]:
+        _, cumulative, name = line.split('|')
+        imports.append((int(cumulative), name.strip()))
+    return sorted(imports, reverse=True)[:count]
+
+def main(argv: list = None) -> int:
+    """Check the import time of the GUI against the budget, return 1 when it is over budget or loads a lazy module."""
+    parser = argparse.ArgumentParser(description="Fail when starting the application becomes slow again.")
+    parser.add_argument('--module', default='gui', help="the module started by the application (default: gui)")
+    parser.add_argument('--budget', type=float, default=0.25, help="the maximum import time in seconds (default: 0.25)")
+    parser.add_argument('--runs', type=int, default=5, help="the number of measurements, the fastest one is kept (default: 5)")
+    arguments = parser.parse_args(argv)
+
+    result = measure(arguments.module, arguments.runs)
+    print(f"import {arguments.module}: {result['seconds'] * 1000:.0f} ms (budget {arguments.budget * 1000:.0f} ms)")
+
+    failed = False
+    if result['loaded']:
+        print(f"Loaded at startup, should be imported on first use: {', '.join(result['loaded'])}")
+        failed = True
+    if result['seconds'] > arguments.budget:
+        print("Over budget, the slowest imports are:")
+        for cumulative, name in slowest_imports(arguments.module):
+            print(f"  {cumulative / 1000:8.1f} ms  {name}")
+        failed = True
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
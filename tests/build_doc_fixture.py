@@ -0,0 +1,193 @@
+"""
+Build tests/fixtures/questions.doc, a small Word 97-2003 document for the tests of doc_reader.
+
+The file is written field by field, with only the structures doc_reader reads: the FIB, a single UTF-16 piece,
+one CHPX and one PAPX page, the font table, and a simple lettered list used by several lists (LFO). Run it again after changing PARAGRAPHS:
+
+    python tests/build_doc_fixture.py
+"""
+import os
+import struct
+
+SECTOR_SIZE = 512
+FREE_SECTOR, END_OF_CHAIN, FAT_SECTOR = 0xFFFFFFFF, 0xFFFFFFFE, 0xFFFFFFFD
+NO_STREAM = 0xFFFFFFFF
+# Where the text starts in the WordDocument stream, after the FIB
+TEXT_FC = 1024
+
+BOLD = struct.pack('<HB', 0x0835, 1)
+HIGHLIGHT = struct.pack('<HB', 0x2A0C, 7)
+# A special run whose characters do not stand for a symbol: none of its text is visible
+SPECIAL = struct.pack('<HB', 0x0855, 1)
+# A special run whose characters stand for the 'g' of the Symbol font, a gamma
+GAMMA = SPECIAL + struct.pack('<HHH', 0x6A09, 1, 0xF067)
+FONTS = ['Times New Roman', 'Symbol']
+
+# The (runs, list) of every paragraph, runs being (text, character sprms) and list the 1-based LFO, 0 if not numbered.
+# The paragraph mark takes the formatting of the last run.
+PARAGRAPHS = [
+    ([("Câu 1. ", BOLD), ("Thủ đô của Việt Nam là", b'')], 0),
+    ([("Hà Nội", BOLD)], 1),
+    ([("Huế", b'')], 1),
+    ([("Đà Nẵng", b'')], 1),
+    ([("Cần Thơ", b'')], 1),
+    ([("Câu 2. Nguyên tố nào là kim loại?", b'')], 0),
+    ([("Oxy", b'')], 2),
+    ([("Sắt", HIGHLIGHT)], 2),
+    ([("Nitơ", b'')], 2),
+    ([("Clo", b'')], 2),
+    # The special run spans the end of this paragraph and the whole next one, an empty item that still takes the letter A
+    ([("Câu 3. Số nào là số chẵn?", b''), ("xyz", SPECIAL)], 0),
+    ([("uvw", SPECIAL)], 3),
+    ([("7", b'')], 3),
+    ([("8", BOLD)], 3),
+    ([("9", b'')], 3),
+    # The picture character of a special run is printed as pandoc prints a picture
+    ([("Câu 4. Tia ", b''), ("(", GAMMA), (" có bước sóng ngắn nhất là", b'')], 0),
+    ([("\x01", SPECIAL)], 4),
+    ([("Tia X", b'')], 4),
+]
+
+
+def formatted_page(runs: list, entry_size: int, property_bytes) -> bytes:
+    """
+    Lay out a formatted disk page (FKP) of (start fc, end fc, grpprl) runs.
+
+    entry_size is 1 for CHPX pages and 13 for PAPX pages; property_bytes returns the stored properties of a grpprl.
+    """
+    page = bytearray(SECTOR_SIZE)
+    count = len(runs)
+    struct.pack_into(f'<{count + 1}I', page, 0, *[start for start, _, _ in runs], runs[-1][1])
+    end = SECTOR_SIZE - 1
+    for index, (_, _, grpprl) in enumerate(runs):
+        if not grpprl:
+            continue
+        data = property_bytes(grpprl)
+        end = (end - len(data)) & ~1
+        page[end:end + len(data)] = data
+        page[(count + 1) * 4 + index * entry_size] = end // 2
+    page[SECTOR_SIZE - 1] = count
+    return bytes(page)
+
+def papx(grpprl: bytes) -> bytes:
+    """A PapxInFkp: the size in words, then the style (0) and the sprms."""
+    data = b'\x00\x00' + grpprl
+    if len(data) % 2 == 0:
+        data += b'\x00'
+    return bytes([(len(data) + 1) // 2]) + data
+
+def word_stream(text: str, chpx_runs: list, papx_runs: list, table_fc_lcb: dict) -> bytes:
+    """The WordDocument stream: the FIB, the text and the two formatted pages."""
+    fib = bytearray(TEXT_FC)
+    struct.pack_into('<HH', fib, 0, 0xA5EC, 0xC1)
+    # The table stream is 1Table
+    struct.pack_into('<H', fib, 10, 0x0200)
+    struct.pack_into('<H', fib, 32, 14)
+    longs = 34 + 14 * 2
+    struct.pack_into('<H', fib, longs, 22)
+    struct.pack_into('<I', fib, longs + 2 + 3 * 4, len(text))
+    pairs = longs + 2 + 22 * 4
+    struct.pack_into('<H', fib, pairs, 93)
+    for index, (fc, lcb) in table_fc_lcb.items():
+        struct.pack_into('<II', fib, pairs + 2 + index * 8, fc, lcb)
+
+    data = bytes(fib) + text.encode('utf-16-le')
+    data += bytes(-len(data) % SECTOR_SIZE)
+    data += formatted_page(chpx_runs, 1, lambda grpprl: bytes([len(grpprl)]) + grpprl)
+    data += formatted_page(papx_runs, 13, papx)
+    return data
+
+def list_tables(count: int) -> tuple:
+    """The PlfLst of one simple list lettered "A.", and the PlfLfo of count lists using it."""
+    lstf = bytearray(28)
+    struct.pack_into('<i', lstf, 0, 1)
+    lstf[26] = 1
+    lvlf = bytearray(28)
+    struct.pack_into('<iB', lvlf, 0, 1, 3)
+    level = bytes(lvlf) + struct.pack('<H', 2) + '\x00.'.encode('utf-16-le')
+    plf_lst = struct.pack('<H', 1) + bytes(lstf) + level
+
+    lfo = bytearray(16)
+    struct.pack_into('<i', lfo, 0, 1)
+    plf_lfo = struct.pack('<I', count) + bytes(lfo) * count + struct.pack('<I', NO_STREAM) * count
+    return plf_lst, plf_lfo
+
+def font_table(fonts: list) -> bytes:
+    """The SttbfFfn of the fonts: each FFN is its size, then 39 bytes of flags, weight, PANOSE and signature before the name."""
+    table = struct.pack('<HH', len(fonts), 0)
+    for name in fonts:
+        ffn = bytes(39) + (name + '\x00').encode('utf-16-le')
+        table += bytes([len(ffn)]) + ffn
+    return table
+
+def compound_file(streams: dict) -> bytes:
+    """An OLE compound file holding the streams, each stored in regular sectors (they are all padded past the mini stream cutoff)."""
+    sectors, fat, starts = [], [], {}
+    for name, data in streams.items():
+        data += bytes(max(4096, -(-len(data) // SECTOR_SIZE) * SECTOR_SIZE) - len(data))
+        starts[name] = (len(sectors), len(data))
+        count = len(data) // SECTOR_SIZE
+        sectors.extend(data[index * SECTOR_SIZE:(index + 1) * SECTOR_SIZE] for index in range(count))
+        fat.extend(list(range(len(fat) + 1, len(fat) + count)) + [END_OF_CHAIN])
+
+    def entry(name: str, kind: int, start: int, size: int, child: int = NO_STREAM, right: int = NO_STREAM) -> bytes:
+        encoded = (name + '\x00').encode('utf-16-le')
+        data = bytearray(128)
+        data[:len(encoded)] = encoded
+        struct.pack_into('<HBBIII', data, 64, len(encoded), kind, 1, NO_STREAM, right, child)
+        struct.pack_into('<II', data, 116, start, size)
+        return bytes(data)
+
+    names = list(streams)
+    directory = entry('Root Entry', 5, END_OF_CHAIN, 0, child=1)
+    for index, name in enumerate(names):
+        directory += entry(name, 2, *starts[name], right=index + 2 if index + 1 < len(names) else NO_STREAM)
+    directory += bytes(SECTOR_SIZE - len(directory))
+    directory_sector = len(sectors)
+    sectors.append(directory)
+    fat.append(END_OF_CHAIN)
+    fat_sector = len(sectors)
+    fat.append(FAT_SECTOR)
+    fat += [FREE_SECTOR] * (SECTOR_SIZE // 4 - len(fat))
+    sectors.append(struct.pack(f'<{SECTOR_SIZE // 4}I', *fat))
+
+    header = bytearray(SECTOR_SIZE)
+    header[:8] = b'\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1'
+    struct.pack_into('<HHHHH', header, 24, 0x3E, 3, 0xFFFE, 9, 6)
+    struct.pack_into('<8I', header, 44, 1, directory_sector, 0, 4096, END_OF_CHAIN, 0, END_OF_CHAIN, 0)
+    struct.pack_into('<109I', header, 76, fat_sector, *[FREE_SECTOR] * 108)
+    return bytes(header) + b''.join(sectors)
+
+def build(paragraphs: list) -> bytes:
+    """Return the .doc file of the paragraphs."""
+    text = ''
+    chpx_runs, papx_runs = [], []
+    for runs, ilfo in paragraphs:
+        start = TEXT_FC + len(text) * 2
+        for index, (run_text, grpprl) in enumerate(runs):
+            if index == len(runs) - 1:
+                run_text += '\r'
+            run_start = TEXT_FC + len(text) * 2
+            text += run_text
+            # Adjacent runs of the same formatting are a single run, as Word saves them
+            if chpx_runs and chpx_runs[-1][2] == grpprl:
+                chpx_runs[-1] = (chpx_runs[-1][0], TEXT_FC + len(text) * 2, grpprl)
+            else:
+                chpx_runs.append((run_start, TEXT_FC + len(text) * 2, grpprl))
+        papx_runs.append((start, TEXT_FC + len(text) * 2, struct.pack('<HhHB', 0x460B, ilfo, 0x260A, 0) if ilfo else b''))
+
+    plf_lst, plf_lfo = list_tables(max(ilfo for _, ilfo in paragraphs))
+    pages = -(-(TEXT_FC + len(text) * 2) // SECTOR_SIZE)
+    end = TEXT_FC + len(text) * 2
+    bin_table = lambda page: struct.pack('<III', TEXT_FC, end, page)
+    clx = struct.pack('<BI', 2, 8 + 8) + struct.pack('<II', 0, len(text)) + struct.pack('<HIH', 0, TEXT_FC, 0)
+
+    table, table_fc_lcb = b'', {}
+    for index, data in ((33, clx), (12, bin_table(pages)), (13, bin_table(pages + 1)), (15, font_table(FONTS)), (73, plf_lst), (74, plf_lfo)):
+        table_fc_lcb[index] = (len(table), len(data))
+        table += data
+    return compound_file({'WordDocument': word_stream(text, chpx_runs, papx_runs, table_fc_lcb), '1Table': table})
+
+if __name__ == "__main__":
+    with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures', 'questions.doc'), 'wb') as file:
+        file.write(build(PARAGRAPHS))
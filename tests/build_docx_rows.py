@@ -0,0 +1,43 @@
+"""
+Build tests/fixtures/docx_rows.json, the questions pandoc's plain text gives for the sample documents of Docx/.
+
+The readers print a document the way pandoc's plain writer did before they replaced it, so the questions parsed from
+their lines must be the same as those parsed from pandoc's. Run it again with pypandoc installed after adding a sample:
+
+    python tests/build_docx_rows.py
+"""
+import glob
+import json
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from main import parse_questions
+
+# pandoc prints tables as grid text and the readers as paragraphs, which shifts every question after the table
+TABLE_DOCUMENTS = ['HDOT _ SH12 (2).docx']
+
+
+def pandoc_rows(file_path: str) -> list:
+    """Return the [question, options] of every question of a document converted by pandoc."""
+    import pypandoc
+    text = pypandoc.convert_file(file_path, 'plain', extra_args=['--wrap=none'])
+    return [[question, options] for question, options, _ in parse_questions(text.split('\n'))]
+
+if __name__ == "__main__":
+    documents = {}
+    for file_path in sorted(glob.glob(os.path.join(ROOT, 'Docx', '*.docx'))):
+        name = os.path.basename(file_path)
+        if name not in TABLE_DOCUMENTS:
+            documents[name] = pandoc_rows(file_path)
+
+    # One question per line, so a change of the fixture reads well in a diff
+    with open(os.path.join(ROOT, 'tests', 'fixtures', 'docx_rows.json'), 'w', encoding='utf-8') as file:
+        file.write('{\n')
+        for index, (name, rows) in enumerate(documents.items()):
+            file.write(f'{json.dumps(name, ensure_ascii=False)}: [\n')
+            file.write(',\n'.join(json.dumps(row, ensure_ascii=False) for row in rows))
+            file.write('\n]' + (',\n' if index + 1 < len(documents) else '\n'))
+        file.write('}\n')
@@ -0,0 +1,46 @@
+from main import QuestionNumbering, format_bank, parse_bank
+from utils import ConversionProfile, get_correct_answer
+
+BOLD = ConversionProfile(["Sửa lỗi định dạng", "Bôi đen"])
+
+# Paragraphs are separated by a blank line, as format_file returns them
+LINES = [
+    "Câu 1. Một cộng một bằng mấy?", "", "A. 1", "", "B. 2", "",
+    "Câu 2. Thủ đô của Pháp là", "", "A. Lyon", "", "B. Nice", "", "C. Paris", "", "D. Lille", "",
+    "Câu 3. Số nào là số nguyên tố?", "", "A. 2 B. 3 C. 4 D. 6",
+]
+# Line index -> letter of the marked option -> formats marking it (1 bold, 2 italic)
+MARKS = {12: {'C': 1}, 18: {'A': 1, 'B': 1, 'C': 2}}
+
+
+def convert(lines: list, marks: dict, profile: ConversionProfile = BOLD) -> tuple:
+    report = []
+    records = format_bank(parse_bank(lines, marks), profile, QuestionNumbering(), report)
+    return [record.correct_answer for record in records], report
+
+def test_answer_is_keyed_to_the_question_own_options():
+    # The mark of question 2 stays with question 2, even though question 1 has none before it
+    answers, _ = convert(LINES, MARKS)
+    assert answers[:2] == [0, 3]
+
+def test_question_without_a_marked_option():
+    answers, report = convert(LINES, MARKS)
+    assert answers[0] == 0
+    assert report[0] == {'question': "Câu 1. Một cộng một bằng mấy?", 'answers': 0}
+
+def test_question_with_several_marked_options():
+    # A and B are bold, the first one is taken and the question is reported; C is only italic
+    answers, report = convert(LINES, MARKS)
+    assert answers[2] == 1
+    assert report[1] == {'question': "Câu 3. Số nào là số nguyên tố?", 'answers': 2}
+    assert len(report) == 2
+
+def test_only_the_selected_formats_mark_an_answer():
+    answers, report = convert(LINES, MARKS, ConversionProfile(["Sửa lỗi định dạng", "In nghiêng"]))
+    assert answers == [0, 0, 3]
+    assert [entry['answers'] for entry in report] == [0, 0]
+
+def test_get_correct_answer():
+    assert get_correct_answer([0, 0, 0, 0], BOLD) == (0, 0)
+    assert get_correct_answer([0, 1, 0, 0], BOLD) == (2, 1)
+    assert get_correct_answer([0, 2, 1, 1], BOLD) == (3, 2)
@@ -0,0 +1,61 @@
+import os
+import shutil
+import pytest
+from backends import ConverterSession, FakeBackend
+from batch import iter_batch
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SAMPLE = os.path.join(ROOT, 'Docx', 'Dap an.docx')
+OPTIONS = ["Sửa lỗi định dạng", "Bôi đen"]
+
+
+def unsupported_doc(directory, name: str) -> str:
+    """
+    A .doc file the built-in reader does not support, which FakeBackend still converts.
+
+    It starts like an RTF file, so it is not a Word 97-2003 document, but the .docx sample follows:
+    zip archives are read from their end, so its copy opens as the sample.
+    """
+    path = os.path.join(directory, name)
+    with open(SAMPLE, 'rb') as sample, open(path, 'wb') as file:
+        file.write(b'{\\rtf1}' + sample.read())
+    return path
+
+def test_session_restarts_the_backend_after_a_failure(tmp_path):
+    source = str(tmp_path / 'a.doc')
+    shutil.copyfile(SAMPLE, source)
+    backend = FakeBackend(fail_on=('a.doc',))
+    with ConverterSession(backend, retries=1) as session:
+        # Nothing is started before the first conversion
+        assert backend.starts == 0
+        session.convert(source, str(tmp_path / 'a.docx'))
+        assert (backend.starts, backend.conversions) == (2, 1)
+        assert backend.running
+    assert not backend.running
+    assert os.path.exists(tmp_path / 'a.docx')
+
+def test_session_gives_up_after_its_retries(tmp_path):
+    source = str(tmp_path / 'a.doc')
+    shutil.copyfile(SAMPLE, source)
+    backend = FakeBackend(fail_on=('a.doc',))
+    with ConverterSession(backend, retries=0) as session:
+        with pytest.raises(RuntimeError):
+            session.convert(source, str(tmp_path / 'a.docx'))
+        assert not session.running
+        # The next conversion starts the backend again
+        session.convert(source, str(tmp_path / 'a.docx'))
+        assert (backend.starts, backend.conversions) == (2, 1)
+
+@pytest.mark.parametrize('workers', [1, 2])
+def test_batch_converts_unsupported_doc_files_in_the_calling_process(tmp_path, workers):
+    paths = [SAMPLE, unsupported_doc(tmp_path, 'a.doc'), unsupported_doc(tmp_path, 'b.doc')]
+    backend = FakeBackend()
+    results = list(iter_batch(paths, OPTIONS, workers=workers, backend=backend))
+    assert [result['error'] for result in results] == [None, None, None]
+    # The workers hand the documents back with ConversionUnavailable, a single session converts them all
+    assert (backend.starts, backend.conversions) == (1, 2)
+    assert not backend.running
+    expected = [record.question for record in results[0]['data']]
+    assert expected
+    for result in results[1:]:
+        assert [record.question for record in result['data']] == expected
@@ -0,0 +1,29 @@
+import os
+from cache import BankCache, WarmBankCache
+from batch import iter_batch
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SAMPLE = os.path.join(ROOT, 'Docx', 'Dap an.docx')
+OPTIONS = ["Sửa lỗi định dạng", "Bôi đen"]
+
+
+def test_a_lookup_counts_once(tmp_path):
+    cache = BankCache(str(tmp_path))
+    # The batch checks which documents are cached, then looks them up
+    assert not cache.contains('key') and cache.get('key') is None
+    assert (cache.hits, cache.misses) == (0, 1)
+    cache.put('key', {'questions': []})
+    assert cache.contains('key') and cache.get('key') == {'questions': []}
+    assert (cache.hits, cache.misses) == (1, 1)
+
+def test_warm_cache_counts_memory_hits(tmp_path):
+    cache = WarmBankCache(str(tmp_path))
+    cache.put('key', {'questions': []})
+    assert cache.contains('key') and cache.get('key') == {'questions': []}
+    assert (cache.hits, cache.misses) == (1, 0)
+
+def test_batch_counts_each_document_once(tmp_path):
+    cache = BankCache(str(tmp_path))
+    for _ in range(2):
+        assert [result['error'] for result in iter_batch([SAMPLE], OPTIONS, workers=1, cache=cache)] == [None]
+    assert (cache.hits, cache.misses) == (1, 1)
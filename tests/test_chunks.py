@@ -0,0 +1,78 @@
+import os
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+import pytest
+from batch import read_file
+from chunks import ChunkedRead, plan_chunks
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+W = 'xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main"'
+NUMBERING = (
+    f'<w:numbering {W}><w:abstractNum w:abstractNumId="0">'
+    '<w:lvl w:ilvl="0"><w:start w:val="1"/><w:numFmt w:val="decimal"/><w:lvlText w:val="%1."/></w:lvl>'
+    '<w:lvl w:ilvl="1"><w:start w:val="1"/><w:numFmt w:val="lowerLetter"/><w:lvlText w:val="%2."/></w:lvl>'
+    '</w:abstractNum><w:num w:numId="1"><w:abstractNumId w:val="0"/></w:num></w:numbering>'
+)
+
+
+def paragraph(text: str, level: int = None, bold: bool = False) -> str:
+    numbered = '' if level is None else f'<w:pPr><w:numPr><w:ilvl w:val="{level}"/><w:numId w:val="1"/></w:numPr></w:pPr>'
+    run = '<w:rPr><w:b/></w:rPr>' if bold else ''
+    # A newline is a soft return, which starts another line of the paragraph
+    text = '</w:t><w:br/><w:t xml:space="preserve">'.join(text.split('\n'))
+    return f'<w:p>{numbered}<w:r>{run}<w:t xml:space="preserve">{text}</w:t></w:r></w:p>'
+
+def sample_document(path, count: int = 24) -> str:
+    """
+    A document whose questions are the items of a single list, so their numbers depend on the counters of the chunks before,
+    with options numbered on the level below and questions going on with paragraphs and lines that read like questions too.
+    """
+    paragraphs = []
+    for number in range(count):
+        paragraphs.append(paragraph(f"Câu hỏi số {number} của đề ôn tập?", level=0))
+        if number % 5 == 4:
+            # Only the second line starts a question, the first one goes on with the question above
+            paragraphs.append(paragraph(f"Câu {number}b. Đọc đoạn văn sau.\nCâu {number}c. Trả lời câu hỏi."))
+        if number % 3 == 0:
+            # Not a new question: the paragraph two lines back is a question
+            paragraphs.append(paragraph(f"{number + 2} học sinh cùng làm bài."))
+        if number % 4 == 1:
+            paragraphs.extend(paragraph(f"Phương án {letter}", level=1, bold=letter == 2) for letter in range(4))
+        else:
+            paragraphs.extend(paragraph(f"{letter}. Phương án {letter}", bold=letter == 'C') for letter in 'ABCD')
+        if number % 5 == 2:
+            # Two questions in a row, the second one is only a line of the first
+            paragraphs.append(paragraph(f"Câu {number}b. Câu hỏi phụ"))
+            paragraphs.append(paragraph(f"Câu {number}c. Câu hỏi phụ"))
+            paragraphs.append(paragraph("A. Đúng", bold=True))
+            paragraphs.append(paragraph("B. Sai"))
+    document = f'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n<w:document {W}><w:body>{"".join(paragraphs)}<w:sectPr/></w:body></w:document>'
+    with zipfile.ZipFile(path, 'w') as archive:
+        archive.writestr('word/document.xml', document)
+        archive.writestr('word/numbering.xml', NUMBERING)
+    return str(path)
+
+
+def test_chunked_read_matches_a_single_pass(tmp_path):
+    path = sample_document(tmp_path / 'bank.docx')
+    expected = read_file(path)['questions']
+    # The list goes on through the whole document
+    assert expected[-1][0].startswith("24.")
+    size = zipfile.ZipFile(path).getinfo('word/document.xml').file_size
+    # Chunk sizes a few bytes apart, so the chunks start at every kind of paragraph
+    sizes = range(200, size // 2, 23)
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        for chunk_bytes in sizes:
+            plan = plan_chunks(path, chunk_bytes)
+            assert plan is not None and len(plan[2]) >= 2
+            bank, _ = ChunkedRead(executor, path, plan).result()
+            assert bank['questions'] == expected, chunk_bytes
+
+@pytest.mark.parametrize('chunk_bytes', [1500, 20000])
+def test_chunked_read_of_a_sample_matches_a_single_pass(chunk_bytes):
+    path = os.path.join(ROOT, 'Docx', 'Sinh.docx')
+    plan = plan_chunks(path, chunk_bytes)
+    assert plan is not None
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        bank, _ = ChunkedRead(executor, path, plan).result()
+    assert bank['questions'] == read_file(path)['questions']
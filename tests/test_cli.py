@@ -0,0 +1,14 @@
+import pytest
+from cli import parse_arguments
+
+
+@pytest.mark.parametrize('flags', [['--dedup'], ['--variants', '2']])
+def test_watch_rejects_the_options_it_does_not_apply(flags, capsys):
+    with pytest.raises(SystemExit) as exit_info:
+        parse_arguments(['--watch', 'Docx'] + flags)
+    assert exit_info.value.code == 2
+    assert f"argument {flags[0]}: not allowed with argument --watch" in capsys.readouterr().err
+
+def test_options_without_watch():
+    arguments = parse_arguments(['Docx', '--dedup', '--variants', '2'])
+    assert arguments.dedup and arguments.variants == 2 and not arguments.watch
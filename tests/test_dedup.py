@@ -0,0 +1,46 @@
+import csv
+from dedup import REPORT_COLUMNS, DuplicateIndex, save_report
+from utils import ConversionProfile
+
+BOLD = ConversionProfile(["Sửa lỗi định dạng", "Bôi đen", "Bỏ câu hỏi trùng lặp"])
+
+QUESTION = ("Câu 1. Thủ đô của nước Pháp hiện nay là thành phố nào?", ["A. Lyon", "B. Nice", "C. Paris", "D. Lille"], [0, 0, 1, 0])
+# Numbered, lettered and spaced differently, with the options in another order and the same answer marked
+RENUMBERED = ("Câu 12.  thủ đô của nước pháp hiện nay là thành phố nào", ["A. Paris", "B. Lyon", "C. Nice", "D. Lille"], [1, 0, 0, 0])
+OTHER_ANSWER = ("Câu 7. Thủ đô của nước Pháp hiện nay là thành phố nào?", ["A. Lyon", "B. Nice", "C. Paris", "D. Lille"], [1, 0, 0, 0])
+REPHRASED = ("Câu 3. Thủ đô của nước Pháp hiện nay là thành phố gì?", ["A. Lyon", "B. Nice", "C. Paris", "D. Lille"], [0, 0, 1, 0])
+
+
+def test_exact_duplicate_is_removed():
+    index, report = DuplicateIndex(BOLD), []
+    assert list(index.filter([QUESTION, RENUMBERED], "a.docx", report)) == [QUESTION]
+    assert report == [{'file': "a.docx", 'question': RENUMBERED[0], 'original_file': "a.docx", 'original': QUESTION[0],
+                       'similarity': 1.0, 'same_answer': True, 'removed': True, 'conflict': False}]
+
+def test_exact_duplicate_with_another_answer_is_kept_as_a_conflict():
+    index, report = DuplicateIndex(BOLD), []
+    # A second copy of each answer is still removed
+    kept = list(index.filter([QUESTION, OTHER_ANSWER, OTHER_ANSWER, RENUMBERED], "a.docx", report))
+    assert kept == [QUESTION, OTHER_ANSWER]
+    assert [(entry['original'], entry['same_answer'], entry['removed'], entry['conflict']) for entry in report] == [
+        (QUESTION[0], False, False, True),
+        (OTHER_ANSWER[0], True, True, False),
+        (QUESTION[0], True, True, False),
+    ]
+
+def test_near_duplicate_is_only_reported():
+    index, report = DuplicateIndex(BOLD), []
+    assert list(index.filter([QUESTION, REPHRASED], "a.docx", report)) == [QUESTION, REPHRASED]
+    assert len(report) == 1
+    assert report[0]['original'] == QUESTION[0] and not report[0]['removed'] and not report[0]['conflict']
+    assert 0.8 <= report[0]['similarity'] < 1
+
+def test_save_report(tmp_path):
+    index, report = DuplicateIndex(BOLD), []
+    list(index.filter([QUESTION, OTHER_ANSWER], "a.docx", report))
+    path = save_report(report, str(tmp_path / "bank.xlsx"))
+    assert path == str(tmp_path / "bank.duplicates.csv")
+    with open(path, encoding='utf-8-sig', newline='') as file:
+        rows = list(csv.reader(file))
+    assert rows[0] == list(REPORT_COLUMNS)
+    assert rows[1][-3:] == ["No", "No", "Yes"]
@@ -0,0 +1,34 @@
+import os
+from doc_reader import stream_doc
+from main import extract_original_format, parse_bank
+
+# Built by build_doc_fixture.py
+FIXTURE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures', 'questions.doc')
+
+
+def test_lines_and_list_markers():
+    lines = [paragraph_lines for paragraph_lines, _ in stream_doc(FIXTURE)]
+    assert lines == [
+        ['Câu 1. Thủ đô của Việt Nam là'], ['A.  Hà Nội'], ['B.  Huế'], ['C.  Đà Nẵng'], ['D.  Cần Thơ'],
+        ['Câu 2. Nguyên tố nào là kim loại?'], ['A.  Oxy'], ['B.  Sắt'], ['C.  Nitơ'], ['D.  Clo'],
+        # The empty item whose text is all in a special run still takes the letter A
+        ['Câu 3. Số nào là số chẵn?'], [], ['B.  7'], ['C.  8'], ['D.  9'],
+        # The symbol of the Symbol font is a gamma, and the picture prints as pandoc prints it
+        ['Câu 4. Tia γ có bước sóng ngắn nhất là'], ['A.  []'], ['B.  Tia X'],
+    ]
+
+def test_run_formats():
+    paragraphs = list(stream_doc(FIXTURE))
+    assert paragraphs[0][1] == [('Câu 1. ', True, False, False, False), ('Thủ đô của Việt Nam là', False, False, False, False)]
+    assert paragraphs[7][1] == [('Sắt', False, False, False, True)]
+    # The text of the special run is not visible
+    assert paragraphs[10][1] == [('Câu 3. Số nào là số chẵn?', False, False, False, False)]
+
+def test_answer_marks():
+    lines, marks = extract_original_format(stream_doc(FIXTURE))
+    assert parse_bank(lines, marks) == [
+        ['Câu 1. Thủ đô của Việt Nam là', ['A. Hà Nội', 'B. Huế', 'C. Đà Nẵng', 'D. Cần Thơ'], [1, 0, 0, 0]],
+        ['Câu 2. Nguyên tố nào là kim loại?', ['A. Oxy', 'B. Sắt', 'C. Nitơ', 'D. Clo'], [0, 8, 0, 0]],
+        ['Câu 3. Số nào là số chẵn?', ['B. 7', 'C. 8', 'D. 9'], [0, 1, 0]],
+        ['Câu 4. Tia γ có bước sóng ngắn nhất là', ['A. []', 'B. Tia X'], [0, 0]],
+    ]
@@ -0,0 +1,34 @@
+import threading
+import tracemalloc
+import instrument
+
+
+def test_only_the_memory_thread_records_peaks(monkeypatch):
+    monkeypatch.setattr(instrument, 'enabled', True)
+    monkeypatch.setattr(instrument, 'memory_thread', None)
+    monkeypatch.setattr(instrument, 'stages', {})
+    monkeypatch.setattr(instrument, 'stacks', {})
+    tracing = tracemalloc.is_tracing()
+
+    @instrument.span('allocate')
+    def allocate(size: int) -> int:
+        return len(bytearray(size))
+
+    @instrument.span('outer')
+    def outer() -> int:
+        # A span of another thread while this one runs must not reset the peak of this one
+        thread = threading.Thread(target=allocate, args=(1 << 16,))
+        thread.start()
+        thread.join()
+        return allocate(1 << 20)
+
+    try:
+        outer()
+    finally:
+        if not tracing:
+            tracemalloc.stop()
+    assert instrument.memory_thread is threading.current_thread()
+    calls, _, peak = instrument.stages['allocate']
+    assert calls == 2 and peak >= 1 << 20
+    assert instrument.stages['outer'][2] >= 1 << 20
+    assert set(instrument.stacks) == {'outer', 'outer;allocate', 'allocate'}
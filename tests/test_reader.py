@@ -0,0 +1,43 @@
+import json
+import os
+import pytest
+from main import extract_original_format, load_document, parse_questions
+from reader import script_text, symbol_character
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Built by build_docx_rows.py
+with open(os.path.join(ROOT, 'tests', 'fixtures', 'docx_rows.json'), encoding='utf-8') as file:
+    PANDOC_ROWS = json.load(file)
+
+# The questions where the readers still print something else than pandoc, by document
+KNOWN_DIFFERENCES = {
+    # A Wingdings 3 arrow, which pandoc maps to Unicode and the readers leave in the private use area
+    'Chương II-k12-tuần 2.docx': {0},
+    # Tables, which pandoc prints as grid text
+    'TEST.docx': {30, 31, 36, 38},
+    'Toàn Đặng Chuột - ĐỀ CƯƠNG ÔN TẬP KIỂM TRA GIỮA KÌ I MÔN GDQP-AN 12 (1) (1).docx': {30, 31, 36, 38},
+    # pandoc drops the space after a soft hyphen that starts a line
+    'ÔN-TẬP-HK2.docx': {40},
+}
+
+
+@pytest.mark.parametrize('streaming', [True, False])
+@pytest.mark.parametrize('name', sorted(PANDOC_ROWS))
+def test_sample_questions_match_pandoc(name, streaming):
+    lines, _ = extract_original_format(load_document(os.path.join(ROOT, 'Docx', name), streaming))
+    rows = [[question, options] for question, options, _ in parse_questions(lines)]
+    expected = PANDOC_ROWS[name]
+    known = KNOWN_DIFFERENCES.get(name, set())
+    assert len(rows) == len(expected)
+    assert [row for index, row in enumerate(rows) if index not in known] == [row for index, row in enumerate(expected) if index not in known]
+
+def test_script_text_keeps_spaces_outside():
+    assert script_text('v ', 'subscript') == '_(v) '
+    assert script_text(' 2', 'superscript') == ' ²'
+    assert script_text(' ', 'subscript') == ' '
+
+def test_symbol_characters():
+    assert symbol_character('Symbol', 0xF067) == 'γ'
+    assert symbol_character('Symbol', ord('l')) == 'λ'
+    assert symbol_character('Symbol', ord('μ')) == 'μ'
+    assert symbol_character('Wingdings', 0xF0E0) == '\uf0e0'
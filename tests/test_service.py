@@ -0,0 +1,13 @@
+from service import ConversionService
+
+
+def test_refused_job_gives_its_slot_back(tmp_path):
+    service = ConversionService(workers=1, queue_size=0, cache_directory=str(tmp_path), backend="fake")
+    service.executor.shutdown()
+    replies = []
+    # A single slot: the second job would wait forever if the first one kept it
+    for number in range(2):
+        service.handle({'id': number, 'path': "a.docx"}, replies.append)
+    assert [(reply['id'], reply['ok']) for reply in replies] == [(0, False), (1, False)]
+    stats = service.stats()
+    assert (stats['queue_depth'], stats['failed'], stats['completed']) == (0, 2, 0)
@@ -0,0 +1,40 @@
+import random
+from utils import QuizRecord
+from variants import VariantBank, iter_variants
+
+RECORDS = [
+    QuizRecord("Câu 1. Thủ đô của nước Pháp là?", ("A. Lyon", "B. Nice", "C. Paris", "D. Lille"), 3),
+    QuizRecord("Câu 2. 2 + 2 bằng mấy?", ("A. 3", "B. 4", "C. 5"), 2),
+    QuizRecord("Câu 3. Chọn đáp án đúng.", ("A. Một", "B. Hai", "C. Cả A và B"), 3),
+    QuizRecord("Câu 4. Số nguyên tố nhỏ nhất?", ("A. 1", "B. 2", "C. 3", "D. 4", "E. 5", "F. 6"), 2),
+]
+
+
+def rows(variant: list) -> list:
+    return [(record.question, tuple(record.options), record.correct_answer) for record in variant]
+
+def test_seeded_run_is_reproducible():
+    first = [rows(variant) for variant in iter_variants(RECORDS, 5, seed=7)]
+    assert first == [rows(variant) for variant in iter_variants(RECORDS, 5, seed=7)]
+    # The first variants do not depend on the count
+    assert first[:2] == [rows(variant) for variant in iter_variants(RECORDS, 2, seed=7)]
+    assert first != [rows(variant) for variant in iter_variants(RECORDS, 5, seed=8)]
+
+def test_answers_follow_their_options():
+    answers = {record.question.split('. ', 1)[1]: record.options[record.correct_answer - 1][3:] for record in RECORDS}
+    bank = VariantBank(RECORDS)
+    rng = random.Random(1)
+    for _ in range(20):
+        for record in bank.variant(rng):
+            assert 1 <= record.correct_answer <= 4
+            assert record.options[record.correct_answer - 1][3:] == answers[record.question.split('. ', 1)[1]]
+            assert [option[0] for option in record.options] == list("ABCDEF"[:len(record.options)])
+
+def test_pinned_and_wide_questions_keep_their_options():
+    bank = VariantBank(RECORDS)
+    rng = random.Random(2)
+    for _ in range(20):
+        for record in bank.variant(rng):
+            original = next(r for r in RECORDS if r.question.split('. ', 1)[1] == record.question.split('. ', 1)[1])
+            if len(original.options) > 4 or original.question.startswith("Câu 3."):
+                assert (record.options, record.correct_answer) == (original.options, original.correct_answer)
@@ -1,13 +1,41 @@
 import os
 import re
-import pandas as pd
-from win32com.client import Dispatch
-from tkinter.filedialog import askopenfilenames
-
+import random
+from export import write_csv, write_platforms
+from instrument import span
+
+QUESTION_PATTERN = re.compile(r'\b(?:Câu|câu|\d+)\b|\b(?:\d+)\.')
+OPTION_PATTERN = re.compile(r'^[a-dA-D][\.:]')
+OPTION_SPLIT_PATTERN = re.compile(r'\s+(?=[a-dA-D]\.\s+(?![a-dA-D]\.)|[a-dA-D]\.\s+(?![a-dA-D]\.))')
+EXTRA_SPACES_PATTERN = re.compile(r" {2,}")
+QUESTION_NUMBER_PATTERN = re.compile(r'^Câu (\d+)')
+QUESTION_NUMBER_DOT_PATTERN = re.compile(r'^Câu (\d+)[\.:]')
+QUESTION_CAPITALIZE_PATTERN = re.compile(r'Câu (\d+)\.\s*([a-zA-Z])')
+QUESTION_LABEL_PATTERN = re.compile(r'^(Câu \d+\.|Câu \d+\:|\d+\.)')
+FIRST_NUMBER_PATTERN = re.compile(r"(\d+)")
+OPTION_FORMAT_PATTERN = re.compile(r'(^[a-dA-D])\.\s*(.*)')
+OPTION_LETTER_PATTERN = re.compile(r'^[a-dA-D]\.\s*')
+
+# Answer formats and their bit in the mask of an option, in the order of the flags of a (text, bold, italic, underline, highlight) run
+ANSWER_FORMATS = {
+    "Bôi đen": 1,
+    "In nghiêng": 2,
+    "Gạch chân": 4,
+    "Bôi màu": 8,
+}
+
+# The formatting options, named as in the GUI; ConversionProfile reads the selected ones
+FORMAT_OPTIONS = ["Xóa chữ 'Câu'", "Thêm chữ 'Câu'", "Sửa lỗi định dạng", "Xóa chữ 'A,B,C,D'", "Xáo trộn câu hỏi", "Gộp nhiều file thành một", "Bỏ câu hỏi trùng lặp"]
+# The options are numbered A, B, C, D in the document
+LETTERED_OPTIONS = "A,B,C,D"
+# The columns of the report of the questions to check, see save_warnings
+WARNING_COLUMNS = ("File", "Question", "Answers")
 
 # Helper function to open a window that specifies a file's path
 def open_folder() -> list:
     """Opens a file dialog to select multiple files."""
+    from tkinter.filedialog import askopenfilenames
+
     return askopenfilenames()
 
 # Capitalize first letter
@@ -18,124 +46,178 @@ def CFL(text: str) -> str:
 # Helper function to check if a string is a question
 def is_question(text: str) -> bool:
     """Check if a text is a question."""
-    return re.match(r'\b(?:Câu|câu|\d+)\b|\b(?:\d+)\.',text)
+    return QUESTION_PATTERN.match(text)
 
 # Helper function to check if a string is an option.
 def is_option(text: str) -> bool:
     """Check if a text is option"""
-    return re.match(r'^[a-dA-D][\.:]', text)
+    return OPTION_PATTERN.match(text)
 
 # Helper function to split options that are on the same line
 def split_options(text: str) -> list:
     """Splits options that are on the same line into a list and remove any redundant whitespace."""
-    return re.split(r'\s+(?=[a-dA-D]\.\s+(?![a-dA-D]\.)|[a-dA-D]\.\s+(?![a-dA-D]\.))', re.sub(r" {2,}", " ", text))
-
-def extract_format_text(text: str, selected_options: list) -> str:
-    """Extracts formatted text (highlighted, bold, underline, italic) if not return None."""
-    formatting_conditions = {
-        ("Bôi đen",): lambda run: run.font.bold,
-        ("In nghiêng",): lambda run: run.font.italic,
-        ("Gạch chân",): lambda run: run.font.underline,
-        ("Bôi màu",): lambda run: run.font.highlight_color,
-    }
-
-    for run in text.runs:
-        for options, condition in formatting_conditions.items():
-            if all(option in selected_options for option in options) and condition(run) and is_option(run.text):
-                if "A,B,C,D" in selected_options:
-                    return run.text[0]
-                else:
-                    return run.text.strip()
+    return OPTION_SPLIT_PATTERN.split(EXTRA_SPACES_PATTERN.sub(" ", text))
+
+def format_mask(flags) -> int:
+    """Turn the (bold, italic, underline, highlight) flags of a run into a mask of ANSWER_FORMATS bits."""
+    return sum(bit for bit, flag in zip(ANSWER_FORMATS.values(), flags) if flag)
+
+def answer_marks(lines: list, runs: list) -> dict:
+    """
+    Find the options of a paragraph that are marked as the answer by their formatting.
+
+    An option is marked by a formatted run starting with its letter ("A.", "b:"), or, when the paragraph holds a single option,
+    by formatting covering all of its text (e.g. an item of a numbered list, whose letter is not part of the text).
+
+    Parameters:
+    - lines (list): The lines of text of the paragraph.
+    - runs (list): The (text, bold, italic, underline, highlight) runs of the paragraph.
+
+    Returns:
+    - dict: Maps the upper-case letter of each marked option to the mask of the formats marking it.
+    """
+    marks = {}
+    whole = -1
+    for text, *flags in runs:
+        mask = format_mask(flags)
+        if mask and is_option(text):
+            letter = text[0].upper()
+            marks[letter] = marks.get(letter, 0) | mask
+        if text.strip():
+            whole &= mask
+
+    if whole > 0 and len(lines) == 1 and is_option(lines[0]) and len(split_options(lines[0])) == 1:
+        letter = lines[0][0].upper()
+        marks[letter] = marks.get(letter, 0) | whole
+    return marks
 
 # Get the correct answer index
-def get_correct_answer_index(options: list, highlights: list, contains_ABCD: bool ) -> int:
+def get_correct_answer(marks: list, profile) -> tuple:
     """
-    Find and return the index of the correct answer in a list of answer options based on highlighted text.
+    Find the correct answer of a question from the formatting of its options.
 
     Parameters:
-    - options (list): A list of answer options.
-    - highlights (list): A list of highlighted text.
-    - contains_ABCD (bool): A flag indicating whether the answer options contain the letters A, B, C, D.
+    - marks (list): The mask of the formats marking each option, as yielded by parse_questions.
+    - profile (ConversionProfile): The selected options, giving the answer formats to look for.
 
     Returns:
-    - int: The index of the correct answer in the options list. If no correct answer is found, 0 is returned.
+    - tuple: The 1-based index of the correct answer (0 if none is marked) and the number of options marked as the answer.
+      When several options are marked, the first one is taken.
     """
-    count = 0
-    for index, option_text in enumerate(options):
-        try:
-            if contains_ABCD and option_text[0] == highlights[0]:
-                highlights.pop(0)
-                return index+1
-            else:
-                count+=1
-                if option_text.lower() == highlights[0].strip().lower():
-                    highlights.pop(0)
-                    return index+1
-                if count == 4:
-                    highlights.pop(0)
-                    return 0
-        except:
-            pass
-        
-def create_quiz(data: list, current_question: str, current_options: list, highlights: list, platform: str, selected_options: list) -> None:
-    """Create a Quiz Question based on the specified platform."""
-    contains_ABCD = "A,B,C,D" in selected_options
-    def quizizz(data: list, current_question: str, current_options: list, highlights: list) -> list:
-        data.append({
-            'Question Text': current_question,
-            'Question Type': "Multiple Choice",
-            'Option 1': current_options[0] if len(current_options) >= 1 else "",
-            'Option 2': current_options[1] if len(current_options) >= 2 else "",
-            'Option 3': current_options[2] if len(current_options) >= 3 else "",
-            'Option 4': current_options[3] if len(current_options) >= 4 else "",
-            'Correct Answer': get_correct_answer_index(current_options, highlights, contains_ABCD),
-            'Time in seconds': 30
-        })
-        return data
-
-    def kahoot(data: list, current_question: str, current_options: list, highlights: list) -> list:
-        data.append({
-            'Question': current_question,
-            'Answer 1': current_options[0] if len(current_options) >= 1 else "",
-            'Answer 2': current_options[1] if len(current_options) >= 2 else "",
-            'Answer 3': current_options[2] if len(current_options) >= 3 else "",
-            'Answer 4': current_options[3] if len(current_options) >= 4 else "",
-            'Time limit': 30,
-            'Correct Answer': get_correct_answer_index(current_options, highlights, contains_ABCD)
-        })
-        return data
-
-    def blooket(data: list, current_question: str, current_options: list, highlights: list) -> list:
-        data.append({
-            'Question Text': current_question,
-            'Answer 1': current_options[0] if len(current_options) >= 1 else "",
-            'Answer 2': current_options[1] if len(current_options) >= 2 else "",
-            'Answer 3': current_options[2] if len(current_options) >= 3 else "",
-            'Answer 4': current_options[3] if len(current_options) >= 4 else "",
-            'Time limit': 30,
-            'Correct Answer': get_correct_answer_index(current_options, highlights, contains_ABCD)
-        })
-        return data
-
-    if platform == "Quizizz":
-        quizizz(data, current_question, current_options, highlights)
-    elif platform == "Kahoot":
-        kahoot(data, current_question, current_options, highlights)
-    elif platform == "Blooket":
-        blooket(data, current_question, current_options, highlights)
-
-def process_formats(current_question: str, current_options: list, selected_options:list, question_number: int) -> None:
+    answers = [index + 1 for index, mask in enumerate(marks) if mask & profile.answer_mask]
+    return (answers[0] if answers else 0), len(answers)
+
+class QuizRecord:
+    """
+    A formatted question with its options and the 1-based index of its correct answer (0 if none is marked).
+
+    Records do not depend on the platform, they are shaped into the columns of a platform when exported (see export.PLATFORM_COLUMNS).
+    """
+    __slots__ = ('question', 'options', 'correct_answer')
+
+    def __init__(self, question: str, options: tuple, correct_answer: int):
+        self.question = question
+        self.options = options
+        self.correct_answer = correct_answer
+
+@span('create_quiz')
+def create_quiz(current_question: str, current_options: list, correct_answer: int) -> QuizRecord:
+    """Create a Quiz Question."""
+    return QuizRecord(current_question, tuple(current_options), correct_answer)
+
+# Steps of the formatting chain; each takes and returns the question and its options.
+# `numbered` tells whether the question started with "Câu N" before any step was applied.
+def fix_formatting(current_question: str, current_options: list, question_number: int, numbered: bool) -> tuple:
+    """Fix the formatting of "Câu X." and of the answer options ("Sửa lỗi định dạng")."""
+    # Add a period after the number following "Câu" if it is  missing
+    if numbered and not QUESTION_NUMBER_DOT_PATTERN.match(current_question):
+        current_question = QUESTION_NUMBER_PATTERN.sub(lambda m: f'Câu {m.group(1)}.', current_question, 1)
+
+    # Capitalize the text after "Câu X."
+    current_question = QUESTION_CAPITALIZE_PATTERN.sub(lambda match: f'Câu {match.group(1)}. {CFL(match.group(2))}', current_question)
+    if '[]' in current_question:
+        current_question = '\n'.join(filter(lambda line: '[]' not in line, current_question.split('\n')))
+    current_options = [OPTION_FORMAT_PATTERN.sub(lambda match: f'{CFL(match.group(1))}. {CFL(match.group(2).strip())}', option) for option in current_options]
+    return current_question, current_options
+
+def remove_question_label(current_question: str, current_options: list, question_number: int, numbered: bool) -> tuple:
+    """Remove 'Câu X.' from the question ("Xóa chữ 'Câu'")."""
+    return CFL(QUESTION_LABEL_PATTERN.sub('', current_question).strip()), current_options
+
+def remove_option_letters(current_question: str, current_options: list, question_number: int, numbered: bool) -> tuple:
+    """Remove 'A.', 'B.', ... from the answer options ("Xóa chữ 'A,B,C,D'")."""
+    return current_question, [CFL(OPTION_LETTER_PATTERN.sub('', option).strip()) for option in current_options]
+
+def add_question_label(current_question: str, current_options: list, question_number: int, numbered: bool) -> tuple:
+    """Add 'Câu' before the question number if the question has none ("Thêm chữ 'Câu'")."""
+    if "Câu" not in current_question:
+        current_question = FIRST_NUMBER_PATTERN.sub(r'Câu \1', current_question, 1)
+    return current_question, current_options
+
+def sync_question_number(current_question: str, current_options: list, question_number: int, numbered: bool) -> tuple:
+    """Renumber the question across merged files ("Gộp nhiều file thành một")."""
+    if numbered:
+        current_question = QUESTION_NUMBER_PATTERN.sub(f"Câu {question_number}", current_question)
+    return current_question, current_options
+
+class ConversionProfile:
+    """
+    The selected options, compiled once per run.
+
+    Every option check of the conversion is answered here once, and the formatting chain only holds
+    the steps the selected options ask for, so an option that is not selected costs nothing per question.
+    The profile is what gets passed down the conversion instead of the list of selected options.
+    """
+
+    def __init__(self, selected_options: list):
+        options = set(selected_options)
+        self.selected_options = list(selected_options)
+        self.contains_ABCD = LETTERED_OPTIONS in options
+        self.merge = "Gộp nhiều file thành một" in options
+        self.shuffle = "Xáo trộn câu hỏi" in options
+        # Duplicates are looked for across the merged files, or within each file
+        self.deduplicate = "Bỏ câu hỏi trùng lặp" in options
+        # With "A,B,C,D" the letters are only removed from the exported sheet
+        self.strip_answer_letters = self.contains_ABCD and "Xóa chữ 'A,B,C,D'" in options
+        self.answer_mask = sum(bit for option, bit in ANSWER_FORMATS.items() if option in options)
+
+        self.steps = []
+        if "Sửa lỗi định dạng" in options:
+            self.steps.append(fix_formatting)
+        if "Xóa chữ 'Câu'" in options:
+            self.steps.append(remove_question_label)
+        if "Xóa chữ 'A,B,C,D'" in options and not self.contains_ABCD:
+            self.steps.append(remove_option_letters)
+        if "Thêm chữ 'Câu'" in options:
+            self.steps.append(add_question_label)
+        if self.merge:
+            self.steps.append(sync_question_number)
+        self.check_numbered = "Sửa lỗi định dạng" in options or self.merge
+
+    def format(self, current_question: str, current_options: list, question_number: int) -> tuple:
+        """Run the formatting chain on a question and its options."""
+        numbered = self.check_numbered and QUESTION_NUMBER_PATTERN.match(current_question) is not None
+        for step in self.steps:
+            current_question, current_options = step(current_question, current_options, question_number, numbered)
+        return current_question, current_options
+
+def get_profile(options) -> ConversionProfile:
+    """Return the ConversionProfile of a list of selected options, or the profile itself if it already is one."""
+    return options if isinstance(options, ConversionProfile) else ConversionProfile(options)
+
+@span('process_formats')
+def process_formats(current_question: str, current_options: list, profile: ConversionProfile, question_number: int) -> tuple:
     """
     Process and format questions and answer options based on selected formatting options and the question number.
 
     Args:
         current_question (str): The current question text.
         current_options (list): The list of current answer options.
-        selected_options (list): The list of selected formatting options.
+        profile (ConversionProfile): The selected formatting options.
         question_number (int): The question number.
 
     Returns:
-        None: This function does not return anything. It modifies the input parameters in-place.
+        tuple: The formatted question text and list of answer options.
 
     Description:
         This function processes and formats the question text and answer options based on the selected formatting options.
@@ -150,39 +232,9 @@ def process_formats(current_question: str, current_options: list, selected_optio
         8. Synchronizes the question numbers if the 'Gộp nhiều file thành một' option is selected.
 
     Note:
-        This function modifies the input parameters in-place.
+        Only the operations of the selected options are run, see ConversionProfile.
     """
-    pattern = r'^Câu (\d+)'
-    match = re.search(pattern, current_question)
-    match_with_dot = re.search(r'^Câu (\d+)[\.:]', current_question)
-
-    if "Sửa lỗi định dạng" in selected_options:
-
-        # Add a period after the number following "Câu" if it is  missing
-        if match and not match_with_dot:
-            # Add a period after the number
-            current_question = re.sub(pattern, lambda m: f'Câu {m.group(1)}.', current_question, 1)
-
-        # Capitalize the text after "Câu X."
-        current_question = re.sub(r'Câu (\d+)\.\s*([a-zA-Z])', lambda match: f'Câu {match.group(1)}. {CFL(match.group(2))}', current_question)
-        current_question = '\n'.join(filter(lambda line: '[]' not in line, current_question.split('\n')))
-        current_options = [re.sub(r'(^[a-dA-D])\.\s*(.*)', lambda match: f'{CFL(match.group(1))}. {CFL(match.group(2).strip())}', option) for option in current_options]
-
-    if "Xóa chữ 'Câu'" in selected_options:
-        current_question = CFL(re.sub(r'^(Câu \d+\.|Câu \d+\:|\d+\.)', '', current_question).strip())
-
-    if "Xóa chữ 'A,B,C,D'" in selected_options and not "A,B,C,D" in selected_options:
-        current_options = [CFL(re.sub(r'^[a-dA-D]\.\s*', '', option).strip()) for option in current_options]
-
-    if "Thêm chữ 'Câu'" in selected_options and "Câu" not in current_question:
-        current_question = re.sub(r"(\d+)", r'Câu \1', current_question, 1)
-    
-    if "Gộp nhiều file thành một" in selected_options:
-        #Sync the question numbers
-        if match:
-            current_question = re.sub(pattern, f"Câu {question_number}", current_question)
-
-    return current_question, current_options
+    return profile.format(current_question, current_options, question_number)
 
 def get_explorer_windows(target_path):
     """
@@ -194,6 +246,8 @@ def get_explorer_windows(target_path):
     Returns:
         bool: True if the Explorer window is found and brought to the foreground, False otherwise.
     """
+    from win32com.client import Dispatch
+
     shell_windows = Dispatch("Shell.Application").Windows()
     for window in shell_windows:
         # Only consider windows that are instances of File Explorer
@@ -227,45 +281,80 @@ def get_unique_file_path(output_path):
         count += 1
     return output_path
 
-def data_frame(data: list, file_path: str, selected_options: list, open_file: bool = True) -> None:
+@span('data_frame')
+def save_sheets(data, file_path: str, platforms: list, profile, open_file: bool = True, extension: str = ".xlsx", output_directory: str = "Output",
+                shuffle: bool = None) -> dict:
     """
-    Creates a DataFrame from the given data list and saves it as an Excel file.
+    Saves the quiz records as the sheets of several platforms in Excel (or CSV) files, in a single pass over the records.
 
     Args:
-        data (list): A list of dictionaries representing the data to be converted into a DataFrame.
+        data: An iterable over the quiz records, as created by create_quiz. It is only read once, whatever the number of platforms.
         file_path (str): The path to the input file.
-        selected_options (list): A list of selected options.
-        open_file (bool, optional): Whether to open the output file after saving. Defaults to True.
+        platforms (list): The platforms for which the quiz is being created, which give the columns of the sheets.
+        profile (ConversionProfile): The selected options, or the list of them.
+        open_file (bool, optional): Whether to open the output files after saving. Defaults to True.
+        extension (str, optional): The type of the output files, ".xlsx" or ".csv". Defaults to ".xlsx".
+        output_directory (str, optional): The directory the files are saved in. Defaults to "Output".
+        shuffle (bool, optional): Whether to shuffle the questions. Defaults to None, which shuffles them if "Xáo trộn câu hỏi" is selected.
 
     Returns:
-        None
+        dict: The path of the saved file of each platform, by platform.
 
-    This function creates a DataFrame from the given data list and saves it as an Excel file. 
     It takes the following steps:
-    1. Creates the output directory if it doesn't exist.
+    1. Creates the output directory if it doesn't exist. With several platforms, the sheet of each one is saved in a subdirectory named after it.
     2. Generates a unique file name based on the input file path.
-    3. Saves the DataFrame as an Excel file in the output directory.
-    4. If the "Xáo trộn câu hỏi" option is selected, shuffles the DataFrame.
-    5. If the "A,B,C,D" and "Xóa chữ 'A,B,C,D'" options are both selected, removes the leading characters 'A', 'B', 'C', or 'D' followed by a colon or period from each string in the DataFrame.
-    6. Saves the DataFrame as an Excel file.
-    7. If the `open_file` parameter is True, opens the output file using the default program associated with the file type.
+    3. If the "Xáo trộn câu hỏi" option is selected, shuffles the questions, in the same order for every platform.
+    4. If the "A,B,C,D" and "Xóa chữ 'A,B,C,D'" options are both selected, removes the leading 'A', 'B', 'C' or 'D' followed by a colon or period from the answers of each row.
+    5. Writes the rows to the files, without holding them all in memory unless they are shuffled.
+    6. If the `open_file` parameter is True, opens the output files using the default program associated with the file type.
     """
-    output_directory = "Output"
-    os.makedirs(output_directory, exist_ok=True)
-    
-    file_name = f"{os.path.splitext(os.path.basename(file_path))[0]}.xlsx"
-    output_path = get_unique_file_path(os.path.join(output_directory, file_name))
-    
-    df = pd.DataFrame(data)
-
-    
-    if "Xáo trộn câu hỏi" in selected_options:
-        df = df.sample(frac=1)
-    
-    if "A,B,C,D" in selected_options and "Xóa chữ 'A,B,C,D'" in selected_options:
-        df = df.replace(r'^[a-dA-D][\.:]', '', regex=True)
-    
-    df.to_excel(output_path, index=False)
-    
+    file_name = f"{os.path.splitext(os.path.basename(file_path))[0]}{extension}"
+    output_paths = {}
+    for platform in platforms:
+        directory = output_directory if len(platforms) == 1 else os.path.join(output_directory, platform)
+        os.makedirs(directory, exist_ok=True)
+        output_paths[platform] = get_unique_file_path(os.path.join(directory, file_name))
+
+    profile = get_profile(profile)
+
+    if profile.shuffle if shuffle is None else shuffle:
+        data = list(data)
+        random.shuffle(data)
+
+    write_platforms(data, output_paths, extension, profile.strip_answer_letters)
+
     if open_file:
-        os.startfile(output_path)
+        for output_path in output_paths.values():
+            os.startfile(output_path)
+    return output_paths
+
+def data_frame(data, file_path: str, platform: str, profile, open_file: bool = True, extension: str = ".xlsx", output_directory: str = "Output") -> str:
+    """
+    Saves the quiz records as the sheet of a platform in an Excel (or CSV) file, streaming them to the file one row at a time.
+
+    Args:
+        data: An iterable over the quiz records, as created by create_quiz.
+        file_path (str): The path to the input file.
+        platform (str): The platform for which the quiz is being created, which gives the columns of the sheet.
+        profile (ConversionProfile): The selected options, or the list of them.
+        open_file (bool, optional): Whether to open the output file after saving. Defaults to True.
+        extension (str, optional): The type of the output file, ".xlsx" or ".csv". Defaults to ".xlsx".
+        output_directory (str, optional): The directory the file is saved in. Defaults to "Output".
+
+    Returns:
+        str: The path of the saved file, see save_sheets.
+    """
+    return save_sheets(data, file_path, [platform], profile, open_file, extension, output_directory)[platform]
+
+def save_warnings(warnings: list, output_path: str) -> str:
+    """
+    Save the questions to check for a sheet next to it, as <name>.warnings.csv, and return the path of the report.
+
+    Args:
+        warnings (list): The questions without an answer, or with several, as {'file', 'question', 'answers'} dicts.
+        output_path (str): The path of the sheet.
+    """
+    report_path = f"{os.path.splitext(output_path)[0]}.warnings.csv"
+    rows = ((warning['file'], warning['question'], warning['answers']) for warning in warnings)
+    write_csv([WARNING_COLUMNS, *rows], report_path)
+    return report_path
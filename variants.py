@@ -0,0 +1,161 @@
+import os
+import re
+import random
+from itertools import permutations
+from instrument import span
+from utils import QuizRecord, save_sheets
+
+# The number at the start of a question, "Câu 12" or "12."
+VARIANT_NUMBER_PATTERN = re.compile(r'^(Câu\s*)(\d+)|^(\d+)(?=[\.:])')
+# The letter of an option, "A." or "b:"
+VARIANT_LETTER_PATTERN = re.compile(r'^([a-dA-D])(?=[\.:])')
+# Options that refer to the other ones by their position ("Cả A và B đều đúng", "Tất cả các đáp án trên"),
+# which keep the options of their question in place
+PINNED_OPTION_PATTERN = re.compile(
+    r'\b(?:tất cả|cả (?:hai|ba|bốn|[a-d1-4])|(?:các|những) (?:đáp án|phương án|ý|câu) (?:trên|đã nêu)|[a-d] (?:và|hoặc) [a-d]|[a-d], [a-d])\b',
+    re.IGNORECASE,
+)
+# The option columns of the platforms (see export.PLATFORM_COLUMNS): the options of a question with more are not shuffled,
+# since those past the columns are not in the sheet and the answer could be moved out of them
+OPTION_COLUMNS = 4
+# Option counts whose permutations are listed, so a variant draws them for every question at once
+TABLE_SIZES = range(2, OPTION_COLUMNS + 1)
+
+
+# Helper function to list the permutations of the options of a question
+def permutation_table(size: int) -> list:
+    """Return every (order, position) pair of `size` options: order[new] is the old index, position[old] the new one."""
+    table = []
+    for order in permutations(range(size)):
+        position = [0] * size
+        for new, old in enumerate(order):
+            position[old] = new
+        table.append((order, position))
+    return table
+
+PERMUTATIONS = {size: permutation_table(size) for size in TABLE_SIZES}
+
+
+class VariantBank:
+    """
+    The questions of a bank prepared once, to draw any number of shuffled variants of it.
+
+    A variant permutes the questions and the options of every question, renumbers the "Câu N" labels, moves the
+    "A."/"B." letters of lettered options back into order and remaps the correct answer, so the sheet of every platform is right.
+    Options referring to the others ("Cả A và B", "Tất cả các đáp án trên") keep the options of their question in place,
+    and so do questions with more options than the platforms have columns (see OPTION_COLUMNS).
+
+    The permutations are drawn as index lists, a question order and one option order per question of each option count,
+    and applied to the prepared parts of the records, so drawing a variant costs a few string joins per question.
+    """
+
+    def __init__(self, records: list):
+        self.records = list(records)
+        # Per question: the text before and after its number (None if it has none)
+        self.questions = []
+        # Per question: the option texts, without their letter when every option has one, and the case of the letters (None if unlettered)
+        self.options = []
+        # Indexes of the questions whose options are shuffled, by option count
+        self.groups = {}
+        for index, record in enumerate(self.records):
+            match = VARIANT_NUMBER_PATTERN.match(record.question)
+            # A bare "12." may be the number of a heading above the question rather than its own
+            if match is None or (match.group(1) is None and '\n' in record.question):
+                self.questions.append(None)
+            else:
+                self.questions.append((match.group(1) or '', record.question[match.end():]))
+
+            options = record.options
+            letters = [VARIANT_LETTER_PATTERN.match(option) for option in options]
+            if options and len(options) <= OPTION_COLUMNS and all(letters):
+                upper = options[0][0].isupper()
+                self.options.append(([option[1:] for option in options], upper))
+            else:
+                self.options.append((list(options), None))
+
+            if 1 < len(options) <= OPTION_COLUMNS and not any(PINNED_OPTION_PATTERN.search(option) for option in options):
+                self.groups.setdefault(len(options), []).append(index)
+
+    @span('variant')
+    def variant(self, rng: random.Random) -> list:
+        """
+        Draw a variant with the given random generator.
+
+        Returns:
+        - list: The QuizRecord of every question, in the order of the variant.
+        """
+        records = self.records
+        count = len(records)
+        order = rng.sample(range(count), count)
+
+        # One option order per question, drawn for every question of the same option count at once
+        option_orders = [None] * count
+        for size, indexes in self.groups.items():
+            drawn = rng.choices(PERMUTATIONS[size], k=len(indexes))
+            for index, permutation in zip(indexes, drawn):
+                option_orders[index] = permutation
+
+        variant = []
+        for number, index in enumerate(order, 1):
+            record = records[index]
+            question = self.questions[index]
+            text = record.question if question is None else f"{question[0]}{number}{question[1]}"
+
+            options, upper = self.options[index]
+            correct_answer = record.correct_answer
+            permutation = option_orders[index]
+            if permutation is not None:
+                option_order, position = permutation
+                options = [options[old] for old in option_order]
+                if correct_answer:
+                    correct_answer = position[correct_answer - 1] + 1
+            if upper is not None:
+                letters = 'ABCD' if upper else 'abcd'
+                options = [letters[new] + option for new, option in enumerate(options)]
+            variant.append(QuizRecord(text, tuple(options), correct_answer))
+        return variant
+
+def iter_variants(records: list, count: int, seed: int):
+    """
+    Yield `count` shuffled variants of the records of a bank, see VariantBank.
+
+    The same records and seed always give the same variants, and the first variants do not depend on `count`.
+
+    Parameters:
+    - records: The QuizRecord of every question of the bank.
+    - count: The number of variants.
+    - seed: The seed of the random generator.
+
+    Yields:
+    - list: The records of each variant.
+    """
+    bank = VariantBank(records)
+    rng = random.Random(seed)
+    for _ in range(count):
+        yield bank.variant(rng)
+
+def new_seed() -> int:
+    """Return a random seed, to be reported so the variants can be made again."""
+    return random.SystemRandom().randrange(2 ** 32)
+
+def save_variants(records: list, file_path: str, platforms: list, profile, count: int, seed: int, **options) -> list:
+    """
+    Save `count` shuffled variants of the records as sheets named after the file with the number of the variant ("Sinh - Đề 01.xlsx").
+
+    Parameters:
+    - records: The QuizRecord of every question of the bank.
+    - file_path: The path to the input file.
+    - platforms: The platforms the sheets are for.
+    - profile: The selected options. "Xáo trộn câu hỏi" is left out, the variants being shuffled already.
+    - count: The number of variants.
+    - seed: The seed of the variants, see iter_variants.
+    - options: The other arguments of save_sheets (open_file, extension, output_directory).
+
+    Returns:
+    - list: The paths of the sheets of each variant, by platform, as returned by save_sheets.
+    """
+    name, extension = os.path.splitext(os.path.basename(file_path))
+    width = len(str(count))
+    # save_sheets names the sheets after the file without its extension, which is kept so a dot in the name stays
+    return [save_sheets(variant, f"{name} - Đề {number:0{width}d}{extension}", platforms, profile, shuffle=False, **options)
+            for number, variant in enumerate(iter_variants(records, count, seed), 1)]
@@ -0,0 +1,209 @@
+import os
+import json
+import time
+from backends import ConverterSession, WordBackend
+from batch import read_file
+from cache import PARSER_VERSION, BankCache
+from main import format_questions
+from utils import get_profile, save_sheets
+
+# The state index, kept in the output directory
+STATE_FILE = ".wte_watch.json"
+MERGED_NAME = "Merged_File"
+
+
+def list_documents(directory: str) -> list:
+    """Return the Word documents of a directory and its subdirectories, in a stable order, without Word's lock files."""
+    documents = []
+    for root, _, files in os.walk(directory):
+        for name in files:
+            if os.path.splitext(name)[1].lower() in ('.doc', '.docx') and not name.startswith('~$'):
+                documents.append(os.path.join(root, name))
+    return sorted(documents)
+
+class FolderWatcher:
+    """
+    Keep the sheets of a folder of Word documents up to date, converting only the documents that changed.
+
+    The state index records the modification time, size and content key of every document and the sheet made from it.
+    A document whose modification time or size changed is hashed, and only read again if its content changed.
+    With several platforms, the sheets of every platform are saved from the same questions, see save_sheets.
+    In merge mode the questions of the other documents are kept: a document is only formatted again
+    when it changed or when its questions are numbered from a different number than before.
+    The merged sheet is then saved again from the kept questions, since an .xlsx file cannot be edited in place.
+    """
+
+    def __init__(self, directory: str, platforms, selected_options: list, output_directory: str = "Output",
+                 extension: str = ".xlsx", cache: BankCache = None, backend=None):
+        self.directory = directory
+        # A single platform or a list of them
+        self.platforms = [platforms] if isinstance(platforms, str) else list(platforms)
+        self.profile = get_profile(selected_options)
+        self.output_directory = output_directory
+        self.extension = extension
+        self.cache = cache if cache is not None else BankCache()
+        self.converter = ConverterSession(backend or WordBackend())
+        self.state_path = os.path.join(output_directory, STATE_FILE)
+        # The settings the sheets were made with; when they change, every document is converted again
+        self.settings = {'platforms': self.platforms, 'options': sorted(self.profile.selected_options), 'extension': extension, 'parser': PARSER_VERSION}
+        # Path -> (first question number, records, next question number), for the documents formatted in this session
+        self.formatted = {}
+        # Path -> (modification time, size) of the documents that could not be read, tried again once they change
+        self.failed = {}
+        self.state = self.load_state()
+
+    def load_state(self) -> dict:
+        """Read the state index, or start from an empty one if it is missing or was made with other settings."""
+        try:
+            with open(self.state_path, 'r', encoding='utf-8') as file:
+                state = json.load(file)
+        except (OSError, ValueError):
+            state = None
+        if not state or state.get('settings') != self.settings:
+            state = {'settings': self.settings, 'documents': {}, 'merged_outputs': None}
+        return state
+
+    def save_state(self) -> None:
+        """Write the state index atomically."""
+        os.makedirs(self.output_directory, exist_ok=True)
+        temp_path = f"{self.state_path}.tmp"
+        with open(temp_path, 'w', encoding='utf-8') as file:
+            json.dump(self.state, file, ensure_ascii=False, indent=1)
+        os.replace(temp_path, self.state_path)
+
+    def changes(self) -> tuple:
+        """
+        Return the documents that are new or changed, with their stat and content key, those that were removed,
+        and whether documents were saved again without changes.
+        """
+        documents = self.state['documents']
+        changed = {}
+        touched = False
+        current = list_documents(self.directory)
+        for path in current:
+            stat = os.stat(path)
+            entry = documents.get(path)
+            if entry and entry['mtime'] == stat.st_mtime_ns and entry['size'] == stat.st_size:
+                continue
+            if self.failed.get(path) == (stat.st_mtime_ns, stat.st_size):
+                continue
+            key = self.cache.key(path)
+            if entry and entry['key'] == key:
+                # Saved again without changes: only remember the new time
+                entry['mtime'], entry['size'] = stat.st_mtime_ns, stat.st_size
+                touched = True
+                continue
+            changed[path] = {'mtime': stat.st_mtime_ns, 'size': stat.st_size, 'key': key}
+        current = set(current)
+        removed = [path for path in documents if path not in current]
+        return changed, removed, touched
+
+    def bank(self, path: str, key: str) -> dict:
+        """Return the question bank of a document, from the cache if its content was read before."""
+        bank = self.cache.get(key)
+        if bank is None:
+            bank = read_file(path, self.converter)
+            self.cache.put(key, bank)
+        return bank
+
+    def remove_outputs(self, output_paths: dict) -> None:
+        """Remove the sheets made earlier, given by platform, so the new ones take their names."""
+        for output_path in (output_paths or {}).values():
+            if os.path.exists(output_path):
+                os.remove(output_path)
+
+    def save(self, records: list, file_path: str, previous_outputs: dict) -> dict:
+        """Save the records as the sheets of every platform in place of the previous ones and return their paths by platform."""
+        self.remove_outputs(previous_outputs)
+        return save_sheets(records, file_path, self.platforms, self.profile, open_file=False,
+                           extension=self.extension, output_directory=self.output_directory)
+
+    def update(self) -> dict:
+        """
+        Convert what changed since the last update.
+
+        Returns:
+        - dict: The 'changed' and 'removed' documents, the 'outputs' saved, the 'errors' by document,
+          the number of answer 'warnings' and the 'seconds' the update took.
+        """
+        start = time.perf_counter()
+        documents = self.state['documents']
+        changed, removed, touched = self.changes()
+        summary = {'changed': list(changed), 'removed': removed, 'outputs': [], 'errors': {}, 'warnings': 0}
+
+        for path in removed:
+            entry = documents.pop(path)
+            self.formatted.pop(path, None)
+            if not self.profile.merge:
+                self.remove_outputs(entry.get('outputs'))
+
+        for path, entry in changed.items():
+            previous = documents.get(path, {})
+            self.formatted.pop(path, None)
+            try:
+                bank = self.bank(path, entry['key'])
+            except Exception as error:
+                summary['errors'][path] = str(error) or type(error).__name__
+                self.failed[path] = (entry['mtime'], entry['size'])
+                continue
+            self.failed.pop(path, None)
+            entry['outputs'] = previous.get('outputs')
+            documents[path] = entry
+            if not self.profile.merge:
+                records, warnings = [], []
+                format_questions(bank['questions'], records, self.profile, 1, warnings)
+                entry['outputs'] = self.save(records, path, entry['outputs'])
+                summary['outputs'].extend(entry['outputs'].values())
+                summary['warnings'] += len(warnings)
+
+        if self.profile.merge and (changed or removed or not self.state['merged_outputs']):
+            self.update_merged(summary)
+
+        if changed or removed or touched:
+            self.save_state()
+        summary['seconds'] = time.perf_counter() - start
+        return summary
+
+    def update_merged(self, summary: dict) -> None:
+        """Format again the documents whose questions changed or moved, and save the merged sheet."""
+        records = []
+        question_numbers = 1
+        for path in sorted(self.state['documents']):
+            formatted = self.formatted.get(path)
+            if formatted is None or formatted[0] != question_numbers:
+                try:
+                    bank = self.bank(path, self.state['documents'][path]['key'])
+                except Exception as error:
+                    summary['errors'][path] = str(error) or type(error).__name__
+                    continue
+                document_records, warnings = [], []
+                next_number = format_questions(bank['questions'], document_records, self.profile, question_numbers, warnings)
+                summary['warnings'] += len(warnings)
+                formatted = self.formatted[path] = (question_numbers, document_records, next_number)
+            records.extend(formatted[1])
+            question_numbers = formatted[2]
+
+        if records:
+            self.state['merged_outputs'] = self.save(records, MERGED_NAME, self.state['merged_outputs'])
+            summary['outputs'].extend(self.state['merged_outputs'].values())
+        else:
+            self.remove_outputs(self.state['merged_outputs'])
+            self.state['merged_outputs'] = None
+
+    def watch(self, interval: float = 2.0, callback=None, stop=None) -> None:
+        """
+        Update every `interval` seconds until `stop` (a threading.Event) is set or the process is interrupted.
+
+        callback is called with the summary of each update that changed something.
+        """
+        try:
+            while stop is None or not stop.is_set():
+                summary = self.update()
+                if callback is not None and (summary['changed'] or summary['removed'] or summary['outputs']):
+                    callback(summary)
+                if stop is not None:
+                    stop.wait(interval)
+                else:
+                    time.sleep(interval)
+        finally:
+            self.converter.close()